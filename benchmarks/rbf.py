@@ -0,0 +1,69 @@
+"""Benchmark of the construction and the evaluation of the radial basis
+layers.
+
+Usage:
+    python benchmarks/rbf.py --n-edges 100000 --max-z 36 --n-per-orb 1
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import torch
+from torch.utils import benchmark
+
+from lcaonet.atomistic.info import ElecInfo
+from lcaonet.nn.cutoff import EnvelopeCutoff
+from lcaonet.nn.rbf import (
+    BaseRadialBasis,
+    HydrogenRadialBasis,
+    SlaterRadialBasis,
+    SphericalBesselRadialBasis,
+)
+
+
+def _forward_backward(rbf: BaseRadialBasis, r: torch.Tensor):
+    rb = rbf(r)
+    torch.autograd.grad(rb.sum(), r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-edges", type=int, default=100000)
+    parser.add_argument("--max-z", type=int, default=36)
+    parser.add_argument("--n-per-orb", type=int, default=1)
+    parser.add_argument("--cutoff", type=float, default=6.0)
+    parser.add_argument("--max-error", type=float, default=1e-6)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    elec_info = ElecInfo(args.max_z, None, None, args.n_per_orb)
+    r = (torch.rand(args.n_edges, device=args.device) * args.cutoff).requires_grad_(True)
+
+    results = []
+    for cls in [HydrogenRadialBasis, SlaterRadialBasis, SphericalBesselRadialBasis]:
+        start = time.perf_counter()
+        rbf = cls(args.cutoff, elec_info, EnvelopeCutoff(args.cutoff))
+        init_time = time.perf_counter() - start
+        start = time.perf_counter()
+        tab = rbf.tabulate(args.max_error)
+        tab_time = time.perf_counter() - start
+
+        for name, m, t in [(cls.__name__, rbf, init_time), (f"{cls.__name__}.tabulate", tab, init_time + tab_time)]:
+            m = m.to(args.device)
+            print(f"{name}: construction {t * 1e3:.1f} ms")
+            for label, stmt in [("forward", "m(r)"), ("forward+backward", "_forward_backward(m, r)")]:
+                timer = benchmark.Timer(
+                    stmt=stmt,
+                    globals={"m": m, "r": r, "_forward_backward": _forward_backward},
+                    label="radial basis",
+                    sub_label=name,
+                    description=label,
+                )
+                results.append(timer.blocked_autorange(min_run_time=1.0))
+
+    benchmark.Compare(results).print()
+
+
+if __name__ == "__main__":
+    main()
@@ -45,7 +45,7 @@ EXPONENT_TABLE = torch.tensor(
         [32.2783, 12.0635, 14.5368, 6.1985, 5.9499, 2.236, 5.7928, 1.8623, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
         [33.2622, 12.4442, 15.0326, 6.4678, 6.235, 2.4394, 6.159, 2.0718, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
         [34.2471, 12.8217, 15.5282, 6.7395, 6.5236, 2.6382, 6.5197, 2.257, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
-        [35.2316, 13.199, 16.0235, 7.0109, 6.8114, 2.8289, 6.8753, 2.4e423, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+        [35.2316, 13.199, 16.0235, 7.0109, 6.8114, 2.8289, 6.8753, 2.4423, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
         [36.2078, 13.5784, 16.5194, 7.2809, 7.1011, 3.097, 7.2264, 2.7202, 0.9969, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
         [37.1911, 13.9509, 17.0152, 7.5546, 7.3892, 3.3611, 7.5754, 2.983, 1.2141, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
         [38.1756, 14.3111, 17.5016, 7.8505, 7.6975, 3.5659, 8.4657, 3.1864, 1.2512, 3.9896, 0.0, 0.0, 0.0, 0.0, 0.0],
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import torch
 from torch import Tensor
 
 from .elec import ELEC_TABLE, MAX_ELEC_IDX, NL_LIST, VALENCE_TABLE
@@ -125,3 +126,17 @@ class ElecInfo:
     @property
     def nl_list(self) -> Tensor:
         return self._nl_list[: self._max_orb_idx + 1].repeat_interleave(self.n_per_orb, dim=0)
+
+    @property
+    def n_orb_unique(self) -> int:
+        return self._max_orb_idx + 1
+
+    @property
+    def nl_list_unique(self) -> Tensor:
+        # without the copies of n_per_orb
+        return self._nl_list[: self._max_orb_idx + 1]
+
+    @property
+    def expand_idx(self) -> Tensor:
+        # nl_list_unique[expand_idx] equals nl_list
+        return torch.arange(self.n_orb_unique).repeat_interleave(self.n_per_orb)
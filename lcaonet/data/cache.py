@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+
+import numpy as np
+import torch
+
+# indices of the shared counters
+_FREE_HEAD, _N_FREE, _CLOCK, _HITS, _MISSES, _N_BYTES = range(6)
+# the number of slots sampled to choose the item to evict
+_N_SAMPLES = 16
+
+
+class SharedLRUCache:
+    """Size-bounded LRU cache of serialized graphs in shared memory.
+
+    All buffers are allocated in shared memory when the cache is made, so the cache is shared by the
+    DataLoader worker processes, and the memory usage does not grow with the number of workers.
+    The buffer is divided into slots of `slot_size` bytes, and each item is stored in a chain of slots,
+    so that the buffer is never fragmented. When the buffer is full, the least recently used of the items
+    stored in `_N_SAMPLES` randomly chosen slots is evicted, as in the approximated LRU of Redis, so
+    that the eviction does not scan all items while the lock shared by the workers is held.
+    """
+
+    def __init__(self, n_items: int, max_bytes: int, slot_size: int = 4096):
+        """
+        Args:
+            n_items (int): the number of items which can be cached, i.e. the size of the dataset.
+            max_bytes (int): the size of the buffer in bytes.
+            slot_size (int, optional): the size of a slot in bytes. Defaults to `4096`.
+        """
+        if max_bytes < slot_size:
+            raise ValueError(f"max_bytes={max_bytes} must be larger than slot_size={slot_size}.")
+        self.n_items = n_items
+        self.slot_size = slot_size
+        self.n_slots = max_bytes // slot_size
+
+        self._buffer = torch.zeros((self.n_slots, slot_size), dtype=torch.uint8).share_memory_()
+        # first slot, size and last access time of each item, and the next slot and the item of each slot
+        self._head = torch.full((n_items,), -1, dtype=torch.long).share_memory_()
+        self._nbytes = torch.zeros(n_items, dtype=torch.long).share_memory_()
+        self._last_used = torch.zeros(n_items, dtype=torch.long).share_memory_()
+        self._next = torch.arange(1, self.n_slots + 1, dtype=torch.long).share_memory_()
+        self._owner = torch.full((self.n_slots,), -1, dtype=torch.long).share_memory_()
+        self._next[-1] = -1
+        self._counters = torch.tensor([0, self.n_slots, 0, 0, 0, 0], dtype=torch.long).share_memory_()
+        self._lock = mp.get_context().Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        return self.n_slots * self.slot_size
+
+    @property
+    def hits(self) -> int:
+        return int(self._counters[_HITS])
+
+    @property
+    def misses(self) -> int:
+        return int(self._counters[_MISSES])
+
+    @property
+    def n_bytes(self) -> int:
+        """The total size of the cached items."""
+        return int(self._counters[_N_BYTES])
+
+    def __len__(self) -> int:
+        return int((self._head >= 0).sum())
+
+    def __contains__(self, idx: int) -> bool:
+        return bool(self._head[idx] >= 0)
+
+    def stats(self) -> dict[str, int | float]:
+        """The statistics of the cache to choose its size.
+
+        Returns:
+            dict[str, int | float]: the number of hits, misses, cached items, the cached bytes,
+                the size of the buffer and the hit rate.
+        """
+        hits, misses = self.hits, self.misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses > 0 else 0.0,
+            "n_items": len(self),
+            "n_bytes": self.n_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def get(self, idx: int) -> bytes | None:
+        """Get the cached item.
+
+        Args:
+            idx (int): the index of the item.
+
+        Returns:
+            bytes | None: the cached item, or `None` if it is not cached.
+        """
+        head, counters = self._head.numpy(), self._counters.numpy()
+        with self._lock:
+            if head[idx] < 0:
+                counters[_MISSES] += 1
+                return None
+            counters[_HITS] += 1
+            counters[_CLOCK] += 1
+            self._last_used.numpy()[idx] = counters[_CLOCK]
+            slots = self._chain(int(head[idx]))
+            return self._buffer.numpy()[slots].reshape(-1)[: int(self._nbytes[idx])].tobytes()
+
+    def put(self, idx: int, value: bytes) -> bool:
+        """Cache the item, evicting the approximately least recently used
+        items if the buffer is full.
+
+        Args:
+            idx (int): the index of the item.
+            value (bytes): the item.
+
+        Returns:
+            bool: whether the item is cached. Items larger than the buffer are not cached.
+        """
+        n_need = max(-(-len(value) // self.slot_size), 1)
+        if n_need > self.n_slots:
+            return False
+        head, counters = self._head.numpy(), self._counters.numpy()
+        with self._lock:
+            if head[idx] >= 0:
+                # cached by another process
+                return True
+            while counters[_N_FREE] < n_need:
+                self._evict()
+
+            # take the slots from the head of the free list
+            nxt = self._next.numpy()
+            slots = self._chain(int(counters[_FREE_HEAD]), n_need)
+            counters[_FREE_HEAD] = nxt[slots[-1]]
+            counters[_N_FREE] -= n_need
+            nxt[slots[-1]] = -1
+
+            buffer = self._buffer.numpy()
+            data = np.frombuffer(value, dtype=np.uint8)
+            for i, s in enumerate(slots):
+                chunk = data[i * self.slot_size : (i + 1) * self.slot_size]
+                buffer[s, : len(chunk)] = chunk
+            head[idx] = slots[0]
+            self._owner.numpy()[slots] = idx
+            self._nbytes.numpy()[idx] = len(value)
+            counters[_CLOCK] += 1
+            self._last_used.numpy()[idx] = counters[_CLOCK]
+            counters[_N_BYTES] += len(value)
+        return True
+
+    def clear(self):
+        """Remove all items and reset the counters."""
+        with self._lock:
+            self._head.fill_(-1)
+            self._nbytes.zero_()
+            self._last_used.zero_()
+            self._next.copy_(torch.arange(1, self.n_slots + 1))
+            self._next[-1] = -1
+            self._owner.fill_(-1)
+            self._counters.copy_(torch.tensor([0, self.n_slots, 0, 0, 0, 0]))
+
+    def _chain(self, first: int, n: int | None = None) -> list[int]:
+        nxt = self._next.numpy()
+        slots = [first]
+        while (n is None or len(slots) < n) and nxt[slots[-1]] >= 0:
+            slots.append(int(nxt[slots[-1]]))
+        return slots
+
+    def _evict(self):
+        # called with the lock held
+        head, counters, owner = self._head.numpy(), self._counters.numpy(), self._owner.numpy()
+        if self.n_slots <= _N_SAMPLES:
+            cached = owner[owner >= 0]
+        else:
+            cached = owner[np.random.randint(self.n_slots, size=_N_SAMPLES)]
+            cached = cached[cached >= 0]
+            if cached.shape[0] == 0:
+                # rare case that a large item is put into the mostly free buffer
+                cached = owner[owner >= 0]
+        idx = cached[self._last_used.numpy()[cached].argmin()]
+        slots = self._chain(int(head[idx]))
+        owner[slots] = -1
+        # return the slots to the head of the free list
+        self._next.numpy()[slots[-1]] = counters[_FREE_HEAD] if counters[_N_FREE] > 0 else -1
+        counters[_FREE_HEAD] = slots[0]
+        counters[_N_FREE] += len(slots)
+        nbytes = self._nbytes.numpy()
+        counters[_N_BYTES] -= nbytes[idx]
+        head[idx] = -1
+        nbytes[idx] = 0
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
 import abc
+import hashlib
+import itertools
+import json
 import logging
+import multiprocessing as mp
+import os
 import pathlib
 import pickle
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from typing import BinaryIO, TypeVar
 
 import ase
+import ase.db
+import ase.io
 import numpy as np
 import torch
 from ase.data import atomic_masses
@@ -13,11 +24,109 @@ from ase.neighborlist import neighbor_list
 from torch_geometric.data import Data
 
 from .keys import KEYS, GraphKeys
-from .utils import full_linked_graph, set_properties
+from .manifest import MANIFEST_FILE, ManifestWriter, read_manifest_rows
+from .targets import TargetWriter
+from .utils import (
+    GraphData,
+    atoms_hash,
+    count_triplets,
+    data_keys,
+    encode_graphdata,
+    full_linked_graph,
+    get_triplets,
+    nearest_neighbors,
+    set_properties,
+    spatial_order,
+    structure_fingerprint,
+)
+
+T = TypeVar("T")
+
+PARAMS_FILE = "convert_params.json"
+
+
+class ConvertReport:
+    """Progress and throughput counters of one conversion run."""
+
+    def __init__(self):
+        self.n_structures = 0
+        self.n_edges = 0
+        self.n_fully_linked = 0
+        # structures which are already in the dataset
+        self.n_skipped = 0
+        # structures which are duplicates of others by the fingerprint
+        self.n_duplicates = 0
+        self._start = time.perf_counter()
+
+    def update(self, n_edges: int, fully_linked: bool):
+        self.n_structures += 1
+        self.n_edges += n_edges
+        self.n_fully_linked += int(fully_linked)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    @property
+    def structures_per_sec(self) -> float:
+        return self.n_structures / max(self.elapsed, 1e-12)
+
+    @property
+    def edges_per_sec(self) -> float:
+        return self.n_edges / max(self.elapsed, 1e-12)
+
+    def __repr__(self) -> str:
+        return "{}(n_structures={}, n_edges={}, n_fully_linked={}, n_skipped={}, n_duplicates={}, elapsed={:.1f}s, structures/s={:.1f}, edges/s={:.1f})".format(  # noqa: E501
+            self.__class__.__name__,
+            self.n_structures,
+            self.n_edges,
+            self.n_fully_linked,
+            self.n_skipped,
+            self.n_duplicates,
+            self.elapsed,
+            self.structures_per_sec,
+            self.edges_per_sec,
+        )
 
 
 class BaseDataConverter(abc.ABC):
-    def __init__(self, cutoff: float, save_dir: str | pathlib.Path):
+    # number of converted structures between two progress logs
+    log_interval: int = 10000
+
+    def __init__(
+        self,
+        cutoff: float,
+        save_dir: str | pathlib.Path,
+        subtract_center_of_mass: bool = False,
+        max_neighbors: int = 32,
+        remove_batch_key: list[str] | None = None,
+        precompute_triplets: bool = False,
+        compact: bool = False,
+        half_edges: bool = False,
+        deduplicate: bool = False,
+        fingerprint_tol: float = 1e-3,
+        target_store: bool = False,
+        reorder_atoms: bool = False,
+        n_workers: int = 1,
+        chunksize: int = 16,
+    ):
+        """
+        Args:
+            cutoff (float): the cutoff radius.
+            save_dir (str | pathlib.Path): the directory where the graph files are saved.
+            subtract_center_of_mass (bool, optional): whether to subtract the center of mass. Defaults to `False`.
+            max_neighbors (int, optional): the maximum number of neighbors of each atom. Defaults to `32`.
+            remove_batch_key (list[str] | None, optional): the keys of `atoms.info` stored without batch dimension. Defaults to `None`.
+            precompute_triplets (bool, optional): whether to store the triplet indices in the graphs. Defaults to `False`.
+            compact (bool, optional): whether to store the shifts as int8 and the indices as int32. The graphs are decoded when loaded by `GraphDataset`. Defaults to `False`.
+            half_edges (bool, optional): whether to store only one direction of each edge in the compact encoding. Graphs whose edges are not symmetric are stored with both directions. Defaults to `False`.
+            deduplicate (bool, optional): whether to skip the structures whose fingerprint is the same as that of a structure in the dataset. Defaults to `False`.
+            fingerprint_tol (float, optional): the tolerance of the fractional positions and the cell in the fingerprint. Defaults to `1e-3`.
+            target_store (bool, optional): whether to write the tensor properties of `atoms.info` to the columnar target store instead of the graph files. `GraphDataset` joins them with the graphs. Defaults to `False`.
+            reorder_atoms (bool, optional): whether to reorder the atoms along a space-filling curve for the memory locality of the message passing. The original index of each atom is stored as `atom_idx`, and the properties in `remove_batch_key` whose length is the number of atoms, e.g. forces, are reordered together. Defaults to `False`.
+            n_workers (int, optional): the number of worker processes. If `1`, the conversion runs in the main process. Defaults to `1`.
+            chunksize (int, optional): the number of structures sent to a worker at once. Defaults to `16`.
+        """  # noqa: E501
         self.cutoff = cutoff
         if isinstance(save_dir, str):
             self.save_dir = pathlib.Path(save_dir)
@@ -26,77 +135,470 @@ class BaseDataConverter(abc.ABC):
         if not self.save_dir.exists():
             self.save_dir.mkdir(exist_ok=False)
 
+        self.subtract_center_of_mass = subtract_center_of_mass
+        self.max_neighbors = max_neighbors
+        self.remove_batch_key = remove_batch_key
+        self.precompute_triplets = precompute_triplets
+        if half_edges and not compact:
+            raise ValueError("half_edges requires compact=True.")
+        if half_edges and precompute_triplets:
+            raise ValueError("half_edges cannot be used with precompute_triplets=True.")
+        self.compact = compact
+        self.half_edges = half_edges
+        self.deduplicate = deduplicate
+        self.fingerprint_tol = fingerprint_tol
+        self.target_store = target_store
+        self.reorder_atoms = reorder_atoms
+        if n_workers < 1:
+            raise ValueError(f"n_workers={n_workers} must be positive.")
+        self.n_workers = n_workers
+        self.chunksize = chunksize
+
     @abc.abstractmethod
-    def convert(self, atoms_info):
+    def convert(self, atoms_info) -> ConvertReport:
         raise NotImplementedError
 
+    @property
+    def params(self) -> dict:
+        """The parameters which change the converted graphs."""
+        return {
+            "cutoff": self.cutoff,
+            "max_neighbors": self.max_neighbors,
+            "subtract_center_of_mass": self.subtract_center_of_mass,
+            "remove_batch_key": sorted(self.remove_batch_key) if self.remove_batch_key is not None else None,
+            "precompute_triplets": self.precompute_triplets,
+            "compact": self.compact,
+            "half_edges": self.half_edges,
+            # fingerprints of different tolerances cannot be compared
+            "fingerprint_tol": self.fingerprint_tol,
+            "target_store": self.target_store,
+            "reorder_atoms": self.reorder_atoms,
+        }
+
+    @property
+    def params_hash(self) -> str:
+        """The hash of `params`, which identifies the converted graphs."""
+        return hashlib.blake2b(json.dumps(self.params, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    def _check_params(self):
+        """Record the conversion parameters in `save_dir`, or check that they
+        are the same as those of the existing dataset."""
+        params_hash = self.params_hash
+        path = self.save_dir / PARAMS_FILE
+        if path.exists():
+            with open(path) as f:
+                saved = json.load(f)
+            if saved["hash"] != params_hash:
+                raise ValueError(
+                    f"{self.save_dir} was converted with {saved['params']}, which differ from {self.params}. Please use another save_dir."  # noqa: E501
+                )
+            return
+        if not (self.save_dir / MANIFEST_FILE).exists() and any(self.save_dir.glob("*.pt")):
+            raise ValueError(f"{self.save_dir} contains graph files without manifest. Please use another save_dir.")
+        with open(path, "w") as f:
+            json.dump({"params": self.params, "hash": params_hash}, f, indent=2)
+
+    @staticmethod
+    def _load_atoms(source: ase.Atoms | pathlib.Path) -> ase.Atoms:
+        if isinstance(source, pathlib.Path):
+            with open(source, "rb") as f:
+                source = pickle.load(f)
+        assert isinstance(source, ase.Atoms)
+        return source
+
+    def _new_tasks(
+        self,
+        sources: Iterable[ase.Atoms | pathlib.Path],
+        report: ConvertReport,
+    ) -> Iterator[tuple[int, ase.Atoms, str, str]]:
+        """Hash the structures and give an index to those which are not in the
+        dataset yet.
+
+        New structures first fill the indices left missing by an interrupted conversion,
+        and then are appended after the last index. If `deduplicate=True`, the structures
+        whose fingerprint is already in the dataset are also skipped. Identical structures
+        within the input are all converted unless `deduplicate=True`.
+        """
+        known: set[str] = set()
+        fingerprints: set[str] = set()
+        indices: list[int] = []
+        if (self.save_dir / MANIFEST_FILE).exists():
+            for row in read_manifest_rows(self.save_dir):
+                known.add(row["hash"])
+                if row.get("fingerprint"):
+                    fingerprints.add(row["fingerprint"])
+                indices.append(int(row["index"]))
+        next_idx = _free_indices(indices)
+
+        for source in sources:
+            at = self._load_atoms(source)
+            h = atoms_hash(at)
+            if h in known:
+                report.n_skipped += 1
+                continue
+            fp = structure_fingerprint(at, self.fingerprint_tol)
+            if self.deduplicate and fp in fingerprints:
+                report.n_duplicates += 1
+                continue
+            fingerprints.add(fp)
+            yield next(next_idx), at, h, fp
+
+    def atoms2graph(self, atoms: ase.Atoms) -> tuple[Data, bool, int]:
+        """Convert one structure with the parameters of the converter, and set
+        `atoms.info` as the properties of the graph.
+
+        Args:
+            atoms (ase.Atoms): the atoms object.
+
+        Returns:
+            data (torch_geometric.data.Data): the graph data, which is not encoded even if `compact=True`.
+            fully_linked (bool): whether the fully linked graph is made because no neighbor is found.
+            n_truncated (int): the number of atoms whose neighbors are truncated by `max_neighbors`.
+        """
+        order = None
+        if self.reorder_atoms:
+            # the edges and triplets made from the reordered atoms are ordered by the new indices
+            order = spatial_order(atoms)
+            atoms = atoms[order]
+        data, fully_linked, n_truncated = _atoms2graphdata(
+            atoms, self.subtract_center_of_mass, self.cutoff, self.max_neighbors, self.precompute_triplets
+        )
+        for k, v in atoms.info.items():
+            add_batch = True
+            if self.remove_batch_key is not None and k in self.remove_batch_key:
+                add_batch = False
+                # per-atom properties are stored without batch dimension
+                per_atom = isinstance(v, (np.ndarray, torch.Tensor)) and v.ndim > 0 and v.shape[0] == len(atoms)
+                if order is not None and per_atom:
+                    v = v[order]
+            set_properties(data, k, v, add_batch)
+        if order is not None:
+            data[GraphKeys.Atom_idx] = torch.from_numpy(order)
+        return data, fully_linked, n_truncated
+
+    def _convert_one(
+        self, task: tuple[int, ase.Atoms, str, str]
+    ) -> tuple[dict[str, str | int], bool, dict[str, np.ndarray]]:
+        """Convert one structure and save it as `{idx}.pt`.
+
+        Args:
+            task (tuple[int, ase.Atoms, str, str]): the index, the atoms object, and the hash and fingerprint of it.
+
+        Returns:
+            row (dict[str, str | int]): the manifest row of the structure.
+            fully_linked (bool): whether the fully linked graph is made because no neighbor is found.
+            targets (dict[str, numpy.ndarray]): the properties written to the target store if `target_store=True`.
+        """
+        idx, at, h, fp = task
+        data, fully_linked, n_truncated = self.atoms2graph(at)
+        targets: dict[str, np.ndarray] = {}
+        if self.target_store:
+            for k in at.info:
+                if isinstance(data[k], torch.Tensor):
+                    targets[k] = data[k].numpy()
+                    del data[k]
+        edge_index = data[GraphKeys.Edge_idx].numpy()
+        row: dict[str, str | int] = {
+            "index": idx,
+            "file": f"{idx}.pt",
+            "n_atoms": len(at),
+            "n_edges": edge_index.shape[1],
+            "n_triplets": (
+                data[GraphKeys.Idx_k_3b].size(0) if self.precompute_triplets else count_triplets(edge_index, len(at))
+            ),
+            "species": " ".join(str(z) for z in np.unique(at.numbers)),
+            "formula": at.get_chemical_formula(),
+            "hash": h,
+            "fingerprint": fp,
+            "n_truncated": n_truncated,
+        }
+        if self.compact:
+            data = encode_graphdata(data, self.half_edges)
+
+        # write to a temporary file first so that an interrupted run never leaves a broken graph file
+        path = self.save_dir / f"{idx}.pt"
+        tmp_path = self.save_dir / f"{idx}.pt.tmp"
+        torch.save(data, tmp_path)
+        os.replace(tmp_path, path)
+        return row, fully_linked, targets
+
+    def _convert_all(self, sources: Iterable[ase.Atoms | pathlib.Path]) -> ConvertReport:
+        """Convert all structures, in a process pool if `n_workers > 1`, and
+        write the manifest.
+
+        Structures whose content is already in the dataset are skipped, so that a conversion can be
+        resumed after an interruption, and new structures can be appended to an existing dataset.
+        The index of each output file follows the order of `sources`, so the output does not depend
+        on the number of workers. `sources` is consumed lazily, and the graphs and manifest rows are
+        written as soon as they are converted, so the memory usage does not depend on the number of
+        structures.
+        """
+        self._check_params()
+        report = ConvertReport()
+        # structures are loaded and hashed in the main process to give consecutive indices
+        tasks = self._new_tasks(sources, report)
+        with ManifestWriter(self.save_dir) as writer, TargetWriter(self.save_dir) as target_writer:
+            if self.n_workers == 1:
+                for row, targets in self._collect(map(self._convert_one, tasks), report):
+                    # the manifest row is written last, as the record of the complete conversion
+                    target_writer.write(int(row["index"]), targets)
+                    writer.write(row)
+            else:
+                # Pool.imap consumes its input as fast as possible, so the number of
+                # structures waiting for conversion is bounded by a semaphore
+                pending = threading.BoundedSemaphore(4 * self.n_workers * self.chunksize)
+                # the feeder is stopped if the loop exits, since `Pool.terminate` waits for it
+                stop = threading.Event()
+                with mp.get_context().Pool(self.n_workers) as pool:
+                    feeder = _bounded(tasks, pending, stop)
+                    results = pool.imap_unordered(self._convert_one, feeder, chunksize=self.chunksize)
+                    try:
+                        for row, targets in self._collect(results, report, pending):
+                            target_writer.write(int(row["index"]), targets)
+                            writer.write(row)
+                    finally:
+                        stop.set()
+        logging.info(f"conversion finished: {report}")
+        return report
+
+    def _collect(
+        self,
+        results: Iterable[tuple[dict[str, str | int], bool, dict[str, np.ndarray]]],
+        report: ConvertReport,
+        pending: threading.BoundedSemaphore | None = None,
+    ) -> Iterator[tuple[dict[str, str | int], dict[str, np.ndarray]]]:
+        for row, fully_linked, targets in results:
+            if pending is not None:
+                pending.release()
+            report.update(int(row["n_edges"]), fully_linked)
+            if report.n_structures % self.log_interval == 0:
+                logging.info(f"conversion progress: {report}")
+            yield row, targets
+
+
+def _free_indices(indices: list[int]) -> Iterator[int]:
+    # missing indices first, then the indices after the last one
+    n = max(indices) + 1 if len(indices) > 0 else 0
+    yield from np.setdiff1d(np.arange(n), indices).tolist()
+    yield from itertools.count(n)
+
+
+def _bounded(tasks: Iterable[T], pending: threading.BoundedSemaphore, stop: threading.Event) -> Iterator[T]:
+    for task in tasks:
+        while not pending.acquire(timeout=0.1):
+            if stop.is_set():
+                return
+        yield task
+
 
 class ListDataConverter(BaseDataConverter):
-    def __init__(
-        self,
-        cutoff: float,
-        save_dir: str | pathlib.Path,
-        subtract_center_of_mass: bool = False,
-        max_neighbors: int = 32,
-        remove_batch_key: list[str] | None = None,
-    ):
-        super().__init__(cutoff, save_dir)
+    def convert(self, atoms_list: Iterable[ase.Atoms]) -> ConvertReport:
+        """Convert the structures.
 
-        self.subtract_center_of_mass = subtract_center_of_mass
-        self.max_neighbors = max_neighbors
-        self.remove_batch_key = remove_batch_key
+        Args:
+            atoms_list (Iterable[ase.Atoms]): the list or any iterator of the atoms objects.
 
-    def convert(self, atoms_list: list[ase.Atoms]):
-        for i, at in enumerate(atoms_list):
-            assert isinstance(at, ase.Atoms)
-            data = atoms2graphdata(
-                at,
-                self.subtract_center_of_mass,
-                self.cutoff,
-                self.max_neighbors,
-            )
-            for k, v in at.info.items():
-                add_batch = True
-                if self.remove_batch_key is not None and k in self.remove_batch_key:
-                    add_batch = False
-                set_properties(data, k, v, add_batch)
-            torch.save(data, f"{self.save_dir}/{i}.pt")
+        Returns:
+            lcaonet.data.convert.ConvertReport: the report of the conversion.
+        """
+        return self._convert_all(atoms_list)
 
 
 class FilesDataConverter(BaseDataConverter):
-    def __init__(
+    def convert(self, atoms_directory: str | pathlib.Path) -> ConvertReport:
+        if isinstance(atoms_directory, str):
+            atoms_directory = pathlib.Path(atoms_directory)
+        # sort the file names so that the output index does not depend on the file system
+        return self._convert_all(sorted(atoms_directory.iterdir()))
+
+
+class AseFileDataConverter(BaseDataConverter):
+    def convert(
         self,
-        cutoff: float,
-        save_dir: str | pathlib.Path,
-        subtract_center_of_mass: bool = False,
-        max_neighbors: int = 32,
-        remove_batch_key: list[str] | None = None,
-    ):
-        super().__init__(cutoff, save_dir)
+        filename: str | pathlib.Path,
+        index: str = ":",
+        format: str | None = None,
+        **kwargs,
+    ) -> ConvertReport:
+        """Convert the structures of a file readable by `ase.io.iread` such as
+        extxyz or ASE trajectory.
+
+        Args:
+            filename (str | pathlib.Path): the file name.
+            index (str, optional): the index of the structures to read. Defaults to `":"`.
+            format (str | None, optional): the file format. Defaults to `None` (guessed from the file).
+            **kwargs: other arguments passed to `ase.io.iread`.
+
+        Returns:
+            lcaonet.data.convert.ConvertReport: the report of the conversion.
+        """
+        return self._convert_all(iread_atoms(filename, index, format, **kwargs))
+
+
+class AseDBDataConverter(BaseDataConverter):
+    def convert(self, db_path: str | pathlib.Path, selection=None, **kwargs) -> ConvertReport:
+        """Convert the rows of an ASE database.
+
+        Args:
+            db_path (str | pathlib.Path): the path of the database.
+            selection (optional): the selection passed to `ase.db.core.Database.select`. Defaults to `None`.
+            **kwargs: other arguments passed to `ase.db.core.Database.select`.
+
+        Returns:
+            lcaonet.data.convert.ConvertReport: the report of the conversion.
+        """
+        return self._convert_all(db_atoms(db_path, selection, **kwargs))
+
+
+def _calc_results_to_info(atoms: ase.Atoms) -> ase.Atoms:
+    # properties such as energy and forces are stored in the calculator by ase.io and ase.db
+    if atoms.calc is not None:
+        for k, v in atoms.calc.results.items():
+            atoms.info.setdefault(k, v)
+        atoms.calc = None
+    return atoms
 
-        self.subtract_center_of_mass = subtract_center_of_mass
-        self.max_neighbors = max_neighbors
-        self.remove_batch_key = remove_batch_key
 
-    def convert(self, atoms_directory: str | pathlib.Path):
-        if isinstance(atoms_directory, str):
-            atoms_directory = pathlib.Path(atoms_directory)
-        for i, at_file in enumerate(atoms_directory.iterdir()):
-            with open(at_file, "rb") as f:
-                at = pickle.load(f)
-            assert isinstance(at, ase.Atoms)
-            data = atoms2graphdata(
-                at,
-                self.subtract_center_of_mass,
-                self.cutoff,
-                self.max_neighbors,
-            )
-            for k, v in at.info.items():
-                add_batch = True
-                if self.remove_batch_key is not None and k in self.remove_batch_key:
-                    add_batch = False
-                set_properties(data, k, v, add_batch)
-            torch.save(data, f"{self.save_dir}/{i}.pt")
+def iread_atoms(
+    filename: str | pathlib.Path,
+    index: str = ":",
+    format: str | None = None,
+    **kwargs,
+) -> Iterator[ase.Atoms]:
+    """Read the structures one by one with `ase.io.iread`. The properties
+    stored in the calculator (e.g. energy and forces) are moved to
+    `atoms.info`.
+
+    Args:
+        filename (str | pathlib.Path): the file name.
+        index (str, optional): the index of the structures to read. Defaults to `":"`.
+        format (str | None, optional): the file format. Defaults to `None` (guessed from the file).
+        **kwargs: other arguments passed to `ase.io.iread`.
+
+    Yields:
+        ase.Atoms: the atoms object.
+    """
+    for atoms in ase.io.iread(filename, index=index, format=format, **kwargs):
+        yield _calc_results_to_info(atoms)
+
+
+def db_atoms(db_path: str | pathlib.Path, selection=None, **kwargs) -> Iterator[ase.Atoms]:
+    """Read the rows of an ASE database one by one. The key-value pairs and
+    the properties stored in the calculator (e.g. energy and forces) are moved
+    to `atoms.info`.
+
+    Args:
+        db_path (str | pathlib.Path): the path of the database.
+        selection (optional): the selection passed to `ase.db.core.Database.select`. Defaults to `None`.
+        **kwargs: other arguments passed to `ase.db.core.Database.select`.
+
+    Yields:
+        ase.Atoms: the atoms object.
+    """
+    # connect inside the generator, so that the connection is used only by the thread iterating it
+    db = ase.db.connect(db_path)
+    for row in db.select(selection, **kwargs):
+        yield _row_to_atoms(row)
+
+
+def _row_to_atoms(row: ase.db.row.AtomsRow) -> ase.Atoms:
+    atoms = row.toatoms(add_additional_information=False)
+    atoms.info.update(row.key_value_pairs)
+    return _calc_results_to_info(atoms)
+
+
+class PackedDataWriter:
+    """Writer of the packed graph format read by
+    `lcaonet.data.dataset.PackedGraphDataset`.
+
+    Each tensor attribute of the graphs is concatenated along the first dimension into one raw
+    `{key}.bin` file, with an offsets array `{key}_ptr.npy` of (n_graphs + 1) shape. `edge_index`
+    is stored transposed as (E, 2) so that it can be concatenated too. String attributes are
+    stored in `strings.json`, and the dtype and shape of each array in `meta.json`.
+    """
+
+    meta_file = "meta.json"
+    strings_file = "strings.json"
+
+    def __init__(self, save_dir: str | pathlib.Path):
+        """
+        Args:
+            save_dir (str | pathlib.Path): the directory where the packed arrays are saved.
+        """
+        if isinstance(save_dir, str):
+            self.save_dir = pathlib.Path(save_dir)
+        else:
+            self.save_dir = save_dir
+        if not self.save_dir.exists():
+            self.save_dir.mkdir(exist_ok=False)
+
+        self.n_graphs = 0
+        self._files: dict[str, BinaryIO] = {}
+        self._meta: dict[str, dict] = {}
+        self._ptr: dict[str, list[int]] = {}
+        self._strings: dict[str, list[str]] = {}
+
+    def __enter__(self) -> PackedDataWriter:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data: Data):
+        """Append one graph.
+
+        Args:
+            data (torch_geometric.data.Data): the graph data. All graphs must have the same attributes.
+        """
+        keys = sorted(data_keys(data))
+        if self.n_graphs == 0:
+            self._init_keys(data, keys)
+        elif keys != sorted(list(self._meta) + list(self._strings)):
+            raise ValueError(f"attributes {keys} of graph {self.n_graphs} differ from those of the first graph.")
+
+        for k in keys:
+            v = data[k]
+            if k in self._strings:
+                self._strings[k].append(v)
+                continue
+            arr = v.detach().cpu().numpy()
+            if k == GraphKeys.Edge_idx:
+                arr = arr.T
+            if arr.ndim == 0:
+                arr = arr.reshape(1)
+            if arr.dtype.str != self._meta[k]["dtype"] or list(arr.shape[1:]) != self._meta[k]["shape"]:
+                raise ValueError(
+                    f"dtype or shape of {k} of graph {self.n_graphs} differ from those of the first graph."
+                )
+            self._files[k].write(np.ascontiguousarray(arr).tobytes())
+            self._ptr[k].append(self._ptr[k][-1] + arr.shape[0])
+        self.n_graphs += 1
+
+    def _init_keys(self, data: Data, keys: list[str]):
+        for k in keys:
+            v = data[k]
+            if isinstance(v, str):
+                self._strings[k] = []
+            elif isinstance(v, torch.Tensor):
+                arr = v.detach().cpu().numpy()
+                if k == GraphKeys.Edge_idx:
+                    arr = arr.T
+                self._meta[k] = {"dtype": arr.dtype.str, "shape": list(arr.shape[1:]), "ndim": v.dim()}
+                self._files[k] = open(self.save_dir / f"{k}.bin", "wb")
+                self._ptr[k] = [0]
+            else:
+                raise ValueError(f"Unsupported type {type(v)} of {k}")
+
+    def close(self):
+        for k, f in self._files.items():
+            f.close()
+            np.save(self.save_dir / f"{k}_ptr.npy", np.array(self._ptr[k], dtype=np.int64))
+        self._files = {}
+        with open(self.save_dir / self.strings_file, "w") as f:
+            json.dump(self._strings, f)
+        # meta file is written last, so that its existence means that the packed data is complete
+        with open(self.save_dir / self.meta_file, "w") as f:
+            json.dump({"n_graphs": self.n_graphs, "arrays": self._meta}, f, indent=2)
 
 
 # Main transformer to create edge information and rotation matrix
@@ -105,17 +607,41 @@ def atoms2graphdata(
     subtract_center_of_mass: bool,
     cutoff: float,
     max_neighbors: int,
+    precompute_triplets: bool = False,
 ) -> Data:
     """Convert one `ase.Atoms` object to `torch_geometric.data.Data` with edge
     index information include pbc.
 
+    The edges are ordered by the source atom and then by distance, so that the graph of a smaller
+    cutoff radius and fewer neighbors can be made by `lcaonet.data.utils.restrict_graphdata`.
+
     Args:
         atoms (ase.Atoms): one atoms object
+        subtract_center_of_mass (bool): whether to subtract the center of mass.
+        cutoff (float): the cutoff radius.
+        max_neighbors (int): the maximum number of neighbors of each atom.
+        precompute_triplets (bool, optional): whether to store the triplet indices used by `LCAONet`. Defaults to `False`.
 
     Returns:
         data (torch_geometric.data.Data): one Data object with edge information include pbc and the rotation matrix.
-    """
+    """  # noqa: E501
+    data, _, _ = _atoms2graphdata(atoms, subtract_center_of_mass, cutoff, max_neighbors, precompute_triplets)
+    return data
+
+
+def _atoms2graphdata(
+    atoms: ase.Atoms,
+    subtract_center_of_mass: bool,
+    cutoff: float,
+    max_neighbors: int,
+    precompute_triplets: bool = False,
+) -> tuple[Data, bool, int]:
+    """Same as `atoms2graphdata`, but also returns whether the fully linked
+    graph is made because no neighbor is found, and the number of atoms
+    whose neighbors are truncated by `max_neighbors`."""
     if subtract_center_of_mass:
+        # the caller's atoms are not changed, since their hash is used to skip converted structures
+        atoms = atoms.copy()
         masses = np.array(atomic_masses[atoms.numbers])
         pos = atoms.positions
         atoms.positions -= (masses[:, None] * pos).sum(0) / masses.sum()
@@ -128,48 +654,41 @@ def atoms2graphdata(
         self_interaction=False,
     )
 
-    idx_s = []
-    idx_t = []
-    shift = []
-
-    unique = np.unique(edge_src)
-    for i in unique:
-        center_mask = edge_src == i
-        dist_i = dist[center_mask]
-        sorted_ind = np.argsort(dist_i)
-        dist_mask = (dist_i <= cutoff)[sorted_ind]
-        # center_mask to retrieve information on central atom i
-        # reorder by soreted_ind in order of distance
-        # extract only the information within the cutoff radius with dist_mask
-        # indexing to take out only the max_neighbor neighborhoods
-        idx_s_i = edge_src[center_mask][sorted_ind][dist_mask][:max_neighbors]
-        idx_s.append(idx_s_i)
-        idx_t.append(edge_dst[center_mask][sorted_ind][dist_mask][:max_neighbors])
-        shift.append(edge_shift[center_mask][sorted_ind][dist_mask][:max_neighbors])
-
-    if len(idx_s) > 0:
-        edge_src = np.concatenate(idx_s, axis=0)
-        edge_dst = np.concatenate(idx_t, axis=0)
-        edge_shift = np.concatenate(shift, axis=0)
+    fully_linked = edge_src.shape[0] == 0
+    n_truncated = 0
+    if not fully_linked:
+        n_truncated = int(np.count_nonzero(np.bincount(edge_src[dist <= cutoff]) > max_neighbors))
+        # sort edges once by (center, distance) and keep the max_neighbors nearest ones of each center
+        keep = nearest_neighbors(edge_src, dist, cutoff, max_neighbors)
+        edge_src = edge_src[keep]
+        edge_dst = edge_dst[keep]
+        edge_shift = edge_shift[keep]
     else:
         logging.warning(f"no neighbor is found in {atoms.symbols}. Make fully linked graph.")
         edge, edge_shift = full_linked_graph(atoms.numbers.shape[0])
         edge_src, edge_dst = edge[0], edge[1]
 
     # edge_index order is "source_to_target"
-    data = Data(edge_index=torch.stack([torch.LongTensor(edge_src), torch.LongTensor(edge_dst)], dim=0))
+    edge_index = np.stack([edge_src, edge_dst], axis=0).astype(np.int64, copy=False)
+    data = GraphData(edge_index=torch.from_numpy(edge_index))
     # node info
-    data[GraphKeys.Pos] = torch.tensor(atoms.get_positions(), dtype=torch.float32)
-    data[GraphKeys.Z] = torch.tensor(atoms.numbers, dtype=torch.long)
+    data[GraphKeys.Pos] = torch.from_numpy(atoms.get_positions().astype(np.float32))
+    data[GraphKeys.Z] = torch.from_numpy(atoms.numbers.astype(np.int64))
     # edge info
-    data[GraphKeys.Edge_shift] = torch.tensor(edge_shift, dtype=torch.float32)
+    data[GraphKeys.Edge_shift] = torch.from_numpy(edge_shift.astype(np.float32, copy=False))
+    # triplet info
+    if precompute_triplets:
+        idx_k, edge_idx_ks, edge_idx_st = get_triplets(edge_index, atoms.numbers.shape[0])
+        data[GraphKeys.Idx_k_3b] = torch.from_numpy(idx_k)
+        data[GraphKeys.Edge_idx_ks_3b] = torch.from_numpy(edge_idx_ks)
+        data[GraphKeys.Edge_idx_st_3b] = torch.from_numpy(edge_idx_st)
 
     # graph info
-    data[GraphKeys.Lattice] = torch.tensor(atoms.cell.array, dtype=torch.float32).unsqueeze(0)
-    data[GraphKeys.PBC] = torch.tensor(atoms.pbc, dtype=torch.long).unsqueeze(0)
+    data[GraphKeys.Lattice] = torch.from_numpy(atoms.cell.array.astype(np.float32)).unsqueeze(0)
+    data[GraphKeys.PBC] = torch.from_numpy(atoms.pbc.astype(np.int64)).unsqueeze(0)
     data[GraphKeys.Neighbors] = torch.tensor([edge_dst.shape[0]])
 
-    return data
+    return data, fully_linked, n_truncated
 
 
 def graphdata2atoms(data: Data) -> ase.Atoms:
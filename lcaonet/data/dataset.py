@@ -1,17 +1,64 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
 import pathlib
+import pickle
 
 import ase
+import ase.db
+import ase.io
+import numpy as np
 import torch
 from torch_geometric.data import Data, Dataset
 
-from .convert import graphdata2atoms
+from .cache import SharedLRUCache
+from .convert import (
+    PARAMS_FILE,
+    ListDataConverter,
+    PackedDataWriter,
+    _calc_results_to_info,
+    _row_to_atoms,
+    graphdata2atoms,
+)
+from .keys import GraphKeys
+from .manifest import MANIFEST_FILE, Manifest
+from .targets import TARGETS_DIR, TargetStore
+from .utils import (
+    GraphData,
+    atoms_hash,
+    decode_graphdata,
+    encode_graphdata,
+    restrict_graphdata,
+)
 
 
 class GraphDataset(Dataset):
-    def __init__(self, save_dir: str | pathlib.Path, inmemory: bool = False):
+    """Dataset of the graph files written by the data converters.
+
+    If `cutoff` or `max_neighbors` is given, the graphs are restricted to them when they are loaded,
+    so that the dataset converted once with the largest cutoff radius and number of neighbors can be
+    used for the smaller ones without the conversion. In that case, `n_edges` and `n_triplets` of the
+    manifest are the upper bounds of those of the restricted graphs.
+    """
+
+    def __init__(
+        self,
+        save_dir: str | pathlib.Path,
+        inmemory: bool = False,
+        cache_bytes: int | None = None,
+        cutoff: float | None = None,
+        max_neighbors: int | None = None,
+    ):
+        """
+        Args:
+            save_dir (str | pathlib.Path): the directory where the graph files are saved.
+            inmemory (bool, optional): whether to keep the loaded graphs in memory. Defaults to `False`.
+            cache_bytes (int | None, optional): the size in bytes of the LRU cache of the loaded graphs in shared memory, which is shared by the DataLoader workers. If given, `inmemory` is ignored. Defaults to `None`.
+            cutoff (float | None, optional): the cutoff radius to restrict the graphs, not larger than that of the conversion. Defaults to `None`.
+            max_neighbors (int | None, optional): the maximum number of neighbors to restrict the graphs, not larger than that of the conversion. Defaults to `None`.
+        """  # noqa: E501
         super().__init__()
 
         if isinstance(save_dir, str):
@@ -21,27 +68,300 @@ class GraphDataset(Dataset):
         if not self.save_dir.exists():
             raise FileNotFoundError(f"{self.save_dir} does not exist. Please convert the dataset first.")
 
+        # the manifest is read only once, and the directory is listed only once if it does not exist
+        self.manifest: Manifest | None = None
+        if (self.save_dir / MANIFEST_FILE).exists():
+            self.manifest = Manifest.load(self.save_dir)
+            self._files = self.manifest.files
+        else:
+            n_files = sum(1 for f in os.listdir(self.save_dir) if f.endswith(".pt"))
+            self._files = [f"{i}.pt" for i in range(n_files)]
+        if len(self._files) == 0:
+            raise ValueError("The dataset is empty.")
+
+        # the targets written by the converters with `target_store=True` are joined at `get`
+        self.targets: TargetStore | None = None
+        if (self.save_dir / TARGETS_DIR).exists():
+            self.targets = TargetStore(self.save_dir)
+
+        self.cache: SharedLRUCache | None = None
+        if cache_bytes is not None:
+            self.cache = SharedLRUCache(self.len(), cache_bytes)
+            inmemory = False
         self.inmemory = inmemory
         if inmemory:
-            self._data_list = [None for _ in range(self.len())]
+            self._data_list: list[Data | None] = [None for _ in range(self.len())]
+
+        self.cutoff = cutoff
+        self.max_neighbors = max_neighbors
+        if cutoff is not None or max_neighbors is not None:
+            self._check_restriction()
+
+    def _check_restriction(self):
+        path = self.save_dir / PARAMS_FILE
+        if not path.exists():
+            raise ValueError(f"{self.save_dir} has no {PARAMS_FILE}, so the graphs cannot be restricted.")
+        with open(path) as f:
+            params = json.load(f)["params"]
+        for k in ["cutoff", "max_neighbors"]:
+            if getattr(self, k) is None:
+                setattr(self, k, params[k])
+            elif getattr(self, k) > params[k]:
+                raise ValueError(f"{k}={getattr(self, k)} is larger than {params[k]} of the conversion.")
 
     def len(self) -> int:
-        length = len(os.listdir(self.save_dir))
-        if length == 0:
-            raise ValueError("The dataset is empty.")
-        return length
+        return len(self._files)
 
     def get(self, idx: int) -> Data:
-        if not self.inmemory:
-            return torch.load(f"{self.save_dir}/{idx}.pt")
-        if idx >= self.len():
+        data = self._get_graph(idx)
+        if self.cutoff is not None:
+            data = restrict_graphdata(data, self.cutoff, self.max_neighbors)  # type: ignore # Since mypy cannot determine that max_neighbors is set with cutoff # noqa: E501
+        if self.targets is not None:
+            for k, v in self.targets.get(idx).items():
+                data[k] = v
+        return data
+
+    def _get_graph(self, idx: int) -> Data:
+        if idx < 0 or idx >= self.len():
             raise IndexError("index out of range")
+        if self.cache is not None:
+            # the graphs are cached as they are stored, which is compact if converted with `compact=True`
+            cached = self.cache.get(idx)
+            if cached is not None:
+                return decode_graphdata(pickle.loads(cached))
+            data = torch.load(self.save_dir / self._files[idx], weights_only=False)
+            self.cache.put(idx, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+            return decode_graphdata(data)
+        if not self.inmemory:
+            return decode_graphdata(torch.load(self.save_dir / self._files[idx], weights_only=False))
+        # the graphs are kept in memory as they are stored, which is compact if converted with `compact=True`
         if self._data_list[idx] is None:
             try:
-                self._data_list[idx] = torch.load(f"{self.save_dir}/{idx}.pt")
+                self._data_list[idx] = torch.load(self.save_dir / self._files[idx], weights_only=False)
             except FileNotFoundError:
                 raise IndexError("Inproper index")
-        return self._data_list[idx]
+        return decode_graphdata(self._data_list[idx])  # type: ignore # Since mypy cannot determine that the data is loaded  # noqa: E501
 
     def get_atoms(self, idx: int) -> ase.Atoms:
         return graphdata2atoms(self.get(idx))
+
+
+class PackedGraphDataset(Dataset):
+    """Dataset of the packed format written by
+    `lcaonet.data.convert.PackedDataWriter`.
+
+    The arrays are opened with `numpy.memmap`, so `get` returns zero-copy slices of the
+    page cache shared by all DataLoader workers.
+    """
+
+    def __init__(self, save_dir: str | pathlib.Path):
+        """
+        Args:
+            save_dir (str | pathlib.Path): the directory where the packed arrays are saved.
+        """
+        super().__init__()
+
+        if isinstance(save_dir, str):
+            self.save_dir = pathlib.Path(save_dir)
+        else:
+            self.save_dir = save_dir
+        if not (self.save_dir / PackedDataWriter.meta_file).exists():
+            raise FileNotFoundError(f"{self.save_dir} is not a packed dataset. Please convert the dataset first.")
+
+        with open(self.save_dir / PackedDataWriter.meta_file) as f:
+            meta = json.load(f)
+        with open(self.save_dir / PackedDataWriter.strings_file) as f:
+            self._strings: dict[str, list[str]] = json.load(f)
+        self.n_graphs: int = meta["n_graphs"]
+        self._meta: dict[str, dict] = meta["arrays"]
+        self._ptr = {k: np.load(self.save_dir / f"{k}_ptr.npy") for k in self._meta}
+        # memmaps are opened lazily in each process
+        self._arrays: dict[str, np.ndarray] | None = None
+
+    def __getstate__(self) -> dict:
+        # pickling a memmap copies the whole array, so let each worker open its own
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def _open(self) -> dict[str, np.ndarray]:
+        arrays = {}
+        for k, m in self._meta.items():
+            dtype = np.dtype(m["dtype"])
+            shape = (int(self._ptr[k][-1]), *m["shape"])
+            if shape[0] == 0:
+                arrays[k] = np.empty(shape, dtype=dtype)
+            else:
+                # copy-on-write mode gives writable arrays for torch without copying the file
+                arrays[k] = np.memmap(self.save_dir / f"{k}.bin", dtype=dtype, mode="c", shape=shape)
+        return arrays
+
+    def len(self) -> int:
+        return self.n_graphs
+
+    def get(self, idx: int) -> Data:
+        if idx < 0 or idx >= self.n_graphs:
+            raise IndexError("index out of range")
+        if self._arrays is None:
+            self._arrays = self._open()
+
+        data = GraphData()
+        for k, arr in self._arrays.items():
+            ptr = self._ptr[k]
+            val = torch.from_numpy(arr[ptr[idx] : ptr[idx + 1]])
+            if k == GraphKeys.Edge_idx:
+                val = val.t()
+            elif self._meta[k]["ndim"] == 0:
+                val = val.reshape(())
+            data[k] = val
+        for k, v in self._strings.items():
+            data[k] = v[idx]
+        return decode_graphdata(data)
+
+    def get_atoms(self, idx: int) -> ase.Atoms:
+        return graphdata2atoms(self.get(idx))
+
+
+class LazyAseDataset(Dataset):
+    """Dataset of an ASE database or trajectory, whose structures are
+    converted to graphs when they are requested for the first time.
+
+    The structures are converted in the process which requests them, e.g. in the DataLoader workers,
+    so that the conversion in the first epoch overlaps with the training. The converted graphs are saved
+    in `cache_dir` with the hash of the conversion parameters and the hash of the structure as the key,
+    and are loaded from the cache in the later epochs and in the later runs with the same parameters.
+    The hash of each structure is computed when it is read for the first time, and is saved in an index
+    in `cache_dir` keyed by the path, size and modification time of the source, so that a cached graph
+    is loaded without reading the structure.
+    """
+
+    def __init__(
+        self,
+        source: str | pathlib.Path,
+        cache_dir: str | pathlib.Path,
+        cutoff: float,
+        selection=None,
+        **kwargs,
+    ):
+        """
+        Args:
+            source (str | pathlib.Path): the path of the ASE database, or the ASE trajectory file with `.traj` suffix.
+            cache_dir (str | pathlib.Path): the directory where the converted graphs are cached.
+            cutoff (float): the cutoff radius.
+            selection (optional): the selection passed to `ase.db.core.Database.select`. Ignored for the trajectory. Defaults to `None`.
+            **kwargs: other arguments of `lcaonet.data.convert.BaseDataConverter`, e.g. `max_neighbors` or `compact`.
+        """  # noqa: E501
+        super().__init__()
+        self.source = pathlib.Path(source)
+        if not self.source.exists():
+            raise FileNotFoundError(f"{self.source} does not exist.")
+        self.is_trajectory = self.source.suffix == ".traj"
+
+        self.converter = ListDataConverter(cutoff, cache_dir, **kwargs)
+        self.cache_dir = self.converter.save_dir / self.converter.params_hash
+        self.cache_dir.mkdir(exist_ok=True)
+        with open(self.cache_dir / PARAMS_FILE, "w") as f:
+            json.dump({"params": self.converter.params, "hash": self.converter.params_hash}, f, indent=2)
+
+        self._ids: list[int] | None = None
+        if self.is_trajectory:
+            with ase.io.Trajectory(self.source) as traj:
+                self._len = len(traj)
+        else:
+            self._ids = [row.id for row in ase.db.connect(self.source).select(selection, include_data=False)]
+            self._len = len(self._ids)
+        # the file handles are opened in each process
+        self._reader: ase.io.trajectory.TrajectoryReader | ase.db.core.Database | None = None
+        self._index_path = self._write_index(selection)
+        self._hashes: np.ndarray | None = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_reader"] = None
+        state["_hashes"] = None
+        return state
+
+    def _write_index(self, selection) -> pathlib.Path:
+        # the index is made again if the source is modified
+        stat = self.source.stat()
+        key = json.dumps([str(self.source.resolve()), stat.st_size, stat.st_mtime_ns, repr(selection)])
+        path = self.cache_dir / f"index_{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.npy"
+        if path.exists():
+            return path
+        # the digests are stored as bytes instead of the hex strings, and are filled in by the processes
+        # which read the structures. The zero rows are the structures not read yet.
+        tmp_path = self.cache_dir / f"{path.name}.{os.getpid()}.tmp"
+        arr = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(self._len, 16))
+        del arr
+        os.replace(tmp_path, path)
+        return path
+
+    def _load_hashes(self) -> np.ndarray:
+        if self._hashes is None:
+            # each process maps the index, and writes only the rows of the structures it reads
+            self._hashes = np.load(self._index_path, mmap_mode="r+")
+        return self._hashes
+
+    def structure_hash(self, idx: int, atoms: ase.Atoms | None = None) -> str:
+        """The hash of the structure, which is the key of the cached graph.
+
+        The structure is read only if its hash has not been saved in the index yet.
+
+        Args:
+            idx (int): the index of the structure.
+            atoms (ase.Atoms | None, optional): the structure already read by `read_atoms`. Defaults to `None`.
+
+        Returns:
+            str: the hex digest of `lcaonet.data.utils.atoms_hash`.
+        """
+        if idx < 0 or idx >= self._len:
+            raise IndexError("index out of range")
+        hashes = self._load_hashes()
+        if hashes[idx].any():
+            return hashes[idx].tobytes().hex()
+        h = atoms_hash(self.read_atoms(idx) if atoms is None else atoms)
+        hashes[idx] = np.frombuffer(bytes.fromhex(h), dtype=np.uint8)
+        return h
+
+    def len(self) -> int:
+        return self._len
+
+    def read_atoms(self, idx: int) -> ase.Atoms:
+        """Read the structure with the properties in `atoms.info`.
+
+        Args:
+            idx (int): the index of the structure.
+
+        Returns:
+            ase.Atoms: the atoms object.
+        """
+        if idx < 0 or idx >= self._len:
+            raise IndexError("index out of range")
+        if self._reader is None:
+            self._reader = ase.io.Trajectory(self.source) if self.is_trajectory else ase.db.connect(self.source)
+        if self._ids is None:
+            return _calc_results_to_info(self._reader[idx])
+        return _row_to_atoms(self._reader.get(id=self._ids[idx]))
+
+    def get(self, idx: int) -> Data:
+        # the structure is read only if the graph is not cached, or if its hash is not known yet
+        atoms = None
+        if not self._load_hashes()[idx].any():
+            atoms = self.read_atoms(idx)
+        path = self.cache_dir / f"{self.structure_hash(idx, atoms)}.pt"
+        if path.exists():
+            return decode_graphdata(torch.load(path, weights_only=False))
+
+        if atoms is None:
+            atoms = self.read_atoms(idx)
+        data, _, _ = self.converter.atoms2graph(atoms)
+        if self.converter.compact:
+            data = encode_graphdata(data, self.converter.half_edges)
+        # processes converting the same structure write their own temporary files
+        tmp_path = self.cache_dir / f"{path.name}.{os.getpid()}.tmp"
+        torch.save(data, tmp_path)
+        os.replace(tmp_path, path)
+        return decode_graphdata(data)
+
+    def get_atoms(self, idx: int) -> ase.Atoms:
+        return self.read_atoms(idx)
@@ -11,12 +11,16 @@ class GraphKeys:
     Batch_idx = "batch"  # (N) shape
     Z = "z"  # (N) shape
     Pos = "pos"  # (N, 3) shape
+    Atom_idx = "atom_idx"  # (N) shape, index of each atom in the original structure if the atoms are reordered
 
     # Attributes marked with "index" are automatically incremented in batch processing
     Edge_idx = "edge_index"  # (2, E) shape, order is "source_to_target"
     Edge_shift = "edge_shift"  # (E, 3) shape
+    Edge_shift_vec = "edge_shift_vec"  # (E, 3) shape, cartesian vectors of edge_shift
     Edge_dist = "edge_dist"  # (E) shape
     Edge_vec_st = "edge_vec"  # (E, 3) shape
+    Edge_half = "edge_half"  # (1) shape, whether only one direction of each edge is stored in the compact encoding
+    Edge_order = "edge_order"  # (E/2, 2) shape, original positions of each stored edge and its reverse in the compact encoding  # noqa: E501
 
     # 3body properties
     Idx_s_3b = "idx_s_3b"  # (n_triplets) shape
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import pathlib
+from collections.abc import Iterable, Iterator, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torch_geometric.data import Batch, Data, Dataset
+
+from .convert import PackedDataWriter
+from .dataset import PackedGraphDataset
+from .keys import GraphKeys
+from .utils import GraphData, data_keys, get_triplets
+
+
+class GraphCollater:
+    """Collate graphs into a batch and precompute the geometric information
+    which does not depend on the atomic positions.
+
+    The triplet indices and the cartesian shift vectors of the edges are added to the batch,
+    so that `LCAONet` skips computing them. The distances and angles are not precomputed,
+    since they need the gradient with respect to the positions to calculate the forces.
+    """
+
+    def __init__(
+        self,
+        precompute_triplets: bool = True,
+        precompute_shift_vec: bool = True,
+        follow_batch: list[str] | None = None,
+        exclude_keys: list[str] | None = None,
+    ):
+        """
+        Args:
+            precompute_triplets (bool, optional): whether to make the triplet indices. Defaults to `True`.
+            precompute_shift_vec (bool, optional): whether to make the cartesian shift vectors of the edges. Defaults to `True`.
+            follow_batch (list[str] | None, optional): the keys for which the batch vectors are made. Defaults to `None`.
+            exclude_keys (list[str] | None, optional): the keys excluded from the batch. Defaults to `None`.
+        """  # noqa: E501
+        self.precompute_triplets = precompute_triplets
+        self.precompute_shift_vec = precompute_shift_vec
+        self.follow_batch = follow_batch
+        self.exclude_keys = exclude_keys
+
+    def __call__(self, data_list: Sequence[Data]) -> Batch:
+        batch = Batch.from_data_list(list(data_list), self.follow_batch, self.exclude_keys)
+        edge_index = batch[GraphKeys.Edge_idx]
+
+        if self.precompute_triplets and batch.get(GraphKeys.Edge_idx_ks_3b) is None:
+            idx_k, edge_idx_ks, edge_idx_st = get_triplets(edge_index.numpy(), batch[GraphKeys.Z].size(0))
+            batch[GraphKeys.Idx_k_3b] = torch.from_numpy(idx_k)
+            batch[GraphKeys.Edge_idx_ks_3b] = torch.from_numpy(edge_idx_ks)
+            batch[GraphKeys.Edge_idx_st_3b] = torch.from_numpy(edge_idx_st)
+
+        if self.precompute_shift_vec:
+            edge_batch = batch[GraphKeys.Batch_idx][edge_index[0]]
+            lattice = batch[GraphKeys.Lattice].to(batch[GraphKeys.Pos].dtype)
+            batch[GraphKeys.Edge_shift_vec] = torch.einsum(
+                "ni,nij->nj", batch[GraphKeys.Edge_shift].to(lattice.dtype), lattice[edge_batch]
+            ).contiguous()
+        return batch
+
+
+class GraphDataLoader(DataLoader):
+    """Data loader which builds the batches, the triplet indices and the
+    shift vectors in the worker processes.
+
+    The batches made in the workers are passed to the main process through shared memory,
+    and `prefetch_factor` batches per worker are prepared while the model is running.
+    The batches are copied to the pinned memory if `pin_memory=True`, so that they can be
+    moved to the GPU asynchronously by `batch.to(device, non_blocking=True)`.
+    It can be used with a batch sampler such as `lcaonet.data.sampler.BudgetBatchSampler`.
+    """
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        batch_size: int | None = 1,
+        shuffle: bool = False,
+        num_workers: int = 0,
+        prefetch_factor: int | None = 2,
+        pin_memory: bool | None = None,
+        precompute_triplets: bool = True,
+        precompute_shift_vec: bool = True,
+        follow_batch: list[str] | None = None,
+        exclude_keys: list[str] | None = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            dataset (torch_geometric.data.Dataset): the dataset.
+            batch_size (int | None, optional): the number of graphs in a batch. Defaults to `1`.
+            shuffle (bool, optional): whether to shuffle the data in each epoch. Defaults to `False`.
+            num_workers (int, optional): the number of worker processes. If `0`, the batches are made in the main process. Defaults to `0`.
+            prefetch_factor (int | None, optional): the number of batches prepared in advance by each worker. Ignored if `num_workers=0`. Defaults to `2`.
+            pin_memory (bool | None, optional): whether to copy the batches to the pinned memory. If `None`, it is used when CUDA is available. Defaults to `None`.
+            precompute_triplets (bool, optional): whether to make the triplet indices in the workers. Defaults to `True`.
+            precompute_shift_vec (bool, optional): whether to make the cartesian shift vectors in the workers. Defaults to `True`.
+            follow_batch (list[str] | None, optional): the keys for which the batch vectors are made. Defaults to `None`.
+            exclude_keys (list[str] | None, optional): the keys excluded from the batch. Defaults to `None`.
+            **kwargs: other arguments of `torch.utils.data.DataLoader`, e.g. `batch_sampler` or `persistent_workers`.
+
+        Raises:
+            ValueError: If `collate_fn` is given, since the batches are made by `GraphCollater`.
+        """  # noqa: E501
+        if "collate_fn" in kwargs:
+            raise ValueError("collate_fn cannot be given, since the batches are made by GraphCollater.")
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available()
+        if num_workers == 0:
+            prefetch_factor = None
+        if kwargs.get("batch_sampler") is not None:
+            # batch_size and shuffle are mutually exclusive with batch_sampler
+            batch_size, shuffle = 1, False
+        super().__init__(
+            dataset,
+            batch_size=batch_size,
+            shuffle=shuffle,
+            num_workers=num_workers,
+            prefetch_factor=prefetch_factor,
+            pin_memory=pin_memory,
+            collate_fn=GraphCollater(precompute_triplets, precompute_shift_vec, follow_batch, exclude_keys),
+            **kwargs,
+        )
+
+
+def write_batch_cache(loader: Iterable[Batch], save_dir: str | pathlib.Path) -> int:
+    """Collate the batches once and write them in the packed format, so that
+    they can be read by `BatchCache` in the later evaluations.
+
+    Each batch, including the incremented edge indices and the geometric information precomputed
+    by the loader, e.g. `GraphDataLoader`, is written as one entry of `PackedDataWriter`.
+    The attributes which are not tensors, e.g. strings, are not written.
+
+    Args:
+        loader (Iterable[torch_geometric.data.Batch]): the loader giving the batches in a fixed order.
+        save_dir (str | pathlib.Path): the directory where the batches are saved.
+
+    Returns:
+        int: the number of batches.
+    """
+    with PackedDataWriter(save_dir) as writer:
+        for batch in loader:
+            data = GraphData()
+            for k in data_keys(batch):
+                if isinstance(batch[k], torch.Tensor):
+                    data[k] = batch[k]
+            writer.write(data)
+        return writer.n_graphs
+
+
+class BatchCache(PackedGraphDataset):
+    """Batches written by `write_batch_cache`, which are passed to the model
+    as they are.
+
+    The arrays are memory-mapped from the disk, or loaded into shared memory once if
+    `shared_memory=True`, so that the workers of a DataLoader share them without reading the files.
+    It is iterated directly, or by `torch.utils.data.DataLoader(cache, batch_size=None)`.
+    """
+
+    def __init__(self, save_dir: str | pathlib.Path, shared_memory: bool = False):
+        """
+        Args:
+            save_dir (str | pathlib.Path): the directory where the batches are saved.
+            shared_memory (bool, optional): whether to load the batches into shared memory. Defaults to `False`.
+        """
+        super().__init__(save_dir)
+        self.shared_memory = shared_memory
+        self._shared: dict[str, torch.Tensor] | None = None
+        if shared_memory:
+            self._shared = {k: torch.from_numpy(np.array(v)).share_memory_() for k, v in super()._open().items()}
+
+    def _open(self) -> dict[str, np.ndarray]:
+        if self._shared is not None:
+            return {k: v.numpy() for k, v in self._shared.items()}
+        return super()._open()
+
+    def get(self, idx: int) -> Batch:
+        data = super().get(idx)
+        return Batch(**{k: data[k] for k in data_keys(data)})
+
+    def __iter__(self) -> Iterator[Batch]:
+        for i in range(self.len()):
+            yield self.get(i)
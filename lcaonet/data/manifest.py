@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import csv
+import pathlib
+from collections.abc import Iterable
+
+import numpy as np
+from numpy import ndarray
+
+MANIFEST_FILE = "manifest.csv"
+MANIFEST_FIELDS = [
+    "index",
+    "file",
+    "n_atoms",
+    "n_edges",
+    "n_triplets",
+    "species",
+    "formula",
+    "hash",
+    "fingerprint",
+    "n_truncated",
+]
+# the fields added later, which the manifests written by older versions lack
+OPTIONAL_FIELDS = ["hash", "fingerprint", "n_truncated"]
+
+
+class Manifest:
+    """Index of the structures of a converted dataset, written by the data
+    converters as `manifest.csv`.
+
+    The sizes of each structure can be used to select or sample a subset
+    without opening any graph file.
+    """
+
+    def __init__(self, rows: list[dict[str, str | int]]):
+        """
+        Args:
+            rows (list[dict[str, str | int]]): the rows of the manifest with the keys of `MANIFEST_FIELDS`.
+        """
+        rows = sorted(rows, key=lambda r: int(r["index"]))
+        self.index = np.array([int(r["index"]) for r in rows], dtype=np.int64)
+        if not np.array_equal(self.index, np.arange(len(rows))):
+            raise ValueError(
+                "The indices of the manifest must be consecutive from 0. The conversion may have been interrupted, please resume it."  # noqa: E501
+            )
+        self.files = [str(r["file"]) for r in rows]
+        self.n_atoms = np.array([int(r["n_atoms"]) for r in rows], dtype=np.int64)
+        self.n_edges = np.array([int(r["n_edges"]) for r in rows], dtype=np.int64)
+        self.n_triplets = np.array([int(r["n_triplets"]) for r in rows], dtype=np.int64)
+        self.species = [frozenset(int(z) for z in str(r["species"]).split()) for r in rows]
+        self.formula = [str(r["formula"]) for r in rows]
+        self.hash = [str(r.get("hash") or "") for r in rows]
+        self.fingerprint = [str(r.get("fingerprint") or "") for r in rows]
+        # -1 if unknown
+        self.n_truncated = np.array([int(r.get("n_truncated") or -1) for r in rows], dtype=np.int64)
+
+    @classmethod
+    def load(cls, save_dir: str | pathlib.Path) -> Manifest:
+        return cls(read_manifest_rows(save_dir))
+
+    def __len__(self) -> int:
+        return self.index.shape[0]
+
+    def select(
+        self,
+        max_atoms: int | None = None,
+        max_edges: int | None = None,
+        max_triplets: int | None = None,
+        species: Iterable[int] | None = None,
+    ) -> ndarray:
+        """Select the structures within the size limits.
+
+        Args:
+            max_atoms (int | None, optional): the maximum number of atoms. Defaults to `None`.
+            max_edges (int | None, optional): the maximum number of edges. Defaults to `None`.
+            max_triplets (int | None, optional): the maximum number of triplets. Defaults to `None`.
+            species (Iterable[int] | None, optional): the allowed atomic numbers. Defaults to `None`.
+
+        Returns:
+            numpy.ndarray: the indices of the selected structures.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if max_atoms is not None:
+            mask &= self.n_atoms <= max_atoms
+        if max_edges is not None:
+            mask &= self.n_edges <= max_edges
+        if max_triplets is not None:
+            mask &= self.n_triplets <= max_triplets
+        if species is not None:
+            allowed = frozenset(species)
+            mask &= np.array([s <= allowed for s in self.species], dtype=bool)
+        return self.index[mask]
+
+    def sample(self, n: int, seed: int | None = None, **kwargs) -> ndarray:
+        """Randomly sample the structures without replacement from those
+        selected by `select`.
+
+        Args:
+            n (int): the number of structures to sample.
+            seed (int | None, optional): the random seed. Defaults to `None`.
+            **kwargs: the size limits passed to `select`.
+
+        Returns:
+            numpy.ndarray: the sorted indices of the sampled structures.
+        """
+        candidates = self.select(**kwargs)
+        if n > candidates.shape[0]:
+            raise ValueError(f"Cannot sample {n} structures from {candidates.shape[0]} candidates.")
+        rng = np.random.default_rng(seed)
+        return np.sort(rng.choice(candidates, n, replace=False))
+
+
+def read_manifest_rows(save_dir: str | pathlib.Path) -> list[dict[str, str]]:
+    """Read the rows of `manifest.csv` in the written order.
+
+    A last row which is incompletely written by an interrupted conversion is ignored.
+
+    Args:
+        save_dir (str | pathlib.Path): the directory of the converted dataset.
+
+    Returns:
+        list[dict[str, str]]: the rows of the manifest.
+    """
+    required = [k for k in MANIFEST_FIELDS if k not in OPTIONAL_FIELDS]
+    with open(pathlib.Path(save_dir) / MANIFEST_FILE, newline="") as f:
+        return [r for r in csv.DictReader(f) if all(r.get(k) is not None for k in required)]
+
+
+class ManifestWriter:
+    """Appender of the rows of `manifest.csv`.
+
+    Each row is flushed as soon as it is written, so that the converted
+    structures are recorded even if the conversion is interrupted. The rows
+    may be written in any order, since `Manifest` sorts them by index.
+    """
+
+    def __init__(self, save_dir: str | pathlib.Path):
+        """
+        Args:
+            save_dir (str | pathlib.Path): the directory of the converted dataset.
+        """
+        path = pathlib.Path(save_dir) / MANIFEST_FILE
+        new_file = not path.exists() or path.stat().st_size == 0
+        fields = MANIFEST_FIELDS
+        if not new_file:
+            _remove_incomplete_line(path)
+            # keep the columns of a manifest written by an older version
+            with open(path, newline="") as f:
+                fields = next(csv.reader(f))
+        self._file = open(path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=fields, extrasaction="ignore")
+        if new_file:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def __enter__(self) -> ManifestWriter:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, row: dict[str, str | int]):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _remove_incomplete_line(path: pathlib.Path):
+    # an interrupted conversion may leave a row without the line break
+    with open(path, "rb+") as f:
+        size = f.seek(0, 2)
+        start = max(size - 65536, 0)
+        f.seek(start)
+        tail = f.read()
+        if not tail.endswith(b"\n"):
+            f.truncate(start + tail.rfind(b"\n") + 1)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import csv
+import json
+import multiprocessing as mp
+import pathlib
+
+import numpy as np
+from numpy import ndarray
+from torch_geometric.data import Dataset
+
+from .keys import GraphKeys
+from .utils import count_triplets, get_worker_dataset, init_dataset_worker
+
+SIZE_KEYS = ["n_atoms", "n_edges", "n_triplets"]
+
+
+class DatasetReport:
+    """Distributions of the sizes and the species of the structures in a
+    dataset, used to choose `max_z`, the batch budgets and the memory.
+
+    The number of triplets is that `LCAONet.get_triplets` makes from each graph, and the number
+    of truncated atoms is that of the atoms whose neighbors within the cutoff radius are more
+    than `max_neighbors` of the conversion, which is known only from the manifest.
+    """
+
+    def __init__(
+        self,
+        index: ndarray,
+        sizes: dict[str, ndarray],
+        species: list[frozenset[int]],
+        n_truncated: ndarray,
+        bins: int = 20,
+    ):
+        """
+        Args:
+            index (numpy.ndarray): the index of each structure in the dataset.
+            sizes (dict[str, numpy.ndarray]): `n_atoms`, `n_edges` and `n_triplets` of each structure.
+            species (list[frozenset[int]]): the atomic numbers in each structure.
+            n_truncated (numpy.ndarray): the number of truncated atoms of each structure, or -1 if unknown.
+            bins (int, optional): the number of bins of the histograms. Defaults to `20`.
+        """
+        self.index = index
+        self.sizes = sizes
+        self.species = species
+        self.n_truncated = n_truncated
+        self.bins = bins
+
+    def __len__(self) -> int:
+        return self.index.shape[0]
+
+    def __repr__(self) -> str:
+        return "{}(n_graphs={}, max_atoms={}, max_edges={}, max_triplets={}, max_z={})".format(
+            self.__class__.__name__,
+            len(self),
+            *[int(self.sizes[k].max(initial=0)) for k in SIZE_KEYS],
+            self.max_z,
+        )
+
+    @property
+    def max_z(self) -> int:
+        return max((max(s) for s in self.species if len(s) > 0), default=0)
+
+    def summary(self) -> dict:
+        """The statistics and the histograms of the sizes, the number of
+        structures containing each species, and the frequency of the
+        truncation.
+
+        Returns:
+            dict: the summary which can be written as JSON. `truncation` is `None` if it is unknown.
+        """
+        summary: dict = {"n_graphs": len(self)}
+        for k in SIZE_KEYS:
+            summary[k] = _describe(self.sizes[k], self.bins)
+
+        z, counts = np.unique([z for s in self.species for z in s], return_counts=True)
+        summary["species"] = {
+            "max_z": self.max_z,
+            "n_graphs": {str(int(zi)): int(c) for zi, c in zip(z, counts)},
+        }
+
+        summary["truncation"] = None
+        if len(self) > 0 and np.all(self.n_truncated >= 0):
+            n_atoms = int(self.sizes["n_atoms"].sum())
+            summary["truncation"] = {
+                "n_graphs": int(np.count_nonzero(self.n_truncated)),
+                "n_atoms": int(self.n_truncated.sum()),
+                "graph_fraction": float(np.count_nonzero(self.n_truncated) / len(self)),
+                "atom_fraction": float(self.n_truncated.sum() / max(n_atoms, 1)),
+            }
+        return summary
+
+    def to_json(self, path: str | pathlib.Path):
+        """Write the summary as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_csv(self, path: str | pathlib.Path):
+        """Write the sizes, the species and the number of truncated atoms of
+        each structure as CSV."""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["index", *SIZE_KEYS, "n_truncated", "species"])
+            for i in range(len(self)):
+                writer.writerow(
+                    [
+                        int(self.index[i]),
+                        *[int(self.sizes[k][i]) for k in SIZE_KEYS],
+                        int(self.n_truncated[i]),
+                        " ".join(str(z) for z in sorted(self.species[i])),
+                    ]
+                )
+
+
+def dataset_report(dataset: Dataset, bins: int = 20, n_workers: int = 1, chunksize: int = 1024) -> DatasetReport:
+    """Make the report of the sizes and the species of the structures in a
+    dataset.
+
+    The report is made from the manifest without opening any graph file if the dataset has it,
+    otherwise the graphs are loaded in chunks of `chunksize` graphs, in parallel if `n_workers > 1`.
+
+    Args:
+        dataset (torch_geometric.data.Dataset): the dataset, which may be a subset of `GraphDataset`.
+        bins (int, optional): the number of bins of the histograms. Defaults to `20`.
+        n_workers (int, optional): the number of worker processes used without the manifest. Defaults to `1`.
+        chunksize (int, optional): the number of graphs processed at once without the manifest. Defaults to `1024`.
+
+    Returns:
+        DatasetReport: the report, which can be written by `to_json` and `to_csv`.
+    """  # noqa: E501
+    if n_workers < 1:
+        raise ValueError(f"n_workers={n_workers} must be positive.")
+    # the manifest of the restricted graphs has the sizes of the unrestricted ones
+    manifest = getattr(dataset, "manifest", None) if getattr(dataset, "cutoff", None) is None else None
+    if manifest is not None:
+        idx = np.asarray(dataset.indices(), dtype=np.int64)
+        sizes = {k: getattr(manifest, k)[idx] for k in SIZE_KEYS}
+        return DatasetReport(idx, sizes, [manifest.species[i] for i in idx], manifest.n_truncated[idx], bins)
+
+    chunks = [(start, min(start + chunksize, len(dataset))) for start in range(0, len(dataset), chunksize)]
+    if n_workers == 1:
+        results = [_collect_sizes(dataset, *c) for c in chunks]
+    else:
+        with mp.get_context().Pool(n_workers, initializer=init_dataset_worker, initargs=(dataset,)) as pool:
+            results = list(pool.imap(_chunk_sizes, chunks))
+
+    sizes = {k: np.concatenate([r[0][k] for r in results] + [np.zeros(0, dtype=np.int64)]) for k in SIZE_KEYS}
+    species = [s for r in results for s in r[1]]
+    idx = np.asarray(dataset.indices(), dtype=np.int64)
+    return DatasetReport(idx, sizes, species, np.full(len(dataset), -1, dtype=np.int64), bins)
+
+
+def _describe(values: ndarray, bins: int) -> dict:
+    if values.shape[0] == 0:
+        return {"total": 0, "hist": {"counts": [], "bin_edges": []}}
+    counts, bin_edges = np.histogram(values, bins=bins)
+    return {
+        "total": int(values.sum()),
+        "min": int(values.min()),
+        "max": int(values.max()),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "hist": {"counts": counts.tolist(), "bin_edges": bin_edges.tolist()},
+    }
+
+
+def _collect_sizes(dataset: Dataset, start: int, stop: int) -> tuple[dict[str, ndarray], list[frozenset[int]]]:
+    sizes = {k: np.zeros(stop - start, dtype=np.int64) for k in SIZE_KEYS}
+    species = []
+    for i in range(start, stop):
+        data = dataset[i]
+        z = data[GraphKeys.Z].numpy()
+        edge_index = data[GraphKeys.Edge_idx].numpy()
+        sizes["n_atoms"][i - start] = z.shape[0]
+        sizes["n_edges"][i - start] = edge_index.shape[1]
+        sizes["n_triplets"][i - start] = count_triplets(edge_index, z.shape[0])
+        species.append(frozenset(int(zi) for zi in np.unique(z)))
+    return sizes, species
+
+
+def _chunk_sizes(chunk: tuple[int, int]) -> tuple[dict[str, ndarray], list[frozenset[int]]]:
+    return _collect_sizes(get_worker_dataset(), *chunk)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+import numpy as np
+from numpy import ndarray
+from torch.utils.data import Sampler
+from torch_geometric.data import Dataset
+
+from .keys import GraphKeys
+from .utils import count_triplets
+
+
+def graph_sizes(dataset: Dataset, triplets: bool = True) -> dict[str, ndarray]:
+    """Get the number of atoms, edges and triplets of each graph in the
+    dataset.
+
+    The sizes are read from the manifest if the dataset has it, otherwise each graph is loaded once
+    and the number of edges is taken from the stored `neighbors` field.
+
+    Args:
+        dataset (torch_geometric.data.Dataset): the dataset, which may be a subset of `GraphDataset`.
+        triplets (bool, optional): whether to count the triplets when no manifest is available. Defaults to `True`.
+
+    Returns:
+        sizes (dict[str, numpy.ndarray]): `n_atoms`, `n_edges` and `n_triplets` of each graph in the order of the dataset.
+            `n_triplets` is missing if `triplets=False` and no manifest is available.
+    """  # noqa: E501
+    manifest = getattr(dataset, "manifest", None)
+    if manifest is not None:
+        idx = np.asarray(dataset.indices(), dtype=np.int64)
+        return {
+            "n_atoms": manifest.n_atoms[idx],
+            "n_edges": manifest.n_edges[idx],
+            "n_triplets": manifest.n_triplets[idx],
+        }
+
+    n = len(dataset)
+    sizes = {"n_atoms": np.zeros(n, dtype=np.int64), "n_edges": np.zeros(n, dtype=np.int64)}
+    if triplets:
+        sizes["n_triplets"] = np.zeros(n, dtype=np.int64)
+    for i in range(n):
+        data = dataset[i]
+        n_atoms = data[GraphKeys.Z].size(0)
+        sizes["n_atoms"][i] = n_atoms
+        if data.get(GraphKeys.Neighbors) is not None:
+            sizes["n_edges"][i] = int(data[GraphKeys.Neighbors].sum())
+        else:
+            sizes["n_edges"][i] = data[GraphKeys.Edge_idx].size(1)
+        if triplets:
+            sizes["n_triplets"][i] = count_triplets(data[GraphKeys.Edge_idx].numpy(), n_atoms)
+    return sizes
+
+
+class BudgetBatchSampler(Sampler):
+    """Batch sampler which packs graphs into batches up to a budget of atoms,
+    edges and triplets instead of a fixed number of graphs.
+
+    The graphs are sorted by size and split into buckets of similar size. The graphs are shuffled
+    within each bucket and packed greedily, and then the order of the batches is shuffled, so that
+    every batch has a similar cost. The shuffling is reproducible by `seed`, and changes with the
+    epoch set by `set_epoch`. It is passed to the loader as
+    `torch_geometric.loader.DataLoader(dataset, batch_sampler=sampler)`.
+    """
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        max_atoms: int | None = None,
+        max_edges: int | None = None,
+        max_triplets: int | None = None,
+        shuffle: bool = True,
+        seed: int = 0,
+        bucket_size: int = 1024,
+    ):
+        """
+        Args:
+            dataset (torch_geometric.data.Dataset): the dataset, which may be a subset of `GraphDataset`.
+            max_atoms (int | None, optional): the maximum number of atoms in a batch. Defaults to `None`.
+            max_edges (int | None, optional): the maximum number of edges in a batch. Defaults to `None`.
+            max_triplets (int | None, optional): the maximum number of triplets in a batch. Defaults to `None`.
+            shuffle (bool, optional): whether to shuffle the graphs within buckets and the order of the batches. Defaults to `True`.
+            seed (int, optional): the random seed of the shuffling. Defaults to `0`.
+            bucket_size (int, optional): the number of graphs of similar size in a bucket. Defaults to `1024`.
+        """  # noqa: E501
+        if max_atoms is None and max_edges is None and max_triplets is None:
+            raise ValueError("At least one of max_atoms, max_edges and max_triplets must be given.")
+        if bucket_size < 1:
+            raise ValueError(f"bucket_size={bucket_size} must be positive.")
+        sizes = graph_sizes(dataset, triplets=max_triplets is not None)
+        self.budgets: dict[str, int] = {}
+        for k, v in [("n_atoms", max_atoms), ("n_edges", max_edges), ("n_triplets", max_triplets)]:
+            if v is not None:
+                self.budgets[k] = v
+        self.sizes = {k: sizes[k] for k in self.budgets}
+        self.shuffle = shuffle
+        self.seed = seed
+        self.bucket_size = bucket_size
+        self.epoch = 0
+
+        # graphs are bucketed by the largest of their sizes relative to the budgets
+        cost = np.stack([self.sizes[k] / b for k, b in self.budgets.items()]).max(axis=0)
+        self._order = np.argsort(cost, kind="stable")
+
+    def set_epoch(self, epoch: int):
+        """Set the epoch to change the shuffling in each epoch.
+
+        Args:
+            epoch (int): the epoch number.
+        """
+        self.epoch = epoch
+
+    def _batches(self) -> list[list[int]]:
+        order = self._order
+        rng = np.random.default_rng([self.seed, self.epoch])
+        if self.shuffle:
+            buckets = [order[i : i + self.bucket_size] for i in range(0, len(order), self.bucket_size)]
+            order = np.concatenate([rng.permutation(b) for b in buckets]) if buckets else order
+
+        batches: list[list[int]] = []
+        batch: list[int] = []
+        total = {k: 0 for k in self.budgets}
+        for i in order.tolist():
+            if batch and any(total[k] + self.sizes[k][i] > b for k, b in self.budgets.items()):
+                batches.append(batch)
+                batch, total = [], {k: 0 for k in self.budgets}
+            # a graph larger than the budget makes a batch by itself
+            batch.append(i)
+            for k in self.budgets:
+                total[k] += int(self.sizes[k][i])
+        if batch:
+            batches.append(batch)
+
+        if self.shuffle:
+            batches = [batches[j] for j in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self) -> Iterator[list[int]]:
+        yield from self._batches()
+
+    def __len__(self) -> int:
+        return len(self._batches())
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+
+import numpy as np
+import torch
+from numpy import ndarray
+from torch import Tensor
+from torch_geometric.data import Dataset
+
+from .keys import GraphKeys
+from .utils import get_worker_dataset, init_dataset_worker
+
+
+class PropertyStatistics:
+    """Accumulator of the statistics of a graph property, which fits the atom
+    reference values and the mean value used by
+    `lcaonet.nn.post.PostProcess`.
+
+    Only the moments of the element counts and the property are accumulated, so the memory usage
+    does not depend on the number of graphs, and the accumulators of different parts of a dataset
+    can be merged. The atom reference values are fitted by least squares through the normal equations.
+
+    If `is_extensive=True`, the property is modeled as the sum of the atom reference values, and the
+    mean and std are those of the residual per atom. Otherwise, the property is modeled as the mean of
+    the atom reference values, and the mean and std are those of the residual.
+    """
+
+    def __init__(self, max_z: int, out_dim: int, is_extensive: bool = True):
+        """
+        Args:
+            max_z (int): the maximum atomic number.
+            out_dim (int): the dimension of the property.
+            is_extensive (bool, optional): whether the property is extensive or not. Defaults to `True`.
+        """
+        self.max_z = max_z
+        self.out_dim = out_dim
+        self.is_extensive = is_extensive
+        self.n_graphs = 0
+        n = max_z + 1
+        # moments of the features f (element counts, or fractions if intensive) and the property y
+        self.ff = np.zeros((n, n))
+        self.fy = np.zeros((n, out_dim))
+        # moments scaled by the number of atoms s (or 1 if intensive) for the mean and std
+        self.f_s = np.zeros(n)
+        self.y_s = np.zeros(out_dim)
+        self.ff_s2 = np.zeros((n, n))
+        self.fy_s2 = np.zeros((n, out_dim))
+        self.yy_s2 = np.zeros(out_dim)
+
+    def update(self, counts: ndarray, y: ndarray):
+        """Add the graphs to the statistics.
+
+        Args:
+            counts (numpy.ndarray): the number of atoms of each element with (B, max_z + 1) shape.
+            y (numpy.ndarray): the property values with (B, out_dim) shape.
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64).reshape(len(counts), self.out_dim)
+        n_atoms = counts.sum(axis=1, keepdims=True)
+        f = counts if self.is_extensive else counts / n_atoms
+        s = n_atoms if self.is_extensive else np.ones_like(n_atoms)
+
+        self.n_graphs += len(counts)
+        self.ff += f.T @ f
+        self.fy += f.T @ y
+        self.f_s += (f / s).sum(axis=0)
+        self.y_s += (y / s).sum(axis=0)
+        self.ff_s2 += (f / s**2).T @ f
+        self.fy_s2 += (f / s**2).T @ y
+        self.yy_s2 += (y**2 / s**2).sum(axis=0)
+
+    def merge(self, other: PropertyStatistics) -> PropertyStatistics:
+        """Merge the statistics of another part of the dataset.
+
+        Args:
+            other (PropertyStatistics): the statistics with the same settings.
+
+        Returns:
+            PropertyStatistics: the merged statistics.
+        """
+        if (self.max_z, self.out_dim, self.is_extensive) != (other.max_z, other.out_dim, other.is_extensive):
+            raise ValueError("The statistics with different settings cannot be merged.")
+        self.n_graphs += other.n_graphs
+        for k in ["ff", "fy", "f_s", "y_s", "ff_s2", "fy_s2", "yy_s2"]:
+            setattr(self, k, getattr(self, k) + getattr(other, k))
+        return self
+
+    def fit_atomref(self) -> Tensor:
+        """Fit the atom reference values by least squares.
+
+        Returns:
+            torch.Tensor: the atom reference values with (max_z + 1, out_dim) shape.
+                The values of the elements which do not appear in the dataset are zero.
+        """
+        atomref = np.zeros((self.max_z + 1, self.out_dim))
+        species = np.nonzero(np.diag(self.ff) > 0)[0]
+        if len(species) > 0:
+            # lstsq gives the minimum norm solution if the compositions are linearly dependent
+            atomref[species] = np.linalg.lstsq(self.ff[np.ix_(species, species)], self.fy[species], rcond=None)[0]
+        return torch.tensor(atomref, dtype=torch.float32)
+
+    def mean_std(self, atomref: Tensor | None = None) -> tuple[Tensor, Tensor]:
+        """Calculate the mean and std of the property after subtracting the
+        atom reference values.
+
+        Args:
+            atomref (torch.Tensor | None, optional): the atom reference values with (max_z + 1, out_dim) shape. Defaults to `None`.
+
+        Returns:
+            mean (torch.Tensor): the mean value with (out_dim) shape, per atom if `is_extensive=True`.
+            std (torch.Tensor): the standard deviation with (out_dim) shape, per atom if `is_extensive=True`.
+        """  # noqa: E501
+        if self.n_graphs == 0:
+            raise ValueError("No graph is added to the statistics.")
+        a = np.zeros((self.max_z + 1, self.out_dim)) if atomref is None else atomref.double().cpu().numpy()
+        # moments of the residual u = (y - f @ a) / s
+        sum_u = self.y_s - self.f_s @ a
+        sum_u2 = self.yy_s2 - 2 * (a * self.fy_s2).sum(axis=0) + (a * (self.ff_s2 @ a)).sum(axis=0)
+        mean = sum_u / self.n_graphs
+        var = np.maximum(sum_u2 / self.n_graphs - mean**2, 0.0)
+        return torch.tensor(mean, dtype=torch.float32), torch.tensor(np.sqrt(var), dtype=torch.float32)
+
+
+def _chunk_statistics(args: tuple[int, int, str, int, int, bool]) -> PropertyStatistics:
+    start, stop, key, max_z, out_dim, is_extensive = args
+    return _collect_statistics(get_worker_dataset(), start, stop, key, max_z, out_dim, is_extensive)
+
+
+def _collect_statistics(
+    dataset: Dataset, start: int, stop: int, key: str, max_z: int, out_dim: int, is_extensive: bool
+) -> PropertyStatistics:
+    counts = np.zeros((stop - start, max_z + 1), dtype=np.int64)
+    y = np.zeros((stop - start, out_dim))
+    for i in range(start, stop):
+        data = dataset[i]
+        z = data[GraphKeys.Z].numpy()
+        if z.max() > max_z:
+            raise ValueError(f"The atomic number {z.max()} of the graph {i} is larger than max_z={max_z}.")
+        counts[i - start] = np.bincount(z, minlength=max_z + 1)
+        y[i - start] = data[key].reshape(-1).numpy()
+    stats = PropertyStatistics(max_z, out_dim, is_extensive)
+    stats.update(counts, y)
+    return stats
+
+
+def dataset_statistics(
+    dataset: Dataset,
+    key: str,
+    max_z: int,
+    is_extensive: bool = True,
+    fit_atomref: bool = True,
+    n_workers: int = 1,
+    chunksize: int = 1024,
+) -> dict[str, Tensor | None]:
+    """Calculate the atom reference values, mean and std of a property in a
+    single pass over the dataset.
+
+    The dataset is processed in chunks of `chunksize` graphs, in parallel if `n_workers > 1`.
+    The results can be passed to the model as `LCAONet(atomref=stats["atomref"], mean=stats["mean"])`.
+
+    Args:
+        dataset (torch_geometric.data.Dataset): the dataset, e.g. `GraphDataset`.
+        key (str): the key of the property, e.g. `"energy"`.
+        max_z (int): the maximum atomic number.
+        is_extensive (bool, optional): whether the property is extensive or not. Defaults to `True`.
+        fit_atomref (bool, optional): whether to fit the atom reference values. Defaults to `True`.
+        n_workers (int, optional): the number of worker processes. Defaults to `1`.
+        chunksize (int, optional): the number of graphs processed at once. Defaults to `1024`.
+
+    Returns:
+        stats (dict[str, torch.Tensor | None]): `atomref` with (max_z + 1, out_dim) shape, or `None` if `fit_atomref=False`,
+            and `mean` and `std` with (out_dim) shape, which are per atom if `is_extensive=True`.
+    """  # noqa: E501
+    if len(dataset) == 0:
+        raise ValueError("The dataset is empty.")
+    if n_workers < 1:
+        raise ValueError(f"n_workers={n_workers} must be positive.")
+    out_dim = dataset[0][key].numel()
+    chunks = [
+        (start, min(start + chunksize, len(dataset)), key, max_z, out_dim, is_extensive)
+        for start in range(0, len(dataset), chunksize)
+    ]
+
+    stats = PropertyStatistics(max_z, out_dim, is_extensive)
+    if n_workers == 1:
+        for c in chunks:
+            stats.merge(_collect_statistics(dataset, *c))
+    else:
+        with mp.get_context().Pool(n_workers, initializer=init_dataset_worker, initargs=(dataset,)) as pool:
+            for s in pool.imap(_chunk_statistics, chunks):
+                stats.merge(s)
+
+    atomref = stats.fit_atomref() if fit_atomref else None
+    mean, std = stats.mean_std(atomref)
+    return {"atomref": atomref, "mean": mean, "std": std}
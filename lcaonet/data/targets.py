@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+from typing import BinaryIO
+
+import numpy as np
+import torch
+from numpy import ndarray
+from torch import Tensor
+
+TARGETS_DIR = "targets"
+
+
+class TargetWriter:
+    """Appender of the columnar target store read by `TargetStore`.
+
+    Each key of the targets is stored in `targets/` as three files:
+    `{key}.json` with the dtype and shape, `{key}.bin` with the values of all graphs
+    concatenated along the first dimension, and `{key}.rows.bin` with the graph index
+    and the length of each row as int64 pairs. The values are written before the row,
+    and both are flushed, so a conversion can be interrupted at any time. Rows may be
+    written in any order and a graph may lack some keys.
+    """
+
+    def __init__(self, save_dir: str | pathlib.Path):
+        """
+        Args:
+            save_dir (str | pathlib.Path): the directory of the converted dataset.
+        """
+        self.target_dir = pathlib.Path(save_dir) / TARGETS_DIR
+        self._meta: dict[str, dict] = {k: _read_meta(self.target_dir, k) for k in _target_keys(self.target_dir)}
+        self._files: dict[str, tuple[BinaryIO, BinaryIO]] = {}
+
+    def __enter__(self) -> TargetWriter:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, idx: int, targets: dict[str, ndarray]):
+        """Append the targets of one graph.
+
+        Args:
+            idx (int): the index of the graph.
+            targets (dict[str, numpy.ndarray]): the target values of the graph.
+        """
+        for k, v in targets.items():
+            arr = v.reshape(1) if v.ndim == 0 else v
+            if k not in self._meta:
+                self.target_dir.mkdir(exist_ok=True)
+                self._meta[k] = {"dtype": arr.dtype.str, "shape": list(arr.shape[1:]), "ndim": v.ndim}
+                with open(self.target_dir / f"{k}.json", "w") as f:
+                    json.dump(self._meta[k], f)
+            meta = self._meta[k]
+            if arr.dtype.str != meta["dtype"] or list(arr.shape[1:]) != meta["shape"] or v.ndim != meta["ndim"]:
+                raise ValueError(f"dtype or shape of {k} of graph {idx} differ from those of the stored targets.")
+            if k not in self._files:
+                _repair(self.target_dir, k, meta)
+                self._files[k] = (
+                    open(self.target_dir / f"{k}.bin", "ab"),
+                    open(self.target_dir / f"{k}.rows.bin", "ab"),
+                )
+            values, rows = self._files[k]
+            values.write(np.ascontiguousarray(arr).tobytes())
+            values.flush()
+            rows.write(np.array([idx, arr.shape[0]], dtype=np.int64).tobytes())
+            rows.flush()
+
+    def close(self):
+        for values, rows in self._files.values():
+            values.close()
+            rows.close()
+        self._files = {}
+
+
+class TargetStore:
+    """Reader of the columnar target store written by the data converters
+    with `target_store=True`.
+
+    The values are memory-mapped, so the targets of all graphs can be read
+    without opening any graph file.
+    """
+
+    def __init__(self, save_dir: str | pathlib.Path):
+        """
+        Args:
+            save_dir (str | pathlib.Path): the directory of the converted dataset.
+        """
+        self.target_dir = pathlib.Path(save_dir) / TARGETS_DIR
+        if not self.target_dir.exists():
+            raise FileNotFoundError(f"{self.target_dir} does not exist.")
+        self.keys = _target_keys(self.target_dir)
+        self._meta = {k: _read_meta(self.target_dir, k) for k in self.keys}
+        self._row: dict[str, ndarray] = {}
+        self._ptr: dict[str, ndarray] = {}
+        for k in self.keys:
+            rows = _read_rows(self.target_dir, k)
+            ptr = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(rows[:, 1], out=ptr[1:])
+            # the row of each graph, or -1 if missing. A graph written twice by a resumed conversion takes the last row
+            row = np.full(rows[:, 0].max(initial=-1) + 1, -1, dtype=np.int64)
+            idx, last = np.unique(rows[::-1, 0], return_index=True)
+            row[idx] = len(rows) - 1 - last
+            self._row[k] = row
+            self._ptr[k] = ptr
+        # opened lazily in each process
+        self._values: dict[str, ndarray] | None = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_values"] = None
+        return state
+
+    def _open(self) -> dict[str, ndarray]:
+        values = {}
+        for k in self.keys:
+            meta = self._meta[k]
+            shape = (int(self._ptr[k][-1]), *meta["shape"])
+            if shape[0] == 0:
+                values[k] = np.zeros(shape, dtype=meta["dtype"])
+            else:
+                values[k] = np.memmap(self.target_dir / f"{k}.bin", dtype=meta["dtype"], mode="r", shape=shape)
+        return values
+
+    def has(self, idx: int, key: str) -> bool:
+        row = self._row[key]
+        return idx < row.shape[0] and row[idx] >= 0
+
+    def get(self, idx: int) -> dict[str, Tensor]:
+        """Get the targets of one graph.
+
+        Args:
+            idx (int): the index of the graph.
+
+        Returns:
+            dict[str, torch.Tensor]: the target values of the graph, with the same dtype and shape as `set_properties` gives.
+        """  # noqa: E501
+        if self._values is None:
+            self._values = self._open()
+        targets = {}
+        for k in self.keys:
+            if not self.has(idx, k):
+                continue
+            r = self._row[k][idx]
+            val = torch.from_numpy(np.array(self._values[k][self._ptr[k][r] : self._ptr[k][r + 1]]))
+            targets[k] = val.reshape(()) if self._meta[k]["ndim"] == 0 else val
+        return targets
+
+    def column(self, key: str, indices: ndarray | list[int] | None = None) -> ndarray:
+        """Get the values of a key of many graphs at once.
+
+        Args:
+            key (str): the key of the target.
+            indices (numpy.ndarray | list[int] | None, optional): the indices of the graphs. Defaults to `None` (all graphs which have the key).
+
+        Returns:
+            numpy.ndarray: the values with (n_graphs, ...) shape. The keys whose length differs among graphs, e.g. forces, are not supported.
+        """  # noqa: E501
+        if self._values is None:
+            self._values = self._open()
+        row = self._row[key]
+        if indices is None:
+            indices = np.nonzero(row >= 0)[0]
+        indices = np.asarray(indices, dtype=np.int64)
+        if np.any(indices >= row.shape[0]) or np.any(row[indices[indices < row.shape[0]]] < 0):
+            raise KeyError(f"some of the graphs do not have {key}.")
+        lengths = np.diff(self._ptr[key])
+        if lengths.size > 0 and np.any(lengths != lengths[0]):
+            raise ValueError(f"The length of {key} differs among the graphs. Please use `get` instead.")
+        meta = self._meta[key]
+        length = int(lengths[0]) if lengths.size > 0 else 1
+        values = np.asarray(self._values[key]).reshape(-1, length, *meta["shape"])[row[indices]]
+        return values.reshape(len(indices), *meta["shape"]) if meta["ndim"] == 0 else values
+
+
+def _target_keys(target_dir: pathlib.Path) -> list[str]:
+    return sorted(p.name[: -len(".json")] for p in target_dir.glob("*.json"))
+
+
+def _read_meta(target_dir: pathlib.Path, key: str) -> dict:
+    with open(target_dir / f"{key}.json") as f:
+        return json.load(f)
+
+
+def _read_rows(target_dir: pathlib.Path, key: str) -> ndarray:
+    path = target_dir / f"{key}.rows.bin"
+    if not path.exists():
+        return np.zeros((0, 2), dtype=np.int64)
+    rows = np.fromfile(path, dtype=np.int64)
+    # a row incompletely written by an interrupted conversion is ignored
+    rows = rows[: rows.shape[0] // 2 * 2].reshape(-1, 2)
+    values_path = target_dir / f"{key}.bin"
+    n_bytes = values_path.stat().st_size if values_path.exists() else 0
+    n_values = n_bytes // max(_value_bytes(_read_meta(target_dir, key)), 1)
+    n_rows = int(np.searchsorted(np.cumsum(rows[:, 1]), n_values, side="right"))
+    return rows[:n_rows]
+
+
+def _value_bytes(meta: dict) -> int:
+    # the size of one value along the first dimension
+    return np.dtype(meta["dtype"]).itemsize * int(np.prod(meta["shape"], dtype=np.int64))
+
+
+def _repair(target_dir: pathlib.Path, key: str, meta: dict):
+    # truncate the files to the last complete row, so that appended rows are aligned
+    rows = _read_rows(target_dir, key)
+    row_bytes = _value_bytes(meta)
+    for name, size in [(f"{key}.rows.bin", rows.nbytes), (f"{key}.bin", int(rows[:, 1].sum()) * row_bytes)]:
+        path = target_dir / name
+        if path.exists() and path.stat().st_size != size:
+            os.truncate(path, size)
@@ -1,10 +1,41 @@
 from __future__ import annotations
 
+import copy
+import hashlib
+
+import ase
 import numpy as np
 import torch
 from numpy import ndarray
 from torch import Tensor
-from torch_geometric.data import Data
+from torch_geometric.data import Data, Dataset
+
+from .keys import GraphKeys
+
+
+class GraphData(Data):
+    """`torch_geometric.data.Data` which also increments the precomputed
+    triplet indices in batch processing."""
+
+    def __inc__(self, key: str, value, *args, **kwargs):
+        if key == GraphKeys.Idx_k_3b:
+            return self.num_nodes
+        if key in (GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b):
+            return self[GraphKeys.Edge_idx].size(1)
+        return super().__inc__(key, value, *args, **kwargs)
+
+
+def data_keys(data: Data) -> list[str]:
+    """The attribute names of the graph data, since `keys` is a method in
+    torch_geometric>=2.4 and a property before.
+
+    Args:
+        data (torch_geometric.data.Data): the graph data or batch.
+
+    Returns:
+        list[str]: the attribute names.
+    """
+    return list(data.keys() if callable(data.keys) else data.keys)
 
 
 def full_linked_graph(n_nodes: int) -> tuple[ndarray, ndarray]:
@@ -20,6 +51,354 @@ def full_linked_graph(n_nodes: int) -> tuple[ndarray, ndarray]:
     return ind.T, shift
 
 
+def nearest_neighbors(edge_src: ndarray, dist: ndarray, cutoff: float, max_neighbors: int) -> ndarray:
+    """Select the `max_neighbors` nearest edges of each center atom within the
+    cutoff radius.
+
+    Ties in distance are broken by the order of the input edges. The per-atom loop used before
+    sorted the distances with the unstable `numpy.argsort`, so in symmetric structures such as
+    pristine crystals, where the distances of periodic images tie, the order of the tied edges and,
+    if `max_neighbors` truncates a tie, the selected edges may differ from those of the loop. The
+    distances of the selected neighbors of each atom are the same.
+
+    Args:
+        edge_src (numpy.ndarray): the index of the center atom of each edge with (E) shape.
+        dist (numpy.ndarray): the distance of each edge with (E) shape.
+        cutoff (float): the cutoff radius.
+        max_neighbors (int): the maximum number of neighbors of each center atom.
+
+    Returns:
+        numpy.ndarray: the indices of the selected edges, ordered by center atom and then by distance.
+    """
+    in_cutoff = np.nonzero(dist <= cutoff)[0]
+    # stable sort by (center, distance), so ties keep the order of the input edges
+    order = in_cutoff[np.lexsort((dist[in_cutoff], edge_src[in_cutoff]))]
+    src_sorted = edge_src[order]
+    # rank of each edge in the neighborhood of its center atom
+    rank = np.arange(order.shape[0]) - np.searchsorted(src_sorted, src_sorted, side="left")
+    return order[rank < max_neighbors]
+
+
+def count_triplets(edge_index: ndarray, n_nodes: int) -> int:
+    """Count the triplets that `LCAONet.get_triplets` makes from the graph.
+
+    Each edge (s -> t) makes one triplet with every edge (k -> s), except itself.
+
+    Args:
+        edge_index (numpy.ndarray): the edge index with (2, E) shape, order is "source_to_target".
+        n_nodes (int): the number of nodes.
+
+    Returns:
+        int: the number of triplets.
+    """
+    edge_src, edge_dst = edge_index
+    in_degree = np.bincount(edge_dst, minlength=n_nodes)
+    return int(in_degree[edge_src].sum() - (edge_src == edge_dst).sum())
+
+
+def atoms_hash(atoms: ase.Atoms) -> str:
+    """Hash the content of a structure, i.e. the atomic numbers, positions,
+    cell, pbc and `atoms.info`.
+
+    Args:
+        atoms (ase.Atoms): the atoms object.
+
+    Returns:
+        str: the hex digest of the content.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(atoms.numbers, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(atoms.positions, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(atoms.cell.array, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(atoms.pbc, dtype=bool).tobytes())
+    for k in sorted(atoms.info):
+        v = atoms.info[k]
+        h.update(k.encode())
+        if isinstance(v, Tensor):
+            v = v.detach().cpu().numpy()
+        if isinstance(v, ndarray):
+            h.update(f"{v.dtype.str}{v.shape}".encode())
+            h.update(np.ascontiguousarray(v).tobytes())
+        else:
+            h.update(repr(v).encode())
+    return h.hexdigest()
+
+
+def structure_fingerprint(atoms: ase.Atoms, tol: float = 1e-3) -> str:
+    """Fingerprint of a structure which does not depend on the order of the
+    atoms, the periodic images of the atoms, and small differences of the
+    positions.
+
+    The fractional positions are wrapped along the periodic axes and rounded to `tol`, and sorted
+    with the atomic numbers. The cell is rounded to `tol` in angstrom. Along the non-periodic axes,
+    the positions are rounded in the units of the cell vectors, or in angstrom if the cell vector is zero.
+    Note that two structures may have different fingerprints if their positions are close to a rounding
+    boundary, so only the exact or near-exact duplicates are detected.
+
+    Args:
+        atoms (ase.Atoms): the atoms object.
+        tol (float, optional): the tolerance of the fractional positions and the cell. Defaults to `1e-3`.
+
+    Returns:
+        str: the hex digest of the fingerprint.
+    """  # noqa: E501
+    n_grid = max(int(round(1 / tol)), 1)
+    pbc = np.asarray(atoms.pbc, dtype=bool)
+    frac = atoms.cell.complete().scaled_positions(atoms.positions)
+    grid = np.round(frac * n_grid).astype(np.int64)
+    grid[:, pbc] %= n_grid
+    rows = np.concatenate([atoms.numbers.astype(np.int64)[:, None], grid], axis=1)
+    rows = rows[np.lexsort(rows.T[::-1])]
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(rows).tobytes())
+    h.update(np.round(atoms.cell.array / tol).astype(np.int64).tobytes())
+    h.update(pbc.tobytes())
+    return h.hexdigest()
+
+
+def spatial_order(atoms: ase.Atoms, bits: int = 21) -> ndarray:
+    """Order the atoms along the Morton (Z-order) curve of the fractional
+    positions, so that atoms close in space get close indices.
+
+    The fractional positions are wrapped along the periodic axes, scaled to [0, 1] along the
+    non-periodic axes, and quantized to `2**bits` points per axis.
+
+    Args:
+        atoms (ase.Atoms): the atoms object.
+        bits (int, optional): the number of bits per axis, at most `21`. Defaults to `21`.
+
+    Returns:
+        numpy.ndarray: the original indices of the atoms in the new order.
+    """
+    if not 0 < bits <= 21:
+        raise ValueError(f"bits={bits} must be in [1, 21].")
+    pbc = np.asarray(atoms.pbc, dtype=bool)
+    frac = atoms.cell.complete().scaled_positions(atoms.positions)
+    frac[:, pbc] %= 1.0
+    lo, hi = frac.min(axis=0), frac.max(axis=0)
+    scale = np.where(pbc, 1.0, np.maximum(hi - lo, 1e-12))
+    frac = np.where(pbc, frac, (frac - lo) / scale)
+    n_grid = 1 << bits
+    grid = np.clip((frac * n_grid).astype(np.int64), 0, n_grid - 1).astype(np.uint64)
+
+    code = np.zeros(len(atoms), dtype=np.uint64)
+    for axis in range(3):
+        code |= _spread_bits(grid[:, axis]) << np.uint64(2 - axis)
+    return np.argsort(code, kind="stable")
+
+
+def _spread_bits(x: ndarray) -> ndarray:
+    # insert two zero bits between the bits of 21-bit integers
+    x = x & np.uint64(0x1FFFFF)
+    x = (x | x << np.uint64(32)) & np.uint64(0x1F00000000FFFF)
+    x = (x | x << np.uint64(16)) & np.uint64(0x1F0000FF0000FF)
+    x = (x | x << np.uint64(8)) & np.uint64(0x100F00F00F00F00F)
+    x = (x | x << np.uint64(4)) & np.uint64(0x10C30C30C30C30C3)
+    x = (x | x << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return x
+
+
+def restore_atom_order(values: Tensor, graph: Data) -> Tensor:
+    """Put the per-atom values, e.g. forces, of the graphs converted with
+    `reorder_atoms=True` back in the order of the original structures.
+
+    Args:
+        values (torch.Tensor): the per-atom values with (N, ...) shape in the order of the graph.
+        graph (torch_geometric.data.Data): the graph or the batch of the graphs.
+
+    Returns:
+        torch.Tensor: the values in the original order. The values are returned as they are if the atoms are not reordered.
+    """  # noqa: E501
+    atom_idx = graph.get(GraphKeys.Atom_idx)
+    if atom_idx is None:
+        return values
+    atom_idx = atom_idx.to(values.device)
+    batch_idx = graph.get(GraphKeys.Batch_idx)
+    if batch_idx is not None:
+        # the atoms of each graph are contiguous in the batch
+        counts = torch.bincount(batch_idx)
+        atom_idx = atom_idx + (torch.cumsum(counts, dim=0) - counts)[batch_idx]
+    out = torch.empty_like(values)
+    out[atom_idx] = values
+    return out
+
+
+def get_triplets(edge_index: ndarray, n_nodes: int) -> tuple[ndarray, ndarray, ndarray]:
+    """Make the triplet indices in the same way as `LCAONet.get_triplets`.
+
+    Each edge (s -> t) makes one triplet with every edge (k -> s), except itself.
+
+    Args:
+        edge_index (numpy.ndarray): the edge index with (2, E) shape, order is "source_to_target".
+        n_nodes (int): the number of nodes.
+
+    Returns:
+        idx_k (numpy.ndarray): the index of atom k of (n_triplets) shape.
+        edge_idx_ks (numpy.ndarray): the edge index of k to s of (n_triplets) shape.
+        edge_idx_st (numpy.ndarray): the edge index of s to t of (n_triplets) shape.
+    """
+    edge_src, edge_dst = edge_index
+    # edges sorted by (target, source) and the pointer of each target atom
+    perm = np.lexsort((edge_src, edge_dst))
+    ptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_dst, minlength=n_nodes), out=ptr[1:])
+
+    # the edges (k -> s) of each edge (s -> t)
+    n_ks = ptr[edge_src + 1] - ptr[edge_src]
+    edge_idx_st = np.repeat(np.arange(edge_src.shape[0]), n_ks)
+    offset = np.arange(edge_idx_st.shape[0]) - np.repeat(np.cumsum(n_ks) - n_ks, n_ks)
+    edge_idx_ks = perm[np.repeat(ptr[edge_src], n_ks) + offset]
+
+    mask = edge_idx_ks != edge_idx_st
+    edge_idx_ks, edge_idx_st = edge_idx_ks[mask], edge_idx_st[mask]
+    return edge_src[edge_idx_ks], edge_idx_ks, edge_idx_st
+
+
+def encode_graphdata(data: Data, half_edges: bool = False) -> Data:
+    """Encode the graph compactly for storage: the shifts to int8 and the
+    indices to int32. Positions and lattice are kept as float32.
+
+    Args:
+        data (torch_geometric.data.Data): the graph data.
+        half_edges (bool, optional): whether to store only one direction of each edge.
+            The graph is stored with both directions if the edges are not symmetric,
+            which can happen when the neighbors are truncated by `max_neighbors`. Defaults to `False`.
+
+    Returns:
+        data (torch_geometric.data.Data): the encoded graph data.
+    """
+    edge_index = data[GraphKeys.Edge_idx].numpy()
+    edge_shift = data[GraphKeys.Edge_shift].numpy().round().astype(np.int64)
+    if np.abs(edge_shift).max(initial=0) > np.iinfo(np.int8).max:
+        raise ValueError("edge_shift is too large to be encoded as int8.")
+    if half_edges and data.get(GraphKeys.Idx_k_3b) is not None:
+        raise ValueError("half_edges cannot be used with the precomputed triplets.")
+
+    reverse = _reverse_edges(edge_index, edge_shift) if half_edges else None
+    half = reverse is not None
+    if half:
+        edge_src, edge_dst = edge_index
+        # keep (s -> t) with s < t, and self images with positive shift
+        sign = np.sign(edge_shift) @ np.array([4, 2, 1])
+        keep = np.nonzero((edge_src < edge_dst) | ((edge_src == edge_dst) & (sign > 0)))[0]
+        edge_index, edge_shift = edge_index[:, keep], edge_shift[keep]
+        # the positions of the kept edges and their reverses to restore the original order
+        data[GraphKeys.Edge_order] = torch.from_numpy(np.stack([keep, reverse[keep]], axis=1).astype(np.int32))
+    data[GraphKeys.Edge_idx] = torch.from_numpy(edge_index.astype(np.int32))
+    data[GraphKeys.Edge_shift] = torch.from_numpy(edge_shift.astype(np.int8))
+    data[GraphKeys.Edge_half] = torch.tensor([half])
+    for k in [GraphKeys.Idx_k_3b, GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b]:
+        if data.get(k) is not None:
+            data[k] = data[k].to(torch.int32)
+    return data
+
+
+def decode_graphdata(data: Data) -> Data:
+    """Decode the graph encoded by `encode_graphdata`. Graphs which are not
+    encoded are returned as they are.
+
+    The edges of the graph stored with one direction are expanded to both directions,
+    and put back in the original order, so that the decoded graph is the same as the graph before encoding.
+
+    Args:
+        data (torch_geometric.data.Data): the encoded graph data.
+
+    Returns:
+        data (torch_geometric.data.Data): the graph data with int64 indices and float32 shifts.
+    """
+    half = data.get(GraphKeys.Edge_half)
+    if half is None:
+        return data
+    # shallow copy not to modify the graph kept in memory
+    data = copy.copy(data)
+    del data[GraphKeys.Edge_half]
+
+    edge_index = data[GraphKeys.Edge_idx].long()
+    edge_shift = data[GraphKeys.Edge_shift].float()
+    if bool(half.any()):
+        order = data[GraphKeys.Edge_order].long()
+        del data[GraphKeys.Edge_order]
+        position = torch.cat([order[:, 0], order[:, 1]])
+        half_index, half_shift = edge_index, edge_shift
+        edge_index = torch.empty((2, position.size(0)), dtype=half_index.dtype)
+        edge_index[:, position] = torch.cat([half_index, half_index.flip(0)], dim=1)
+        edge_shift = torch.empty((position.size(0), 3), dtype=half_shift.dtype)
+        edge_shift[position] = torch.cat([half_shift, -half_shift], dim=0)
+    data[GraphKeys.Edge_idx] = edge_index
+    data[GraphKeys.Edge_shift] = edge_shift
+    for k in [GraphKeys.Idx_k_3b, GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b]:
+        if data.get(k) is not None:
+            data[k] = data[k].long()
+    return data
+
+
+def restrict_graphdata(data: Data, cutoff: float, max_neighbors: int) -> Data:
+    """Make the graph of a smaller cutoff radius and fewer neighbors from the
+    graph converted with a larger cutoff radius and more neighbors.
+
+    The graph is the same as that converted with `cutoff` and `max_neighbors` directly, since
+    `atoms2graphdata` orders the edges by the source atom and then by distance, and the nearest
+    neighbors within the smaller cutoff radius are the first ones of each source atom.
+
+    Args:
+        data (torch_geometric.data.Data): the decoded graph data converted with the larger cutoff radius.
+        cutoff (float): the cutoff radius, which must not be larger than that of the conversion.
+        max_neighbors (int): the maximum number of neighbors, which must not be larger than that of the conversion.
+
+    Returns:
+        data (torch_geometric.data.Data): the graph data with the selected edges.
+    """  # noqa: E501
+    if data.get(GraphKeys.Edge_half) is not None:
+        raise ValueError("The graph must be decoded by decode_graphdata first.")
+    edge_index = data[GraphKeys.Edge_idx].numpy()
+    edge_shift = data[GraphKeys.Edge_shift].numpy()
+    pos = data[GraphKeys.Pos].numpy().astype(np.float64)
+    lattice = data[GraphKeys.Lattice].numpy().reshape(3, 3).astype(np.float64)
+    edge_src, edge_dst = edge_index
+    dist = np.linalg.norm(pos[edge_dst] - pos[edge_src] + edge_shift.astype(np.float64) @ lattice, axis=1)
+
+    if np.all(dist > cutoff):
+        # make fully linked graph as atoms2graphdata does
+        edge_index, edge_shift = full_linked_graph(pos.shape[0])
+    elif np.all(edge_src[1:] >= edge_src[:-1]):
+        # the edges are already ordered by (source, distance), so the rank needs no sort
+        rank = np.arange(edge_src.shape[0]) - np.searchsorted(edge_src, edge_src, side="left")
+        keep = np.nonzero((dist <= cutoff) & (rank < max_neighbors))[0]
+        edge_index, edge_shift = edge_index[:, keep], edge_shift[keep]
+    else:
+        keep = nearest_neighbors(edge_src, dist, cutoff, max_neighbors)
+        edge_index, edge_shift = edge_index[:, keep], edge_shift[keep]
+
+    # shallow copy not to modify the graph kept in memory
+    data = copy.copy(data)
+    data[GraphKeys.Edge_idx] = torch.from_numpy(np.ascontiguousarray(edge_index))
+    data[GraphKeys.Edge_shift] = torch.from_numpy(np.ascontiguousarray(edge_shift))
+    data[GraphKeys.Neighbors] = torch.tensor([edge_index.shape[1]])
+    if data.get(GraphKeys.Edge_shift_vec) is not None:
+        del data[GraphKeys.Edge_shift_vec]
+    if data.get(GraphKeys.Idx_k_3b) is not None:
+        idx_k, edge_idx_ks, edge_idx_st = get_triplets(edge_index, pos.shape[0])
+        data[GraphKeys.Idx_k_3b] = torch.from_numpy(idx_k)
+        data[GraphKeys.Edge_idx_ks_3b] = torch.from_numpy(edge_idx_ks)
+        data[GraphKeys.Edge_idx_st_3b] = torch.from_numpy(edge_idx_st)
+    return data
+
+
+def _reverse_edges(edge_index: ndarray, edge_shift: ndarray) -> ndarray | None:
+    # the index of the reverse edge (t -> s, -shift) of every edge (s -> t, shift),
+    # or None if some edges have no reverse edge
+    forward = np.concatenate([edge_index.T, edge_shift], axis=1)
+    backward = np.concatenate([edge_index[::-1].T, -edge_shift], axis=1)
+    forward_perm = np.lexsort(forward.T[::-1])
+    backward_perm = np.lexsort(backward.T[::-1])
+    if not np.array_equal(forward[forward_perm], backward[backward_perm]):
+        return None
+    reverse = np.empty_like(forward_perm)
+    reverse[backward_perm] = forward_perm
+    return reverse
+
+
 def _set_data(
     data: Data,
     k: str,
@@ -65,3 +444,29 @@ def set_properties(
         else:
             raise ValueError(f"Unknown type of {v}")
         _set_data(data, k, v, add_dim=False, add_batch=add_batch, dtype=dtype)
+
+
+# the dataset is sent once to each worker of the pool made with `init_dataset_worker`
+# instead of with every chunk of the indices
+_worker_dataset: Dataset | None = None
+
+
+def init_dataset_worker(dataset: Dataset):
+    """Set the dataset of the process, used as the initializer of
+    `multiprocessing.Pool`.
+
+    Args:
+        dataset (torch_geometric.data.Dataset): the dataset shared by the tasks of the worker.
+    """
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def get_worker_dataset() -> Dataset:
+    """The dataset set by `init_dataset_worker` in the process.
+
+    Returns:
+        torch_geometric.data.Dataset: the dataset of the worker.
+    """
+    assert _worker_dataset is not None
+    return _worker_dataset
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import copy
+import itertools
+
 import torch
 import torch.nn as nn
+from torch import Tensor
 from torch_geometric.data import Batch
 
 from lcaonet.data.keys import GraphKeys
@@ -32,16 +36,233 @@ class BaseMPNN(nn.Module):
         # order is "source_to_traget"
         edge_src, edge_dst = graph[GraphKeys.Edge_idx]
         edge_batch = batch_ind[edge_src]
-        edge_vec = (
-            graph[GraphKeys.Pos][edge_dst]
-            - graph[GraphKeys.Pos][edge_src]
-            + torch.einsum("ni,nij->nj", graph[GraphKeys.Edge_shift], graph[GraphKeys.Lattice][edge_batch]).contiguous()
-        )
+        # the shift vectors may be precomputed in the data loader
+        shift_vec = graph.get(GraphKeys.Edge_shift_vec)
+        if shift_vec is None:
+            shift_vec = torch.einsum(
+                "ni,nij->nj", graph[GraphKeys.Edge_shift], graph[GraphKeys.Lattice][edge_batch]
+            ).contiguous()
+        edge_vec = graph[GraphKeys.Pos][edge_dst] - graph[GraphKeys.Pos][edge_src] + shift_vec
         graph[GraphKeys.Edge_dist] = torch.norm(edge_vec, dim=1)
         if return_vec:
             graph[GraphKeys.Edge_vec_st] = edge_vec / graph[GraphKeys.Edge_dist].unsqueeze(-1)
         return graph
 
+    @staticmethod
+    @torch.no_grad()
+    def calc_radius_graph(graph: Batch, cutoff: float, max_neighbors: int) -> Batch:
+        """calculate the radius graph including periodic images on the fly,
+        equivalent to that made by `lcaonet.data.convert.atoms2graphdata`.
+
+        Args:
+            graph (torch_geometric.data.Batch): material graph batch with positions, lattice and pbc.
+            cutoff (float): the cutoff radius.
+            max_neighbors (int): the maximum number of neighbors of each atom.
+
+        Returns:
+            graph (torch_geometric.data.Batch): material graph batch with edge information:
+                edge_index (torch.Tensor): the edge index of (2, E) shape, order is "source_to_target".
+                edge_shift (torch.Tensor): the periodic image shift of each edge of (E, 3) shape.
+                neighbors (torch.Tensor): the number of edges of each graph of (B) shape.
+        """
+        pos = graph[GraphKeys.Pos]
+        n_nodes = pos.size(0)
+        if graph.get(GraphKeys.Batch_idx) is not None:
+            batch_ind = graph[GraphKeys.Batch_idx]
+            n_graphs = graph[GraphKeys.Lattice].size(0)
+        else:
+            batch_ind = pos.new_zeros(n_nodes, dtype=torch.long)
+            n_graphs = 1
+        ptr = torch.zeros(n_graphs + 1, dtype=torch.long, device=pos.device)
+        ptr[1:] = torch.cumsum(torch.bincount(batch_ind, minlength=n_graphs), dim=0)
+        lattice = graph[GraphKeys.Lattice].reshape(n_graphs, 3, 3)
+        if graph.get(GraphKeys.PBC) is not None:
+            pbc = graph[GraphKeys.PBC].reshape(n_graphs, 3).bool()
+        else:
+            pbc = torch.ones((n_graphs, 3), dtype=torch.bool, device=pos.device)
+
+        edge_index, edge_shift, neighbors = [], [], []
+        for b in range(n_graphs):
+            start, end = int(ptr[b]), int(ptr[b + 1])
+            ei, shift = _radius_graph_pbc(pos[start:end], lattice[b], pbc[b], cutoff, max_neighbors)
+            edge_index.append(ei + start)
+            edge_shift.append(shift)
+            neighbors.append(ei.size(1))
+
+        graph[GraphKeys.Edge_idx] = torch.cat(edge_index, dim=1)
+        graph[GraphKeys.Edge_shift] = torch.cat(edge_shift, dim=0).to(pos.dtype)
+        graph[GraphKeys.Neighbors] = torch.tensor(neighbors, dtype=torch.long, device=pos.device)
+        # triplets and shift vectors made from the previous edges are no longer valid
+        for k in [GraphKeys.Idx_k_3b, GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b, GraphKeys.Edge_shift_vec]:
+            if graph.get(k) is not None:
+                del graph[k]
+        return graph
+
+    @staticmethod
+    def filter_edges(graph: Batch, cutoff: float) -> Batch:
+        """drop the edges beyond the cutoff radius, whose radial basis is
+        zero.
+
+        The precomputed triplets are reindexed to the remaining edges. The input graph is not modified,
+        and it is returned as it is if all edges are within the cutoff radius.
+
+        Args:
+            graph (torch_geometric.data.Batch): material graph batch with the distances calculated by `calc_atomic_distances`.
+            cutoff (float): the cutoff radius.
+
+        Returns:
+            graph (torch_geometric.data.Batch): shallow copy of the material graph batch with the edges within the cutoff radius.
+        """  # noqa: E501
+        keep = graph[GraphKeys.Edge_dist] <= cutoff
+        if bool(keep.all()):
+            return graph
+        edge_id = torch.nonzero(keep).squeeze(-1)
+
+        graph = copy.copy(graph)
+        graph[GraphKeys.Edge_idx] = graph[GraphKeys.Edge_idx][:, edge_id]
+        for k in [GraphKeys.Edge_shift, GraphKeys.Edge_shift_vec, GraphKeys.Edge_dist, GraphKeys.Edge_vec_st]:
+            if graph.get(k) is not None:
+                graph[k] = graph[k][edge_id]
+        if graph.get(GraphKeys.Edge_idx_ks_3b) is not None:
+            # the new index of each remaining edge
+            new_id = torch.cumsum(keep, dim=0) - 1
+            edge_idx_ks, edge_idx_st = graph[GraphKeys.Edge_idx_ks_3b], graph[GraphKeys.Edge_idx_st_3b]
+            tri_id = torch.nonzero(keep[edge_idx_ks] & keep[edge_idx_st]).squeeze(-1)
+            graph[GraphKeys.Idx_k_3b] = graph[GraphKeys.Idx_k_3b][tri_id]
+            graph[GraphKeys.Edge_idx_ks_3b] = new_id[edge_idx_ks[tri_id]]
+            graph[GraphKeys.Edge_idx_st_3b] = new_id[edge_idx_st[tri_id]]
+        return graph
+
     @property
     def n_param(self) -> int:
         return sum(p.numel() for p in self.parameters() if p.requires_grad)
+
+
+def _complete_cell(cell: Tensor) -> Tensor:
+    """Replace the zero vectors of the cell, which ASE allows along non-
+    periodic directions, with orthogonal unit vectors as
+    `ase.cell.Cell.complete` does.
+
+    Args:
+        cell (torch.Tensor): the lattice of (3, 3) shape.
+
+    Returns:
+        torch.Tensor: the completed lattice of (3, 3) shape.
+    """
+    missing = torch.nonzero(~cell.bool().any(dim=1)).squeeze(-1).tolist()
+    if len(missing) == 3:
+        return torch.eye(3, dtype=cell.dtype, device=cell.device)
+    if len(missing) == 2:
+        u, s, vh = torch.linalg.svd(cell.t())
+        s = torch.stack([s[0], torch.ones_like(s[0]), torch.ones_like(s[0])])
+        cell = (u @ torch.diag(s) @ vh).t()
+        if bool(torch.linalg.det(cell) < 0):
+            cell[missing[0]] = -cell[missing[0]]
+    elif len(missing) == 1:
+        i = missing[0]
+        v = torch.linalg.cross(cell[i - 2], cell[i - 1])
+        cell = cell.clone()
+        cell[i] = v / v.norm()
+    return cell
+
+
+def _radius_graph_pbc(
+    pos: Tensor,
+    cell: Tensor,
+    pbc: Tensor,
+    cutoff: float,
+    max_neighbors: int,
+) -> tuple[Tensor, Tensor]:
+    """Make the radius graph of one structure with a cell list.
+
+    The image atoms within the cutoff radius of the cell are put into cubic bins whose size is
+    the cutoff radius, and the neighbors of each atom are searched only in the 27 bins around it,
+    so that the cost scales linearly with the number of atoms.
+
+    Args:
+        pos (torch.Tensor): the positions of (N, 3) shape.
+        cell (torch.Tensor): the lattice of (3, 3) shape.
+        pbc (torch.Tensor): the periodic boundary conditions of (3) shape.
+        cutoff (float): the cutoff radius.
+        max_neighbors (int): the maximum number of neighbors of each atom.
+
+    Returns:
+        edge_index (torch.Tensor): the edge index of (2, E) shape, ordered by source atom and then by distance.
+        edge_shift (torch.Tensor): the periodic image shift of each edge of (E, 3) shape.
+    """
+    device = pos.device
+    n = pos.size(0)
+    # double precision to select the same neighbors as ASE
+    pos = pos.double()
+    cell = cell.double()
+
+    if bool(pbc.any()):
+        inv_cell = torch.linalg.inv(_complete_cell(cell))
+        # wrap the atoms into the cell along periodic directions
+        frac = pos @ inv_cell
+        offset = torch.where(pbc, torch.floor(frac), torch.zeros_like(frac))
+        frac = frac - offset
+        pos = frac @ cell
+        # the distance between the faces of the cell is 1 / |b_i| with reciprocal vectors b_i
+        margin = cutoff * inv_cell.norm(dim=0)
+        n_img = torch.where(pbc, torch.ceil(margin), torch.zeros_like(margin)).long().tolist()
+        shifts = torch.tensor(
+            list(itertools.product(*[range(-m, m + 1) for m in n_img])), dtype=torch.double, device=device
+        )
+        # keep only the image atoms within the cutoff radius of the cell
+        img_frac = frac.unsqueeze(0) + shifts.unsqueeze(1)
+        inside = ((img_frac >= -margin) & (img_frac < 1 + margin)) | ~pbc
+        img_s, img_atom = torch.nonzero(inside.all(dim=-1), as_tuple=True)
+        img_shift = shifts[img_s]
+        img_pos = pos[img_atom] + img_shift @ cell
+    else:
+        offset = torch.zeros_like(pos)
+        img_atom = torch.arange(n, device=device)
+        img_shift = torch.zeros_like(pos)
+        img_pos = pos
+
+    # cell list of the image atoms
+    lo = img_pos.min(dim=0).values
+    img_bin = torch.floor((img_pos - lo) / cutoff).long()
+    n_bin = img_bin.max(dim=0).values + 1
+    img_bin_id = (img_bin[:, 0] * n_bin[1] + img_bin[:, 1]) * n_bin[2] + img_bin[:, 2]
+    bin_id_sorted, order = torch.sort(img_bin_id)
+
+    # the 27 bins around each atom
+    center_bin = torch.floor((pos - lo) / cutoff).long()
+    around = torch.tensor(list(itertools.product(range(-1, 2), repeat=3)), dtype=torch.long, device=device)
+    query_bin = center_bin.unsqueeze(1) + around.unsqueeze(0)  # (N, 27, 3)
+    valid = ((query_bin >= 0) & (query_bin < n_bin)).all(dim=-1)
+    query_id = (query_bin[..., 0] * n_bin[1] + query_bin[..., 1]) * n_bin[2] + query_bin[..., 2]
+    first = torch.searchsorted(bin_id_sorted, query_id.flatten(), right=False)
+    last = torch.searchsorted(bin_id_sorted, query_id.flatten(), right=True)
+    counts = torch.where(valid.flatten(), last - first, torch.zeros_like(first))
+
+    # candidate pairs of the atom and the image atoms in the bins around it
+    src = torch.arange(n, device=device).repeat_interleave(27).repeat_interleave(counts)
+    start = torch.cumsum(counts, 0) - counts
+    within = torch.arange(int(counts.sum()), device=device) - start.repeat_interleave(counts)
+    cand = order[first.repeat_interleave(counts) + within]
+    dist = torch.norm(img_pos[cand] - pos[src], dim=-1)
+    dst = img_atom[cand]
+    shift = img_shift[cand]
+    mask = (dist < cutoff) & ~((dst == src) & (shift == 0).all(dim=-1))
+    src, dst, shift, dist = src[mask], dst[mask], shift[mask], dist[mask]
+
+    if src.size(0) == 0:
+        # make fully linked graph as atoms2graphdata does
+        full = torch.ones((n, n), dtype=torch.bool, device=device).fill_diagonal_(False)
+        edge_index = torch.nonzero(full).t()
+        return edge_index, torch.zeros((edge_index.size(1), 3), dtype=torch.long, device=device)
+
+    # sort by (source, distance) and keep the max_neighbors nearest ones of each atom
+    perm = torch.sort(dist, stable=True).indices
+    perm = perm[torch.sort(src[perm], stable=True).indices]
+    src_sorted = src[perm]
+    rank = torch.arange(perm.size(0), device=device) - torch.searchsorted(src_sorted, src_sorted)
+    perm = perm[rank < max_neighbors]
+    src, dst, shift = src[perm], dst[perm], shift[perm]
+
+    # the shift with respect to the unwrapped positions
+    shift = shift - offset[dst] + offset[src]
+    return torch.stack([src, dst], dim=0), shift.round().long()
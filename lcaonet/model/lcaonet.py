@@ -74,6 +74,24 @@ class LCAOEmbedding(nn.Module):
         return x, cst
 
 
+def _sum_orb_copies(c: Tensor, expand_idx: Tensor, n_basis: int) -> Tensor:
+    """Sum up the coefficient vectors of the copies of each orbital made by
+    `n_per_orb`.
+
+    Args:
+        c (torch.Tensor): the coefficient vectors with (E, n_orb, dim) shape.
+        expand_idx (torch.Tensor): the index of the unique orbital of each orbital with (n_orb) shape.
+        n_basis (int): the number of the unique orbitals.
+
+    Returns:
+        torch.Tensor: the summed coefficient vectors with (E, n_basis, dim) shape.
+    """
+    if c.size(1) == n_basis:
+        # no copies, i.e. n_per_orb=1
+        return c
+    return c.new_zeros((c.size(0), n_basis, c.size(2))).index_add_(1, expand_idx, c)
+
+
 class LCAOInteraction(nn.Module):
     """The layer that performs message-passing of LCAONet."""
 
@@ -133,7 +151,8 @@ class LCAOInteraction(nn.Module):
         cst: Tensor,
         valence_mask: Tensor | None,
         rb: Tensor,
-        shb: Tensor,
+        three_body_orbs: Tensor,
+        expand_idx: Tensor,
         idx_s: Tensor,
         idx_t: Tensor,
         tri_idx_k: Tensor,
@@ -146,8 +165,10 @@ class LCAOInteraction(nn.Module):
             x (torch.Tensor): node embedding vectors with (N, hidden_dim) shape.
             cst (torch.Tensor): coefficient vectors with (E, n_orb, coeffs_dim) shape.
             valence_mask (torch.Tensor | None): valence orbital mask with (E, n_orb, conv_dim) shape.
-            rb (torch.Tensor): the radial basis with (E, n_orb) shape.
-            shb (torch.Tensor): the spherical harmonics basis with (n_triplets, n_orb) shape.
+            rb (torch.Tensor): the radial basis of the unique orbitals with (E, n_basis) shape.
+            three_body_orbs (torch.Tensor): the product of the radial basis of the edge from atom k to s
+                and the spherical harmonics basis of the unique orbitals with (n_triplets, n_basis) shape.
+            expand_idx (torch.Tensor): the index of the unique orbital of each orbital with (n_orb) shape.
             idx_s (torch.Tensor): the indices of the first node of each edge with (E) shape.
             idx_t (torch.Tensor): the indices of the second node of each edge with (E) shape.
             tri_idx_k (torch.Tensor): the indices of the third node of each triplet with (n_triplets) shape.
@@ -170,13 +191,18 @@ class LCAOInteraction(nn.Module):
         cst = self.f_coeffs(cst)
 
         # --- Threebody Message-passing ---
-        cks = cst[edge_idx_ks]
+        # the coefficients of the copies of each orbital are summed up before gathering them to the triplets,
+        # since the copies share the same basis
+        n_basis = rb.size(1)
         if self.add_valence:
-            cks, cks_valence = torch.chunk(cks, 2, dim=-1)
-            cks_valence = cks_valence * valence_mask[edge_idx_ks]  # type: ignore # Since mypy cannot determine that the Valencemask is not None # noqa: E501
+            cks, cks_valence = torch.chunk(cst, 2, dim=-1)
+            cks_valence = cks_valence * valence_mask  # type: ignore # Since mypy cannot determine that the Valencemask is not None # noqa: E501
+            cks_valence = _sum_orb_copies(cks_valence, expand_idx, n_basis)[edge_idx_ks]
+            cks = _sum_orb_copies(cks, expand_idx, n_basis)[edge_idx_ks]
+        else:
+            cks = _sum_orb_copies(cst, expand_idx, n_basis)[edge_idx_ks]
 
         # threebody LCAO weight: summation of all orbitals multiplied by coefficient vectors
-        three_body_orbs = rb[edge_idx_ks] * shb
         three_body_w = torch.einsum("ed,edh->eh", three_body_orbs, cks).contiguous()
         if self.add_valence:
             valence_w = torch.einsum("ed,edh->eh", three_body_orbs, cks_valence).contiguous()
@@ -197,9 +223,9 @@ class LCAOInteraction(nn.Module):
             cst_valence = cst_valence * valence_mask
 
         # twobody LCAO weight: summation of all orbitals multiplied by coefficient vectors
-        lcao_w = torch.einsum("ed,edh->eh", rb, cst).contiguous()
+        lcao_w = torch.einsum("ed,edh->eh", rb, _sum_orb_copies(cst, expand_idx, n_basis)).contiguous()
         if self.add_valence:
-            valence_w = torch.einsum("ed,edh->eh", rb, cst_valence).contiguous()
+            valence_w = torch.einsum("ed,edh->eh", rb, _sum_orb_copies(cst_valence, expand_idx, n_basis)).contiguous()
             lcao_w = lcao_w + valence_w
         lcao_w = F.normalize(lcao_w, dim=-1)
 
@@ -348,6 +374,10 @@ class LCAONet(BaseMPNN):
         mean: Tensor | None = None,
         regress_forces: bool = False,
         direct_forces: bool = True,
+        otf_graph: bool = False,
+        max_neighbors: int = 32,
+        drop_far_edges: bool = True,
+        rbf_max_error: float | None = None,
     ):
         """
         Args:
@@ -372,6 +402,12 @@ class LCAONet(BaseMPNN):
             weight_init (str | None): the name of weight initialization function. Defaults to `"glorotorthogonal"`.
             atomref (torch.Tensor | None): the reference value of the output property with (max_z, out_dim) shape. Defaults to `None`.
             mean (torch.Tensor | None): the mean value of the output property with (out_dim) shape. Defaults to `None`.
+            regress_forces (bool): whether to regress inter atomic forces. Defaults to `False`.
+            direct_forces (bool): whether to regress inter atomic forces directly. Defaults to `True`.
+            otf_graph (bool): whether to make the radius graph from positions, lattice and pbc in the forward calculation. Defaults to `False`.
+            max_neighbors (int): the maximum number of neighbors of each atom of the on-the-fly graph. Defaults to `32`.
+            drop_far_edges (bool): whether to drop the edges beyond the cutoff radius in the message passing, e.g. those of the graphs converted with a larger cutoff radius. Their radial basis is zero, so the outputs do not change in the evaluation mode, while in the training mode the batch normalization of the coefficient vectors uses only the remaining edges. Defaults to `True`.
+            rbf_max_error (float | None): if given, the radial basis is evaluated by the lookup of the cubic spline table whose maximum interpolation error is this value, e.g. for the molecular dynamics. Defaults to `None`.
         """  # noqa: E501
         super().__init__()
         wi: Callable[[Tensor], Tensor] | None = init_resolver(weight_init) if weight_init is not None else None
@@ -388,6 +424,10 @@ class LCAONet(BaseMPNN):
         self.add_valence = add_valence
         self.regress_forces = regress_forces
         self.direct_forces = direct_forces
+        self.otf_graph = otf_graph
+        self.max_neighbors = max_neighbors
+        self.drop_far_edges = drop_far_edges
+        self.rbf_max_error = rbf_max_error
 
         # electron information
         elec_info = ElecInfo(max_z, max_orb, min_orb, n_per_orb)
@@ -395,6 +435,8 @@ class LCAONet(BaseMPNN):
         # basis layers
         cn = cutoffnet_resolver(cutoff_net, cutoff=cutoff)
         self.rbf = rbf_resolver(rbf_type, cutoff=cutoff, elec_info=elec_info, cutoff_net=cn)
+        if rbf_max_error is not None:
+            self.rbf = self.rbf.tabulate(rbf_max_error)
         self.shbf = SphericalHarmonicsBasis(elec_info)
 
         # node and coefficient embedding layers
@@ -497,31 +539,44 @@ class LCAONet(BaseMPNN):
         if self.regress_forces and not self.direct_forces:
             graph[GraphKeys.Pos].requires_grad_(True)
 
+        # make the radius graph without the data conversion
+        if self.otf_graph:
+            graph = BaseMPNN.calc_radius_graph(graph, self.cutoff, self.max_neighbors)
+
         # ---------- Get Graph information ----------
         batch_idx: Tensor | None = graph.get(GraphKeys.Batch_idx)
         z = graph[GraphKeys.Z]
         pos = graph[GraphKeys.Pos]
+
+        # calc atomic distances
+        graph = BaseMPNN.calc_atomic_distances(graph, return_vec=True)
+        # the direct forces are calculated with all edges, since they do not depend on the radial basis
+        out_idx_s, out_idx_t = graph[GraphKeys.Edge_idx]
+        out_edge_vec_st = graph[GraphKeys.Edge_vec_st]
+
+        # drop the edges beyond the cutoff radius, whose messages are zero
+        if self.drop_far_edges:
+            graph = self.filter_edges(graph, self.cutoff)
         # order is "source_to_target" i.e. [index_j, index_i]
         idx_s, idx_t = graph[GraphKeys.Edge_idx]
+        distances = graph[GraphKeys.Edge_dist]
 
-        # get triplets
-        graph = self.get_triplets(graph)
+        # get triplets, unless they are precomputed at the data conversion
+        if graph.get(GraphKeys.Edge_idx_ks_3b) is None:
+            graph = self.get_triplets(graph)
         tri_idx_k = graph[GraphKeys.Idx_k_3b]
         edge_idx_ks = graph[GraphKeys.Edge_idx_ks_3b]
         edge_idx_st = graph[GraphKeys.Edge_idx_st_3b]
 
-        # calc atomic distances
-        graph = BaseMPNN.calc_atomic_distances(graph, return_vec=True)
-        distances = graph[GraphKeys.Edge_dist]
-        edge_vec_st = graph[GraphKeys.Edge_vec_st]
-
         # calc angles of each triplets
         graph = self.calc_3body_angles(graph)
         costheta = graph[GraphKeys.Angles_3b]
 
         # ---------- Basis layers ----------
         rb = self.rbf(distances)
-        shb = self.shbf(costheta)
+        pl = self.shbf.legendre(costheta)
+        # the product with the spherical harmonics basis is common to all interaction layers
+        three_body_orbs = self.shbf.mul_radial(rb, pl, edge_idx_ks)
 
         # ---------- Embedding block ----------
         x, cst = self.emb_layer(z, idx_s, idx_t)
@@ -531,10 +586,22 @@ class LCAONet(BaseMPNN):
 
         # ---------- Interaction blocks ----------
         for inte in self.int_layers:
-            x = inte(x, cst, valence_mask, rb, shb, idx_s, idx_t, tri_idx_k, edge_idx_ks, edge_idx_st)
+            x = inte(
+                x,
+                cst,
+                valence_mask,
+                rb,
+                three_body_orbs,
+                self.rbf.expand_idx,
+                idx_s,
+                idx_t,
+                tri_idx_k,
+                edge_idx_ks,
+                edge_idx_st,
+            )
 
         # ---------- Output blocks ----------
-        out = self.out_layer(x, batch_idx, idx_s, idx_t, edge_vec_st, pos)
+        out = self.out_layer(x, batch_idx, out_idx_s, out_idx_t, out_edge_vec_st, pos)
         out = self.pp_layer(out, z, batch_idx)
 
         return out
@@ -1,25 +1,34 @@
 from __future__ import annotations
 
+import copy
 import math
-from collections.abc import Callable
 
 import numpy as np
-import sympy as sym
 import torch
 import torch.nn as nn
 from scipy.integrate import quad
 from torch import Tensor
 
+from ..atomistic.exponent import EXPONENT_TABLE
 from ..atomistic.info import ElecInfo
 from ..nn.cutoff import BaseCutoff
 
 
 class BaseRadialBasis(nn.Module):
+    """Base class of the radial basis layers.
+
+    The copies of each orbital made by `n_per_orb` share the same function, so the layers return
+    the basis of the unique orbitals with (E, n_basis) shape, which is expanded to the orbitals
+    by `rb[:, expand_idx]`.
+    """
+
     def __init__(self, cutoff: float, elec_info: ElecInfo, cutoff_net: BaseCutoff):
         super().__init__()
         self.cutoff = cutoff
         self.elec_info = elec_info
         self.cutoff_net = cutoff_net
+        self.n_basis = elec_info.n_orb_unique
+        self.register_buffer("expand_idx", elec_info.expand_idx, persistent=False)
 
     def extra_repr(self) -> str:
         return "cutoff={}, elec_info={}(max_z={}, n_orb={}, n_per_orb={})".format(
@@ -30,10 +39,29 @@ class BaseRadialBasis(nn.Module):
             self.elec_info.n_per_orb,
         )
 
+    def tabulate(self, max_error: float = 1e-6, max_intervals: int = 2**16) -> TabulatedRadialBasis:
+        """Make the tabulated version of this radial basis, which is
+        evaluated by the cubic spline lookup.
+
+        Args:
+            max_error (float, optional): the maximum absolute interpolation error. Defaults to `1e-6`.
+            max_intervals (int, optional): the maximum number of intervals of the table. Defaults to `2**16`.
+
+        Returns:
+            TabulatedRadialBasis: the tabulated radial basis.
+        """
+        return TabulatedRadialBasis(self, max_error, max_intervals)
+
 
 class HydrogenRadialBasis(BaseRadialBasis):
     """The layer that expand the interatomic distance with the radial
-    wavefunctions of hydrogen."""
+    wavefunctions of hydrogen.
+
+    Each radial wavefunction is a polynomial of r times exp(-r / (n * a0)). The coefficients
+    of the polynomials of all orbitals are packed into a buffer at construction, so that the
+    whole basis is evaluated at once by the Horner method with one exponential per principal
+    quantum number.
+    """
 
     def __init__(
         self,
@@ -56,35 +84,32 @@ class HydrogenRadialBasis(BaseRadialBasis):
         self.bohr_radius = bohr_radius
         self.integral_norm = integral_norm
 
-        self.basis_func = []
-        self.stand_coeff = []
-        for nl in elec_info.nl_list:
-            r_nl = self._get_r_nl(nl[0].item(), nl[1].item(), self.bohr_radius)
-            self.basis_func.append(r_nl)
-            if self.integral_norm:
-                self.stand_coeff.append(self._get_standardized_coeff(r_nl).requires_grad_(True))
+        nl_list = [(nl[0].item(), nl[1].item()) for nl in elec_info.nl_list_unique]
+        max_n = max(n for n, _ in nl_list)
+        coeffs = torch.stack([self._get_r_nl_coeffs(nq, lq, max_n, self.bohr_radius) for nq, lq in nl_list])
+        # the exponent -1 / (n * a0) of each principal quantum number, and the index of it of each orbital
+        n_unique, n_idx = torch.unique(torch.tensor([n for n, _ in nl_list]), return_inverse=True)
+        decay = -1.0 / (n_unique.to(torch.float64) * self.bohr_radius)
+        if self.integral_norm:
+            coeffs = coeffs * self._get_standardized_coeff(coeffs, decay[n_idx]).unsqueeze(-1)
+        # buffers are not saved in the state_dict, since they are determined by the arguments
+        self.register_buffer("coeffs", coeffs.to(torch.get_default_dtype()), persistent=False)
+        self.register_buffer("decay", decay.to(torch.get_default_dtype()), persistent=False)
+        self.register_buffer("decay_idx", n_idx, persistent=False)
 
-    def _get_r_nl(self, nq: int, lq: int, r0: float = 0.529) -> Callable[[Tensor | float], Tensor | float]:
-        """Get RadialOrbitalBasis functions with the associated Laguerre
-        polynomial.
+    def _get_r_nl_coeffs(self, nq: int, lq: int, n_coeffs: int, r0: float = 0.529) -> Tensor:
+        """Get the coefficients of the polynomial part of the radial
+        wavefunction with the associated Laguerre polynomial.
 
         Args:
             nq (int): principal quantum number.
             lq (int): azimuthal quantum number.
+            n_coeffs (int): the number of coefficients, not less than `nq`.
             r0 (float): bohr radius. Defaults to `0.529`.
 
         Returns:
-            r_nl (Callable[[Tensor | float], Tensor | float]): Orbital Basis function.
+            torch.Tensor: the coefficients in the ascending order of the powers of r with (n_coeffs) shape.
         """
-        x = sym.Symbol("x", real=True)
-        # modify for n, l parameter
-        # ref: https://zenn.dev/shittoku_xxx/articles/13afd6fdfac44e
-        assoc_lag_coeff = sym.lambdify(
-            [x],
-            sym.simplify(
-                sym.assoc_laguerre(nq - lq - 1, 2 * lq + 1, x) * sym.factorial(nq + lq) * (-1) ** (2 * lq + 1)
-            ),
-        )
         if self.integral_norm:
             stand_coeff = -2.0 / nq / r0
         else:
@@ -92,39 +117,41 @@ class HydrogenRadialBasis(BaseRadialBasis):
             stand_coeff = -math.sqrt(
                 (2.0 / nq / r0) ** 3 * math.factorial(nq - lq - 1) / 2.0 / nq / math.factorial(nq + lq) ** 3
             )
-
-        def r_nl(r: Tensor | float) -> Tensor | float:
-            zeta = 2.0 / nq / r0 * r
-
-            if isinstance(r, float):
-                cw = float(self.cutoff_net(torch.tensor([r])).item())
-                return cw * stand_coeff * assoc_lag_coeff(zeta) * zeta**lq * math.exp(-zeta / 2.0)
-
-            return self.cutoff_net(r) * stand_coeff * assoc_lag_coeff(zeta) * torch.pow(zeta, lq) * torch.exp(-zeta / 2.0)  # type: ignore # Since mypy cannot determine that the type of zeta is tensor # noqa: E501
-
-        return r_nl
-
-    def _get_standardized_coeff(self, func: Callable[[Tensor | float], Tensor | float]) -> Tensor:
+        # r_nl = stand_coeff * (-(n + l)!) * L_{n-l-1}^{(2l+1)}(zeta) * zeta^l * exp(-zeta / 2),
+        # with zeta = 2r / (n * r0) and the explicit sum of the associated Laguerre polynomial
+        # ref: https://zenn.dev/shittoku_xxx/articles/13afd6fdfac44e
+        k, alpha = nq - lq - 1, 2 * lq + 1
+        scale = 2.0 / nq / r0
+        coeffs = torch.zeros(n_coeffs, dtype=torch.float64)
+        for i in range(k + 1):
+            lag = (-1) ** i * math.comb(k + alpha, k - i) / math.factorial(i)
+            coeffs[i + lq] = -stand_coeff * math.factorial(nq + lq) * lag * scale ** (i + lq)
+        return coeffs
+
+    def _get_standardized_coeff(self, coeffs: Tensor, decay: Tensor) -> Tensor:
         """If integral_norm=True, the standardization coefficient is computed
         by numerical integration.
 
         Args:
-            func (Callable[[Tensor | float], Tensor | float]): radial wave function.
-
-        Raises:
-            ValueError: Occurs when cutoff radius is not specified.
+            coeffs (torch.Tensor): the coefficients of the polynomials with (n_basis, n_coeffs) shape.
+            decay (torch.Tensor): the exponent of each orbital with (n_basis) shape.
 
         Returns:
-            torch.Tensor: Standardization coefficient such that the probability of existence
+            torch.Tensor: Standardization coefficient of each orbital such that the probability of existence
                 within the cutoff sphere is 1.
         """
+        stand_coeff = torch.zeros(coeffs.size(0), dtype=torch.float64)
         with torch.no_grad():
+            for i in range(coeffs.size(0)):
+                poly, d = coeffs[i].numpy(), float(decay[i])
 
-            def interad_func(r):
-                return (r * func(r)) ** 2
+                def interad_func(r: float) -> float:
+                    cw = float(self.cutoff_net(torch.tensor(r, dtype=torch.float64)))
+                    return (r * cw * np.polynomial.polynomial.polyval(r, poly) * math.exp(d * r)) ** 2
 
-            inte = quad(interad_func, 0.0, self.cutoff)
-            return 1 / (torch.sqrt(torch.tensor([inte[0]])) + 1e-12)
+                inte = quad(interad_func, 0.0, self.cutoff)
+                stand_coeff[i] = 1 / (math.sqrt(inte[0]) + 1e-12)
+        return stand_coeff
 
     def forward(self, r: Tensor) -> Tensor:
         """Forward calculation of RadialOrbitalBasis.
@@ -133,13 +160,14 @@ class HydrogenRadialBasis(BaseRadialBasis):
             r (torch.Tensor): the interatomic distance with (E) shape.
 
         Returns:
-            rb (torch.Tensor): the expanded distance with HydrogenRadialBasis with (E, n_orb) shape.
+            rb (torch.Tensor): the expanded distance with HydrogenRadialBasis with (E, n_basis) shape.
         """
-        if self.integral_norm:
-            rb = torch.stack([f(r) * sc.to(r.device) for f, sc in zip(self.basis_func, self.stand_coeff)], dim=1)
-        else:
-            rb = torch.stack([f(r) for f in self.basis_func], dim=1)  # type: ignore # Since mypy cannot determine that the return type of a function is tensor # noqa: E501
-        return rb
+        x = r.unsqueeze(-1)
+        # Horner method for all orbitals at once
+        poly = self.coeffs[:, -1].expand(r.size(0), -1)
+        for i in range(self.coeffs.size(1) - 2, -1, -1):
+            poly = torch.addcmul(self.coeffs[:, i], poly, x)
+        return self.cutoff_net(x) * poly * torch.exp(x * self.decay)[:, self.decay_idx]
 
 
 class SphericalBesselRadialBasis(BaseRadialBasis):
@@ -155,28 +183,179 @@ class SphericalBesselRadialBasis(BaseRadialBasis):
         """  # noqa: E501
         super().__init__(cutoff, elec_info, cutoff_net)
         self.n_orb = elec_info.n_orb
-        self.basis_func = []
-        for nl in elec_info.nl_list:
-            r_nl = self._get_r_nl(nl[0].item(), nl[1].item())
-            self.basis_func.append(r_nl)
+        # the functions depend only on the principal quantum number
+        n_unique, n_idx = torch.unique(elec_info.nl_list_unique[:, 0], return_inverse=True)
+        freq = np.pi * n_unique.to(torch.float64) / self.cutoff
+        self.register_buffer("freq", freq.to(torch.get_default_dtype()), persistent=False)
+        self.register_buffer("freq_idx", n_idx, persistent=False)
+
+    def forward(self, r: Tensor) -> Tensor:
+        r"""Forward calculation of SphericalBesselBasis.
+
+        Args:
+            r (torch.Tensor): inter atomic distance with (E) shape.
+
+        Returns:
+            sbb (torch.Tensor): the spherical bessel basis functions with (E, n_basis) shape.
+        """
+        x = r.unsqueeze(-1)
+        sbb = self.cutoff_net(x) * torch.sin(x * self.freq) / x
+
+        return sbb[:, self.freq_idx]
+
+
+class SlaterRadialBasis(BaseRadialBasis):
+    """The layer that expand the interatomic distance with the Slater-type
+    orbitals r^(n-1) exp(-zeta r) normalized in all space.
+
+    The exponent zeta of each orbital is that of Clementi and Raimondi in
+    `lcaonet.atomistic.exponent.EXPONENT_TABLE` of the lightest element which occupies the orbital,
+    i.e. the exponent of the orbital as the valence orbital. All orbitals are evaluated at once in
+    closed form as one exponential, and neither sympy nor scipy is used at construction.
+    """
 
-    def _get_r_nl(self, nq: int, lq: int) -> Callable[[Tensor], Tensor]:
-        freq = np.pi * nq
+    def __init__(
+        self,
+        cutoff: float,
+        elec_info: ElecInfo,
+        cutoff_net: BaseCutoff,
+        bohr_radius: float = 0.529,
+    ):
+        """
+        Args:
+            cutoff (float): the cutoff radius.
+            elec_info (lcaonet.atomistic.info.ElecInfo): the object that contains the information about the number of electrons.
+            cutoff_net (torch.nn.Module): torch.nn.Moduel of the cutoff function.
+            bohr_radius (float, optional): the bohr radius, which converts the exponents in atomic units to those of the distance. Defaults to `0.529`.
 
-        def r_nl(r: Tensor) -> Tensor:
-            return self.cutoff_net(r) * (freq * r / self.cutoff).sin() / r
+        Raises:
+            ValueError: If the orbitals beyond those of the exponent table are used.
+        """  # noqa: E501
+        super().__init__(cutoff, elec_info, cutoff_net)
+        self.n_orb = elec_info.n_orb
+        self.bohr_radius = bohr_radius
+        if self.n_basis > EXPONENT_TABLE.size(1):
+            raise ValueError(
+                f"SlaterRadialBasis supports only the {EXPONENT_TABLE.size(1)} orbitals of the exponent table, but n_basis={self.n_basis}."  # noqa: E501
+            )
 
-        return r_nl
+        table = EXPONENT_TABLE[:, : self.n_basis].to(torch.float64)
+        # the first element whose exponent is not zero
+        first_z = torch.argmax((table > 0).to(torch.long), dim=0)
+        zeta = table[first_z, torch.arange(self.n_basis)] / self.bohr_radius
+        nq = elec_info.nl_list_unique[:, 0].to(torch.float64)
+        # (2 zeta)^n sqrt(2 zeta / (2n)!)
+        log_norm = nq * torch.log(2 * zeta) + 0.5 * (torch.log(2 * zeta) - torch.lgamma(2 * nq + 1))
+        # buffers are not saved in the state_dict, since they are determined by the arguments
+        self.register_buffer("power", (nq - 1).to(torch.get_default_dtype()), persistent=False)
+        self.register_buffer("zeta", zeta.to(torch.get_default_dtype()), persistent=False)
+        self.register_buffer("log_norm", log_norm.to(torch.get_default_dtype()), persistent=False)
 
     def forward(self, r: Tensor) -> Tensor:
-        r"""Forward calculation of SphericalBesselBasis.
+        """Forward calculation of SlaterRadialBasis.
 
         Args:
-            r (torch.Tensor): inter atomic distance with (E) shape.
+            r (torch.Tensor): the interatomic distance with (E) shape.
 
         Returns:
-            sbb (torch.Tensor): the spherical bessel basis functions with (E, n_orb) shape.
+            rb (torch.Tensor): the expanded distance with SlaterRadialBasis with (E, n_basis) shape.
+        """
+        x = r.unsqueeze(-1)
+        # norm * r^(n-1) * exp(-zeta * r) as one exponential with log(r) shared by all orbitals
+        log_x = torch.log(x.clamp_min(torch.finfo(x.dtype).tiny))
+        arg = torch.addcmul(torch.addcmul(self.log_norm, x, self.zeta, value=-1.0), log_x, self.power)
+        return self.cutoff_net(x) * torch.exp(arg)
+
+
+class TabulatedRadialBasis(BaseRadialBasis):
+    """The radial basis evaluated by the lookup of the cubic Hermite spline
+    tabulated from another radial basis.
+
+    The basis functions including the cutoff function are tabulated on a uniform grid in
+    [0, cutoff] with the values and the derivatives calculated in double precision, and the
+    grid is refined until the interpolation error is not larger than `max_error`. The evaluation
+    is a gather of four coefficients and the Horner method of the cubic polynomial, whose
+    derivative with respect to the distance is calculated analytically by autograd for the forces.
+    The achieved interpolation error is stored in `error`.
+    """
+
+    def __init__(self, basis: BaseRadialBasis, max_error: float = 1e-6, max_intervals: int = 2**16):
         """
-        sbb = torch.stack([f(r) for f in self.basis_func], dim=1)  # type: ignore # Since mypy cannot determine that the return type of a function is tensor # noqa: E501
+        Args:
+            basis (lcaonet.nn.rbf.BaseRadialBasis): the radial basis to be tabulated.
+            max_error (float, optional): the maximum absolute interpolation error. Defaults to `1e-6`.
+            max_intervals (int, optional): the maximum number of intervals of the table. Defaults to `2**16`.
 
-        return sbb
+        Raises:
+            ValueError: If the interpolation error is larger than `max_error` with `max_intervals` intervals.
+        """
+        super().__init__(basis.cutoff, basis.elec_info, basis.cutoff_net)
+        self.n_orb = basis.n_orb
+        self.max_error = max_error
+
+        # the reference basis in double precision
+        ref = copy.deepcopy(basis).to(torch.float64)
+        n_intervals = 16
+        while True:
+            table = self._make_table(ref, n_intervals)
+            self.error = self._interp_error(ref, table)
+            if self.error <= max_error or n_intervals >= max_intervals:
+                break
+            n_intervals *= 2
+        if self.error > max_error:
+            raise ValueError(
+                f"the interpolation error {self.error:.3e} with {n_intervals} intervals is larger than max_error={max_error}."  # noqa: E501
+            )
+        self.n_intervals = n_intervals
+        # the table is not saved in the state_dict, since it is determined by the tabulated basis
+        self.register_buffer("table", table.to(torch.get_default_dtype()), persistent=False)
+
+    def extra_repr(self) -> str:
+        return super().extra_repr() + ", n_intervals={}, error={:.3e}".format(self.n_intervals, self.error)
+
+    @staticmethod
+    def _values(ref: BaseRadialBasis, r: Tensor) -> tuple[Tensor, Tensor]:
+        # the one-sided limit at r=0, where some functions are singular or not differentiable in the implementation
+        r = r.clamp_min(1e-10 * ref.cutoff)
+        with torch.enable_grad():
+            val, grad = torch.func.jvp(ref, (r,), (torch.ones_like(r),))
+        return val.detach(), grad.detach()
+
+    def _make_table(self, ref: BaseRadialBasis, n_intervals: int) -> Tensor:
+        h = self.cutoff / n_intervals
+        val, grad = self._values(ref, torch.linspace(0.0, self.cutoff, n_intervals + 1, dtype=torch.float64))
+        p0, p1 = val[:-1], val[1:]
+        m0, m1 = h * grad[:-1], h * grad[1:]
+        # coefficients of the cubic polynomial of t in [0, 1] of each interval, concatenated along the last axis
+        table = torch.cat([p0, m0, 3 * (p1 - p0) - 2 * m0 - m1, 2 * (p0 - p1) + m0 + m1], dim=1)
+        # the last row of zeros is used beyond the cutoff radius, where the cutoff function is zero
+        return torch.cat([table, torch.zeros_like(table[:1])], dim=0)
+
+    def _interp_error(self, ref: BaseRadialBasis, table: Tensor) -> float:
+        n_intervals = table.size(0) - 1
+        t = torch.linspace(0.0, 1.0, 9, dtype=torch.float64)[1:-1]
+        r = ((torch.arange(n_intervals, dtype=torch.float64).unsqueeze(-1) + t) * self.cutoff / n_intervals).flatten()
+        val, _ = self._values(ref, r)
+        return float((self._lookup(table, r) - val).abs().max())
+
+    def _lookup(self, table: Tensor, r: Tensor) -> Tensor:
+        n_intervals = table.size(0) - 1
+        s = r * (n_intervals / self.cutoff)
+        idx = torch.clamp(s.detach().floor().long(), 0, n_intervals)
+        t = (s - idx).unsqueeze(-1)
+        c = table.index_select(0, idx)
+        o = self.n_basis
+        out = torch.addcmul(c[:, 2 * o : 3 * o], t, c[:, 3 * o :])
+        out = torch.addcmul(c[:, o : 2 * o], t, out)
+        return torch.addcmul(c[:, :o], t, out)
+
+    def forward(self, r: Tensor) -> Tensor:
+        """Forward calculation of TabulatedRadialBasis.
+
+        Args:
+            r (torch.Tensor): the interatomic distance with (E) shape.
+
+        Returns:
+            rb (torch.Tensor): the interpolated radial basis with (E, n_basis) shape.
+        """
+        return self._lookup(self.table, r)
@@ -1,9 +1,7 @@
 from __future__ import annotations
 
-import math
 from math import pi
 
-import sympy as sym
 import torch
 import torch.nn as nn
 from torch import Tensor
@@ -13,7 +11,15 @@ from ..atomistic.info import ElecInfo
 
 class SphericalHarmonicsBasis(nn.Module):
     """The layer that expand three body angles with spherical harmonics
-    functions."""
+    functions.
+
+    Only `m=0` is used, so the function of each orbital depends only on the azimuthal quantum number l:
+    Y_l^0 = sqrt((2l + 1) / (4 pi)) P_l(cos(theta)) with the Legendre polynomial P_l. The Legendre
+    polynomials are evaluated once for each unique l > 0 by the recurrence, and the normalization
+    and the constant of the s orbitals are applied by `mul_radial` at the product with the radial basis.
+    As the radial basis, the basis is made for the unique orbitals without the copies of `n_per_orb`,
+    which is expanded to the orbitals by `shb[:, expand_idx]`.
+    """
 
     def __init__(self, elec_info: ElecInfo):
         """
@@ -22,55 +28,65 @@ class SphericalHarmonicsBasis(nn.Module):
         """  # noqa: E501
         super().__init__()
         self.elec_info = elec_info
-        self.sph_funcs = self._calculate_symbolic_sh_funcs()
 
-    @staticmethod
-    def _y00(theta: Tensor, phi: Tensor) -> Tensor:
-        r"""
-        Spherical Harmonics with `l=m=0`.
-        ..math::
-            Y_0^0 = \frac{1}{2} \sqrt{\frac{1}{\pi}}
+        self.n_basis = elec_info.n_orb_unique
+        l_orb = elec_info.nl_list_unique[:, 1]
+        # the unique l > 0, and the index of the column of each orbital with l > 0
+        self.max_l = int(l_orb.max())
+        l_unique, l_idx = torch.unique(l_orb, return_inverse=True)
+        has_s = bool(l_unique[0] == 0)
+        # buffers are not saved in the state_dict, since they are determined by elec_info
+        self.register_buffer("l_list", l_unique[1:] if has_s else l_unique, persistent=False)
+        self.register_buffer("orb_idx", torch.nonzero(l_orb > 0).squeeze(-1), persistent=False)
+        self.register_buffer("orb_l_idx", (l_idx - int(has_s))[l_orb > 0], persistent=False)
+        norm = torch.sqrt((2 * l_orb.to(torch.float64) + 1) / (4 * pi))
+        self.register_buffer("norm", norm.to(torch.get_default_dtype()), persistent=False)
+        self.register_buffer("expand_idx", elec_info.expand_idx, persistent=False)
+
+    def extra_repr(self) -> str:
+        return "elec_info={}(max_z={}, n_orb={}, n_per_orb={})".format(
+            self.elec_info.__class__.__name__,
+            self.elec_info.max_z,
+            self.elec_info.n_orb,
+            self.elec_info.n_per_orb,
+        )
+
+    def legendre(self, costheta: Tensor) -> Tensor:
+        """The Legendre polynomials of each unique l > 0 by the recurrence
+        (l + 1) P_{l+1} = (2l + 1) x P_l - l P_{l-1}.
 
         Args:
-            theta: the polar angle.
-            phi: the azimuthal angle.
+            costheta (torch.Tensor): the cosine values of triplets with (n_triplets) shape.
 
         Returns:
-            `Y_0^0`: the spherical harmonics with `l=m=0`.
+            pl (torch.Tensor): the Legendre polynomials with (n_triplets, n_l) shape.
         """
-        dtype = theta.dtype
-        return (0.5 * torch.ones_like(theta) * math.sqrt(1.0 / pi)).to(dtype)
+        if self.max_l == 0:
+            return costheta.new_zeros((costheta.size(0), 0))
+        p = [torch.ones_like(costheta), costheta]
+        for lq in range(1, self.max_l):
+            p.append(((2 * lq + 1) * costheta * p[lq] - lq * p[lq - 1]) / (lq + 1))
+        return torch.stack(p, dim=1)[:, self.l_list]
 
-    def _calculate_symbolic_sh_funcs(self) -> list:
-        """Calculate symbolic spherical harmonics functions.
+    def mul_radial(self, rb: Tensor, pl: Tensor, edge_idx: Tensor) -> Tensor:
+        """The product of the radial basis of the edges of the triplets and
+        the spherical harmonics basis, `rb[edge_idx] * shb`.
+
+        The normalization is multiplied to the radial basis of the edges before gathering it, so that
+        the constant columns of the s orbitals are not made for the triplets.
+
+        Args:
+            rb (torch.Tensor): the radial basis with (E, n_basis) shape.
+            pl (torch.Tensor): the Legendre polynomials of `legendre` with (n_triplets, n_l) shape.
+            edge_idx (torch.Tensor): the edge index of each triplet with (n_triplets) shape.
 
         Returns:
-            funcs (list[Callable]): the list of spherical harmonics functions.
+            torch.Tensor: the product with (n_triplets, n_basis) shape.
         """
-        funcs = []
-        theta, phi = sym.symbols("theta phi")
-        costheta = sym.symbols("costheta")
-        modules = {"sin": torch.sin, "cos": torch.cos, "conjugate": torch.conj, "sqrt": torch.sqrt, "exp": torch.exp}
-        for nl in self.elec_info.nl_list:
-            # !! only m=zero is used
-            m_list = [0]
-            for m in m_list:
-                if nl[1] == 0:
-                    funcs.append(SphericalHarmonicsBasis._y00)
-                else:
-                    func = sym.expand_func(sym.functions.special.spherical_harmonics.Znm(nl[1].item(), m, theta, phi))
-                    func = func.subs({theta: sym.acos(costheta)})
-                    funcs.append(sym.lambdify([costheta, phi], sym.simplify(func).evalf(), modules))
-
-        return funcs
-
-    def extra_repr(self) -> str:
-        return "elec_info={}(max_z={}, n_orb={}, n_per_orb={})".format(
-            self.elec_info.__class__.__name__,
-            self.elec_info.max_z,
-            self.elec_info.n_orb,
-            self.elec_info.n_per_orb,
-        )
+        orbs = (rb * self.norm)[edge_idx]
+        if self.orb_idx.size(0) > 0:
+            orbs[:, self.orb_idx] = orbs[:, self.orb_idx] * pl[:, self.orb_l_idx]
+        return orbs
 
     def forward(self, costheta: Tensor) -> Tensor:
         """Forward calculation of SphericalHarmonicsBasis.
@@ -79,9 +95,11 @@ class SphericalHarmonicsBasis(nn.Module):
             costheta (torch.Tensor): the cosine values of triplets with (n_triplets) shape.
 
         Returns:
-            shb (torch.Tensor): the expanded angles with SphericalHarmonicsFunctions with (n_triplets, n_orb) shape.
+            shb (torch.Tensor): the expanded angles with SphericalHarmonicsFunctions with (n_triplets, n_basis) shape.
         """
-        # (n_triplets, n_orb)
-        shb = torch.stack([f(costheta, None) for f in self.sph_funcs], dim=1)
+        # (n_triplets, n_basis)
+        shb = self.norm.expand(costheta.size(0), -1).clone()
+        if self.orb_idx.size(0) > 0:
+            shb[:, self.orb_idx] = shb[:, self.orb_idx] * self.legendre(costheta)[:, self.orb_l_idx]
 
         return shb
@@ -141,7 +141,11 @@ def rbf_resolver(query: type[BaseRadialBasis] | str = "hydrogenradialbasis", **k
         if query[-11:] != "radialbasis":
             query += "radialbasis"
     base_cls: type = BaseRadialBasis
-    # rbf classes
-    rbfs = [rbf for rbf in vars(lcaonet.nn.rbf).values() if isinstance(rbf, type) and issubclass(rbf, base_cls)]
+    # rbf classes, except the tabulated basis which is made from another basis by `BaseRadialBasis.tabulate`
+    rbfs = [
+        rbf
+        for rbf in vars(lcaonet.nn.rbf).values()
+        if isinstance(rbf, type) and issubclass(rbf, base_cls) and rbf is not lcaonet.nn.rbf.TabulatedRadialBasis
+    ]
 
     return _resolver(query, rbfs, base_cls, True, **kwargs)  # type: ignore # Since mypy cannot identify that _resolver returns BaseRadialBasis # noqa: E501
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+import pytest
+from torch_geometric.data import Data
+
+from lcaonet.data.keys import GraphKeys
+
+
+def _edge_set(data: Data) -> set[tuple[int, int, int, int, int]]:
+    edge_index = data[GraphKeys.Edge_idx].t().tolist()
+    edge_shift = data[GraphKeys.Edge_shift].round().long().tolist()
+    return {(s, t, *sh) for (s, t), sh in zip(edge_index, edge_shift)}
+
+
+@pytest.fixture(scope="session")
+def edge_set():
+    # the edges as the set of (source, target, shift), which does not depend on the order of the edges
+    return _edge_set
@@ -0,0 +1,526 @@
+from __future__ import annotations
+
+import pathlib
+import pickle
+
+import ase.db
+import ase.io
+import numpy as np
+import pytest
+import torch
+from ase.build import bulk, molecule
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.neighborlist import neighbor_list
+from torch_geometric.data import Batch
+
+from lcaonet.data.convert import (
+    AseDBDataConverter,
+    AseFileDataConverter,
+    FilesDataConverter,
+    ListDataConverter,
+    atoms2graphdata,
+)
+from lcaonet.data.dataset import GraphDataset
+from lcaonet.data.keys import GraphKeys
+from lcaonet.data.manifest import MANIFEST_FILE, Manifest
+from lcaonet.data.utils import restore_atom_order, structure_fingerprint
+from lcaonet.model.lcaonet import LCAONet
+
+
+def _reference_edges(atoms, cutoff: float, max_neighbors: int):
+    # per center atom loop which was used before vectorization
+    edge_src, edge_dst, dist, edge_shift = neighbor_list("ijdS", a=atoms, cutoff=cutoff, self_interaction=False)
+    idx_s, idx_t, shift, dists = [], [], [], []
+    for i in np.unique(edge_src):
+        center_mask = edge_src == i
+        dist_i = dist[center_mask]
+        sorted_ind = np.argsort(dist_i)
+        dist_mask = (dist_i <= cutoff)[sorted_ind]
+        idx_s.append(edge_src[center_mask][sorted_ind][dist_mask][:max_neighbors])
+        idx_t.append(edge_dst[center_mask][sorted_ind][dist_mask][:max_neighbors])
+        shift.append(edge_shift[center_mask][sorted_ind][dist_mask][:max_neighbors])
+        dists.append(dist_i[sorted_ind][dist_mask][:max_neighbors])
+    return np.stack([np.concatenate(idx_s), np.concatenate(idx_t)]), np.concatenate(shift), np.concatenate(dists)
+
+
+param_atoms2graphdata = [
+    (bulk("Si", "diamond", a=5.43, cubic=True).repeat((2, 2, 2)), 5.0, 32),
+    (bulk("Si", "diamond", a=5.43, cubic=True).repeat((2, 2, 2)), 5.0, 8),
+    (bulk("NaCl", "rocksalt", a=5.64).repeat((3, 2, 2)), 6.0, 12),
+    (molecule("CH3CH2OH"), 3.0, 4),
+    (molecule("C6H6"), 4.0, 32),
+]
+
+
+@pytest.mark.parametrize("atoms, cutoff, max_neighbors", param_atoms2graphdata)
+def test_atoms2graphdata(atoms, cutoff: float, max_neighbors: int):
+    # rattled so that no distances tie and the selected edges are unique
+    atoms = atoms.copy()
+    atoms.rattle(0.01, seed=0)
+    data = atoms2graphdata(atoms, False, cutoff, max_neighbors)
+
+    edge_index, edge_shift, _ = _reference_edges(atoms, cutoff, max_neighbors)
+    assert data[GraphKeys.Edge_idx].dtype == torch.long
+    assert torch.equal(data[GraphKeys.Edge_idx], torch.tensor(edge_index, dtype=torch.long))
+    assert torch.equal(data[GraphKeys.Edge_shift], torch.tensor(edge_shift, dtype=torch.float32))
+    assert torch.bincount(data[GraphKeys.Edge_idx][0]).max() <= max_neighbors
+    assert data[GraphKeys.Neighbors].item() == edge_index.shape[1]
+    assert torch.equal(data[GraphKeys.Pos], torch.tensor(atoms.positions, dtype=torch.float32))
+    assert torch.equal(data[GraphKeys.Z], torch.tensor(atoms.numbers, dtype=torch.long))
+
+
+@pytest.mark.parametrize(
+    "atoms, cutoff, max_neighbors",
+    [
+        (bulk("Cu", "fcc", a=3.6).repeat((3, 3, 3)), 6.0, 32),
+        (bulk("Cu", "fcc", a=3.6).repeat((3, 3, 3)), 8.0, 50),
+        (bulk("Si", "diamond", a=5.43, cubic=True).repeat((2, 2, 2)), 6.0, 12),
+        (bulk("Si", "diamond", a=5.43, cubic=True).repeat((2, 2, 2)), 6.0, 32),
+        (bulk("NaCl", "rocksalt", a=5.64).repeat((3, 2, 1)), 6.0, 12),
+    ],
+)
+def test_atoms2graphdata_ties(atoms, cutoff: float, max_neighbors: int):
+    # the distances of periodic images tie, so the selected edges of the truncated ties depend on the sort,
+    # while the distances of the selected neighbors of each atom do not
+    data = atoms2graphdata(atoms, False, cutoff, max_neighbors)
+    edge_index, _, ref_dist = _reference_edges(atoms, cutoff, max_neighbors)
+
+    src = data[GraphKeys.Edge_idx][0].numpy()
+    np.testing.assert_array_equal(src, edge_index[0])
+    vec = (
+        data[GraphKeys.Pos].double()[data[GraphKeys.Edge_idx][1]]
+        - data[GraphKeys.Pos].double()[data[GraphKeys.Edge_idx][0]]
+        + data[GraphKeys.Edge_shift].double() @ data[GraphKeys.Lattice][0].double()
+    )
+    dist = torch.linalg.norm(vec, dim=-1).numpy()
+    np.testing.assert_allclose(dist, ref_dist, atol=1e-4)
+    # ordered by center atom and then by distance
+    assert np.all((np.diff(src) > 0) | (np.diff(dist) >= -1e-4))
+
+
+def test_atoms2graphdata_isolated():
+    atoms = molecule("H2")
+    data = atoms2graphdata(atoms, False, 0.1, 32)
+
+    # fully linked graph is made when no neighbor is found
+    assert data[GraphKeys.Edge_idx].tolist() == [[0, 1], [1, 0]]
+    assert data[GraphKeys.Edge_shift].size() == (2, 3)
+
+
+@pytest.fixture(scope="module")
+def atoms_list():
+    atoms_list = []
+    for i in range(7):
+        at = bulk("Cu", "fcc", a=3.6).repeat((2, 1, 1)) if i % 2 == 0 else molecule("H2O")
+        at.rattle(0.05, seed=i)
+        at.info["energy"] = float(i)
+        atoms_list.append(at)
+    atoms_list.append(molecule("H2", info={"energy": -1.0}))
+    return atoms_list
+
+
+@pytest.mark.parametrize("n_workers, chunksize", [(1, 1), (2, 1), (3, 2)])
+def test_ListDataConverter(tmp_path: pathlib.Path, atoms_list, n_workers: int, chunksize: int):
+    converter = ListDataConverter(0.5, tmp_path / "0.5", max_neighbors=8, n_workers=n_workers, chunksize=chunksize)
+    report = converter.convert(atoms_list)
+
+    assert report.n_structures == len(atoms_list)
+    assert report.n_fully_linked == len(atoms_list)
+    files = sorted(f"{i}.pt" for i in range(len(atoms_list))) + ["convert_params.json", "manifest.csv"]
+    assert sorted(p.name for p in (tmp_path / "0.5").iterdir()) == sorted(files)
+
+    converter = ListDataConverter(3.0, tmp_path / "3.0", max_neighbors=8, n_workers=n_workers, chunksize=chunksize)
+    report = converter.convert(atoms_list)
+    assert report.n_fully_linked == 0
+    for i, at in enumerate(atoms_list):
+        data = torch.load(tmp_path / "3.0" / f"{i}.pt", weights_only=False)
+        expected = atoms2graphdata(at.copy(), False, 3.0, 8)
+        assert torch.equal(data[GraphKeys.Edge_idx], expected[GraphKeys.Edge_idx])
+        assert report.n_edges >= data[GraphKeys.Edge_idx].size(1)
+        assert data["energy"].item() == at.info["energy"]
+
+
+def test_FilesDataConverter(tmp_path: pathlib.Path, atoms_list):
+    atoms_dir = tmp_path / "atoms"
+    atoms_dir.mkdir()
+    for i, at in enumerate(atoms_list):
+        with open(atoms_dir / f"{i:03d}.pkl", "wb") as f:
+            pickle.dump(at, f)
+
+    converter = FilesDataConverter(3.0, tmp_path / "graph", max_neighbors=8, n_workers=2)
+    report = converter.convert(atoms_dir)
+
+    assert report.n_structures == len(atoms_list)
+    # index follows the sorted file names
+    for i, at in enumerate(atoms_list):
+        data = torch.load(tmp_path / "graph" / f"{i}.pt", weights_only=False)
+        assert torch.equal(data[GraphKeys.Z], torch.tensor(at.numbers))
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_ListDataConverter_generator(tmp_path: pathlib.Path, atoms_list, n_workers: int):
+    def gen():
+        for j in range(5):
+            for at in atoms_list:
+                at = at.copy()
+                at.info["step"] = j
+                yield at
+
+    converter = ListDataConverter(3.0, tmp_path, max_neighbors=8, n_workers=n_workers, chunksize=1)
+    report = converter.convert(gen())
+    assert report.n_structures == 5 * len(atoms_list)
+    for i in [0, len(atoms_list) + 3, 5 * len(atoms_list) - 1]:
+        data = torch.load(tmp_path / f"{i}.pt", weights_only=False)
+        assert data["energy"].item() == atoms_list[i % len(atoms_list)].info["energy"]
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_AseFileDataConverter(tmp_path: pathlib.Path, atoms_list, n_workers: int):
+    images = []
+    for at in atoms_list:
+        at = at.copy()
+        energy = at.info.pop("energy")
+        at.calc = SinglePointCalculator(at, energy=energy, forces=np.ones((len(at), 3)))
+        images.append(at)
+    ase.io.write(tmp_path / "images.extxyz", images)
+
+    converter = AseFileDataConverter(
+        3.0, tmp_path / "graph", max_neighbors=8, remove_batch_key=["forces"], n_workers=n_workers
+    )
+    report = converter.convert(tmp_path / "images.extxyz", index="1:")
+    assert report.n_structures == len(atoms_list) - 1
+    for i, at in enumerate(atoms_list[1:]):
+        data = torch.load(tmp_path / "graph" / f"{i}.pt", weights_only=False)
+        assert data["energy"].item() == pytest.approx(at.info["energy"])
+        assert data["forces"].size() == (len(at), 3)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_AseDBDataConverter(tmp_path: pathlib.Path, atoms_list, n_workers: int):
+    with ase.db.connect(tmp_path / "atoms.db") as db:
+        for i, at in enumerate(atoms_list):
+            at = at.copy()
+            energy = at.info.pop("energy")
+            at.calc = SinglePointCalculator(at, energy=energy)
+            db.write(at, tag=i % 2)
+
+    converter = AseDBDataConverter(3.0, tmp_path / "graph", max_neighbors=8, n_workers=n_workers)
+    report = converter.convert(tmp_path / "atoms.db", "tag=1")
+    assert report.n_structures == len(atoms_list) // 2
+    for i, at in enumerate(atoms_list[1::2]):
+        data = torch.load(tmp_path / "graph" / f"{i}.pt", weights_only=False)
+        assert data["energy"].item() == pytest.approx(at.info["energy"])
+        assert data["tag"].item() == 1
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_ListDataConverter_append(tmp_path: pathlib.Path, atoms_list, n_workers: int):
+    converter = ListDataConverter(3.0, tmp_path, max_neighbors=8, n_workers=n_workers)
+    report = converter.convert(atoms_list[:5])
+    assert report.n_structures == 5 and report.n_skipped == 0
+
+    # already converted structures are skipped, but duplicates in the input are kept
+    new_atoms = atoms_list[3].copy()
+    new_atoms.info["energy"] = 100.0
+    report = converter.convert(atoms_list + [atoms_list[6].copy(), new_atoms])
+    assert report.n_structures == len(atoms_list) - 5 + 2
+    assert report.n_skipped == 5
+
+    dataset = GraphDataset(tmp_path)
+    assert len(dataset) == len(atoms_list) + 2
+    for i, at in enumerate(atoms_list + [atoms_list[6], new_atoms]):
+        assert dataset[i]["energy"].item() == at.info["energy"]
+
+    # the dataset converted with other parameters cannot be appended
+    with pytest.raises(ValueError):
+        ListDataConverter(4.0, tmp_path, max_neighbors=8).convert(atoms_list)
+    with pytest.raises(ValueError):
+        ListDataConverter(3.0, tmp_path, max_neighbors=8, remove_batch_key=["energy"]).convert(atoms_list)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_ListDataConverter_append_center_of_mass(tmp_path: pathlib.Path, atoms_list, n_workers: int):
+    positions = [at.positions.copy() for at in atoms_list]
+    converter = ListDataConverter(3.0, tmp_path, subtract_center_of_mass=True, max_neighbors=8, n_workers=n_workers)
+    report = converter.convert(atoms_list)
+    assert report.n_structures == len(atoms_list) and report.n_skipped == 0
+    # the input structures are not shifted, so they are skipped when converted again
+    for at, pos in zip(atoms_list, positions):
+        np.testing.assert_array_equal(at.positions, pos)
+    report = converter.convert(atoms_list)
+    assert report.n_structures == 0 and report.n_skipped == len(atoms_list)
+    assert len(GraphDataset(tmp_path)) == len(atoms_list)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_ListDataConverter_worker_error(tmp_path: pathlib.Path, n_workers: int):
+    atoms_list = []
+    for i in range(200):
+        at = molecule("H2O")
+        at.rattle(0.05, seed=i)
+        at.info["energy"] = float(i)
+        atoms_list.append(at)
+    atoms_list[10].info["energy"] = {"unsupported": 0.0}
+
+    # the error in a worker is raised without waiting for the remaining structures
+    converter = ListDataConverter(3.0, tmp_path, max_neighbors=8, n_workers=n_workers, chunksize=1)
+    with pytest.raises(AttributeError):
+        converter.convert(atoms_list)
+
+
+def test_ListDataConverter_resume(tmp_path: pathlib.Path, atoms_list):
+    converter = ListDataConverter(3.0, tmp_path, max_neighbors=8)
+    converter.convert(atoms_list)
+
+    # simulate an interrupted conversion: rows 2 and 5 are lost and the last row is torn
+    with open(tmp_path / MANIFEST_FILE) as f:
+        lines = f.readlines()
+    torn = lines[-1][:10]
+    lines = [line for i, line in enumerate(lines) if i - 1 not in (2, 5)][:-1]
+    with open(tmp_path / MANIFEST_FILE, "w") as f:
+        f.writelines(lines + [torn])
+    (tmp_path / "5.pt").unlink()
+    with pytest.raises(ValueError):
+        Manifest.load(tmp_path)
+
+    report = converter.convert(atoms_list)
+    assert report.n_structures == 3
+    assert report.n_skipped == len(atoms_list) - 3
+
+    dataset = GraphDataset(tmp_path)
+    assert len(dataset) == len(atoms_list)
+    for i, at in enumerate(atoms_list):
+        assert dataset[i]["energy"].item() == at.info["energy"]
+        assert dataset.manifest.n_atoms[i] == len(at)
+
+
+def _triplet_set(graph) -> set[tuple[int, int, int]]:
+    keys = [GraphKeys.Idx_k_3b, GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b]
+    return set(zip(*[graph[k].tolist() for k in keys]))
+
+
+@pytest.mark.parametrize("atoms, cutoff, max_neighbors", param_atoms2graphdata)
+def test_atoms2graphdata_triplets(atoms, cutoff: float, max_neighbors: int):
+    data = atoms2graphdata(atoms, False, cutoff, max_neighbors, precompute_triplets=True)
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, max_z=17, n_interaction=1)
+    expected = model.get_triplets(atoms2graphdata(atoms, False, cutoff, max_neighbors))
+
+    for k in [GraphKeys.Idx_k_3b, GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b]:
+        assert data[k].dtype == torch.long
+    assert _triplet_set(data) == _triplet_set(expected)
+    assert torch.equal(data[GraphKeys.Idx_k_3b], expected[GraphKeys.Idx_k_3b])
+    assert torch.equal(data[GraphKeys.Edge_idx_st_3b], expected[GraphKeys.Edge_idx_st_3b])
+    # the order can differ only between periodic images of the same (k -> s) pair
+    edge_index = data[GraphKeys.Edge_idx]
+    assert torch.equal(edge_index[:, data[GraphKeys.Edge_idx_ks_3b]], edge_index[:, expected[GraphKeys.Edge_idx_ks_3b]])
+
+
+def test_precomputed_triplets_batch(tmp_path: pathlib.Path, atoms_list):
+    ListDataConverter(3.0, tmp_path, max_neighbors=8, precompute_triplets=True).convert(atoms_list)
+    dataset = GraphDataset(tmp_path)
+    assert dataset.manifest is not None
+
+    batch = Batch.from_data_list([dataset[i] for i in range(len(dataset))])
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, max_z=29, n_interaction=1)
+    expected = batch.clone()
+    for k in [GraphKeys.Idx_k_3b, GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b]:
+        del expected[k]
+    expected = model.get_triplets(expected)
+    assert _triplet_set(batch) == _triplet_set(expected)
+    assert batch[GraphKeys.Idx_k_3b].size(0) == dataset.manifest.n_triplets.sum()
+
+    with torch.no_grad():
+        assert torch.allclose(model(batch), model(expected), atol=1e-5)
+
+
+@pytest.mark.parametrize("half_edges, max_neighbors", [(False, 8), (True, 8), (True, 100)])
+def test_ListDataConverter_compact(tmp_path: pathlib.Path, atoms_list, half_edges: bool, max_neighbors: int):
+    ListDataConverter(5.0, tmp_path / "plain", max_neighbors=max_neighbors).convert(atoms_list)
+    converter = ListDataConverter(
+        5.0, tmp_path / "compact", max_neighbors=max_neighbors, compact=True, half_edges=half_edges
+    )
+    converter.convert(atoms_list)
+    plain = GraphDataset(tmp_path / "plain")
+    compact = GraphDataset(tmp_path / "compact", inmemory=True)
+    assert (compact.manifest.n_edges == plain.manifest.n_edges).all()
+
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, max_z=29, n_interaction=1)
+    for i in range(len(plain)):
+        expected, data = plain[i], compact[i]
+        assert sorted(expected.keys()) == sorted(data.keys())
+        for k in expected.keys():
+            assert data[k].dtype == expected[k].dtype
+        # the decoded graph is the same as the plain one, including the order of the edges
+        for k in expected.keys():
+            assert torch.equal(data[k], expected[k])
+        with torch.no_grad():
+            out, out_expected = model(Batch.from_data_list([data])), model(Batch.from_data_list([expected]))
+            assert torch.allclose(out, out_expected, atol=1e-5)
+
+        stored = torch.load(tmp_path / "compact" / f"{i}.pt", weights_only=False)
+        assert stored[GraphKeys.Edge_shift].dtype == torch.int8
+        assert stored[GraphKeys.Edge_idx].dtype == torch.int32
+        # graphs truncated by max_neighbors may not be symmetric, and are stored with both directions
+        n_stored = stored[GraphKeys.Edge_idx].size(1)
+        if bool(stored[GraphKeys.Edge_half]):
+            assert 2 * n_stored == expected[GraphKeys.Edge_idx].size(1)
+        else:
+            assert n_stored == expected[GraphKeys.Edge_idx].size(1)
+        # the graph kept in memory stays compact
+        assert compact._data_list[i][GraphKeys.Edge_idx].dtype == torch.int32
+    if max_neighbors == 100:
+        assert all(
+            bool(torch.load(tmp_path / "compact" / f"{i}.pt", weights_only=False)[GraphKeys.Edge_half])
+            for i in range(len(compact))
+        )
+
+
+def test_ListDataConverter_compact_invalid(tmp_path: pathlib.Path):
+    with pytest.raises(ValueError):
+        ListDataConverter(5.0, tmp_path, half_edges=True)
+    with pytest.raises(ValueError):
+        ListDataConverter(5.0, tmp_path, compact=True, half_edges=True, precompute_triplets=True)
+
+
+def test_structure_fingerprint():
+    at = bulk("NaCl", "rocksalt", a=5.64).repeat((2, 1, 1))
+    at.rattle(0.05, seed=0)
+    fp = structure_fingerprint(at)
+
+    permuted = at[np.random.default_rng(0).permutation(len(at))]
+    assert structure_fingerprint(permuted) == fp
+    wrapped = at.copy()
+    wrapped.positions += at.cell[0] - 2 * at.cell[2]
+    assert structure_fingerprint(wrapped) == fp
+    noisy = at.copy()
+    noisy.positions += 1e-7
+    assert structure_fingerprint(noisy) == fp
+
+    moved = at.copy()
+    moved.positions[0] += 0.1
+    assert structure_fingerprint(moved) != fp
+    strained = at.copy()
+    strained.set_cell(at.cell * 1.01, scale_atoms=True)
+    assert structure_fingerprint(strained) != fp
+
+    mol = molecule("CH3CH2OH")
+    assert structure_fingerprint(mol[::-1]) == structure_fingerprint(mol)
+
+
+def test_ListDataConverter_deduplicate(tmp_path: pathlib.Path, atoms_list):
+    duplicates = []
+    for i, at in enumerate(atoms_list[:3]):
+        dup = at[::-1]
+        dup.info["energy"] = at.info["energy"] + 1e-3
+        duplicates.append(dup)
+    structures = atoms_list + duplicates
+
+    report = ListDataConverter(3.0, tmp_path / "all").convert(structures)
+    assert report.n_structures == len(structures) and report.n_duplicates == 0
+
+    report = ListDataConverter(3.0, tmp_path / "dedup", deduplicate=True).convert(structures)
+    assert report.n_structures == len(atoms_list)
+    assert report.n_duplicates == len(duplicates)
+    manifest = Manifest.load(tmp_path / "dedup")
+    assert len(set(manifest.fingerprint)) == len(manifest) == len(atoms_list)
+
+    # duplicates of the structures converted in a previous run are also dropped
+    extra = atoms_list[3][::-1]
+    report = ListDataConverter(3.0, tmp_path / "dedup", deduplicate=True).convert([extra])
+    assert report.n_structures == 0 and report.n_duplicates == 1
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_ListDataConverter_target_store(tmp_path: pathlib.Path, atoms_list, n_workers: int):
+    structures = []
+    for i, at in enumerate(atoms_list):
+        at = at.copy()
+        at.info["forces"] = np.random.default_rng(i).standard_normal((len(at), 3))
+        at.info["n_electrons"] = int(at.numbers.sum())
+        at.info["formula"] = at.get_chemical_formula()
+        structures.append(at)
+    kwargs = {"remove_batch_key": ["forces"], "n_workers": n_workers}
+    ListDataConverter(3.0, tmp_path / "graphs", **kwargs).convert(structures)
+    ListDataConverter(3.0, tmp_path / "columns", target_store=True, **kwargs).convert(structures)
+
+    stored = torch.load(tmp_path / "columns" / "0.pt", weights_only=False)
+    assert stored.get("energy") is None and stored.get("forces") is None
+    assert stored["formula"] == structures[0].get_chemical_formula()
+
+    expected, dataset = GraphDataset(tmp_path / "graphs"), GraphDataset(tmp_path / "columns")
+    assert dataset.targets is not None and expected.targets is None
+    assert dataset.targets.keys == ["energy", "forces", "n_electrons"]
+    for i in range(len(dataset)):
+        exp, data = expected[i], dataset[i]
+        assert sorted(exp.keys()) == sorted(data.keys())
+        for k in ["energy", "forces", "n_electrons"]:
+            assert data[k].dtype == exp[k].dtype
+            assert torch.equal(data[k], exp[k])
+
+    # label-only passes without opening the graph files
+    energies = dataset.targets.column("energy")
+    assert energies.shape == (len(structures), 1, 1)
+    assert energies[:, 0, 0].tolist() == [at.info["energy"] for at in structures]
+    assert dataset.targets.column("n_electrons", [2, 1])[:, 0, 0].tolist() == [
+        structures[2].numbers.sum(),
+        structures[1].numbers.sum(),
+    ]
+    with pytest.raises(ValueError):
+        dataset.targets.column("forces")
+
+
+def test_ListDataConverter_target_store_resume(tmp_path: pathlib.Path, atoms_list):
+    ListDataConverter(3.0, tmp_path, target_store=True).convert(atoms_list[:3])
+    # an interrupted conversion leaves the targets of a graph without its manifest row,
+    # and a row torn in the middle
+    with open(tmp_path / "targets" / "energy.bin", "ab") as f:
+        f.write(np.array([[100.0]], dtype=np.float32).tobytes())
+    with open(tmp_path / "targets" / "energy.rows.bin", "ab") as f:
+        f.write(np.array([3, 1], dtype=np.int64).tobytes())
+        f.write(np.array([4], dtype=np.int64).tobytes()[:5])
+
+    ListDataConverter(3.0, tmp_path, target_store=True).convert(atoms_list)
+    dataset = GraphDataset(tmp_path)
+    assert len(dataset) == len(atoms_list)
+    assert dataset.targets is not None
+    assert dataset.targets.column("energy")[:, 0, 0].tolist() == [at.info["energy"] for at in atoms_list]
+
+
+@pytest.mark.parametrize("precompute_triplets", [False, True])
+def test_ListDataConverter_reorder_atoms(tmp_path: pathlib.Path, precompute_triplets: bool):
+    rng = np.random.default_rng(0)
+    atoms_list = []
+    for i, at in enumerate([bulk("Si", "diamond", a=5.43, cubic=True).repeat(2), molecule("C6H6")]):
+        # atoms in random order, which is far from the spatial order
+        at = at[rng.permutation(len(at))]
+        at.rattle(0.05, seed=i)
+        at.info["energy"] = -float(i)
+        at.info["forces"] = rng.normal(size=(len(at), 3))
+        atoms_list.append(at)
+    kwargs = dict(max_neighbors=16, remove_batch_key=["forces"], precompute_triplets=precompute_triplets)
+    ListDataConverter(4.0, tmp_path / "plain", **kwargs).convert(atoms_list)
+    ListDataConverter(4.0, tmp_path / "reorder", reorder_atoms=True, **kwargs).convert(atoms_list)
+    plain, reordered = GraphDataset(tmp_path / "plain"), GraphDataset(tmp_path / "reorder")
+
+    for at, data, ref in zip(atoms_list, reordered, plain):
+        order = data[GraphKeys.Atom_idx]
+        assert sorted(order.tolist()) == list(range(len(at)))
+        assert torch.equal(restore_atom_order(data[GraphKeys.Pos], data), ref[GraphKeys.Pos])
+        assert torch.equal(restore_atom_order(data["forces"], data), ref["forces"])
+        assert restore_atom_order(ref["forces"], ref) is ref["forces"]
+        # the edges are ordered by the source atom, and the neighbors are close in index
+        edge_src, edge_dst = data[GraphKeys.Edge_idx]
+        assert torch.all(edge_src[1:] >= edge_src[:-1])
+        ref_src, ref_dst = ref[GraphKeys.Edge_idx]
+        assert (edge_src - edge_dst).abs().float().mean() < (ref_src - ref_dst).abs().float().mean()
+        if precompute_triplets:
+            assert torch.all(data[GraphKeys.Edge_idx_st_3b][1:] >= data[GraphKeys.Edge_idx_st_3b][:-1])
+
+    torch.manual_seed(0)
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, max_z=14, n_interaction=1, regress_forces=True)
+    model.eval()
+    batch, ref_batch = Batch.from_data_list(list(reordered)), Batch.from_data_list(list(plain))
+    energy, forces = model(batch)
+    ref_energy, ref_forces = model(ref_batch)
+    assert torch.allclose(energy, ref_energy, atol=1e-4)
+    assert torch.allclose(restore_atom_order(forces, batch), ref_forces, atol=1e-4)
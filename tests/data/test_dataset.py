@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import pathlib
+
+import ase.db
+import ase.io
+import numpy as np
+import pytest
+import torch
+from ase import Atoms
+from ase.build import bulk, molecule
+from ase.calculators.singlepoint import SinglePointCalculator
+from torch_geometric.loader import DataLoader
+
+from lcaonet.data.cache import SharedLRUCache
+from lcaonet.data.convert import (
+    ListDataConverter,
+    PackedDataWriter,
+    db_atoms,
+    iread_atoms,
+)
+from lcaonet.data.dataset import GraphDataset, LazyAseDataset, PackedGraphDataset
+from lcaonet.data.keys import GraphKeys
+from lcaonet.data.manifest import Manifest
+from lcaonet.data.utils import atoms_hash
+from lcaonet.model.lcaonet import LCAONet
+
+
+@pytest.fixture(scope="module")
+def graph_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    atoms_list = []
+    for i in range(10):
+        at = bulk("Si", "diamond", a=5.43).repeat((1, 1, i % 3 + 1)) if i % 2 == 0 else molecule("CH4")
+        at.rattle(0.05, seed=i)
+        at.info["energy"] = -float(i)
+        at.info["formula"] = at.get_chemical_formula()
+        atoms_list.append(at)
+    save_dir = tmp_path_factory.mktemp("graph")
+    ListDataConverter(4.0, save_dir, max_neighbors=12).convert(atoms_list)
+    return save_dir
+
+
+def test_PackedGraphDataset(graph_dir: pathlib.Path, tmp_path: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    with PackedDataWriter(tmp_path / "packed") as writer:
+        for data in dataset:
+            writer.write(data)
+
+    packed = PackedGraphDataset(tmp_path / "packed")
+    assert len(packed) == len(dataset)
+    for i in range(len(dataset)):
+        expected, data = dataset[i], packed[i]
+        assert sorted(expected.keys()) == sorted(data.keys())
+        for k in expected.keys():
+            if isinstance(expected[k], str):
+                assert data[k] == expected[k]
+            else:
+                assert data[k].dtype == expected[k].dtype
+                assert torch.equal(data[k], expected[k])
+    with pytest.raises(IndexError):
+        packed.get(len(dataset))
+
+    # batching through worker processes
+    loader = DataLoader(packed, batch_size=4, num_workers=2)
+    n_edges = 0
+    for batch in loader:
+        assert batch[GraphKeys.Edge_idx].max() < batch[GraphKeys.Z].size(0)
+        assert batch[GraphKeys.Lattice].size(1) == 3
+        n_edges += batch[GraphKeys.Edge_idx].size(1)
+    assert n_edges == sum(dataset[i][GraphKeys.Edge_idx].size(1) for i in range(len(dataset)))
+
+
+def test_PackedDataWriter_mismatch(graph_dir: pathlib.Path, tmp_path: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    writer = PackedDataWriter(tmp_path / "packed")
+    writer.write(dataset[0])
+    data = dataset[1]
+    del data["energy"]
+    with pytest.raises(ValueError):
+        writer.write(data)
+    writer.close()
+
+
+def test_Manifest(graph_dir: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    manifest = dataset.manifest
+    assert isinstance(manifest, Manifest)
+    assert len(manifest) == len(dataset) == 10
+
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, max_z=14, n_interaction=1)
+    for i in range(len(dataset)):
+        data = dataset[i]
+        assert manifest.n_atoms[i] == data[GraphKeys.Z].size(0)
+        assert manifest.n_edges[i] == data[GraphKeys.Edge_idx].size(1)
+        assert manifest.n_triplets[i] == model.get_triplets(data)[GraphKeys.Idx_k_3b].size(0)
+        assert manifest.species[i] == set(data[GraphKeys.Z].tolist())
+        assert manifest.formula[i] == data["formula"]
+
+    small = manifest.select(max_atoms=5)
+    assert small.tolist() == [i for i in range(10) if manifest.n_atoms[i] <= 5]
+    assert manifest.select(species=[1, 6]).tolist() == [1, 3, 5, 7, 9]
+    assert manifest.select(max_edges=0).tolist() == []
+
+    sample = manifest.sample(3, seed=0, species=[14])
+    assert len(sample) == 3 and set(sample.tolist()) <= {0, 2, 4, 6, 8}
+    assert sample.tolist() == manifest.sample(3, seed=0, species=[14]).tolist()
+    with pytest.raises(ValueError):
+        manifest.sample(6, species=[14])
+
+    subset = dataset[small]
+    assert len(subset) == len(small)
+    assert all(d[GraphKeys.Z].size(0) <= 5 for d in subset)
+
+
+def test_SharedLRUCache():
+    cache = SharedLRUCache(5, max_bytes=4 * 16, slot_size=16)
+    assert cache.get(0) is None
+    assert cache.put(0, b"a" * 20) and cache.put(1, b"b" * 16)
+    assert cache.get(0) == b"a" * 20
+    # 1 is the least recently used, and is evicted
+    assert cache.put(2, b"c" * 20)
+    assert 1 not in cache and 0 in cache and 2 in cache
+    assert cache.get(2) == b"c" * 20
+    assert not cache.put(3, b"d" * 65)
+    assert cache.stats() == {
+        "hits": 2,
+        "misses": 1,
+        "hit_rate": 2 / 3,
+        "n_items": 2,
+        "n_bytes": 40,
+        "max_bytes": 64,
+    }
+    # 0 is evicted for an empty item which needs a slot
+    assert cache.put(4, b"")
+    assert cache.get(4) == b"" and 0 not in cache
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 0
+
+
+def test_SharedLRUCache_eviction():
+    n_items = 1000
+    cache = SharedLRUCache(n_items, max_bytes=64 * 16, slot_size=16)
+    values = [bytes([i % 256]) * (i % 40) for i in range(n_items)]
+    # fill the cache far beyond its capacity while reading the first items, which are put again if evicted
+    for i, v in enumerate(values):
+        assert cache.put(i, v)
+        if cache.get(i % 10) is None:
+            cache.put(i % 10, values[i % 10])
+    cached = [i for i in range(n_items) if i in cache]
+    assert 0 < len(cached) <= cache.n_slots
+    assert all(cache.get(i) == values[i] for i in cached)
+    assert cache.n_bytes == sum(len(values[i]) for i in cached)
+    # the recently used items are rarely evicted
+    assert cache.hits > 0.9 * n_items
+
+    # all slots are returned to the free list by the eviction
+    idx = next(i for i in range(n_items) if i not in cache)
+    assert cache.put(idx, b"x" * cache.max_bytes)
+    assert len(cache) == 1 and cache.get(idx) == b"x" * cache.max_bytes
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_GraphDataset_cache(graph_dir: pathlib.Path, num_workers: int):
+    dataset = GraphDataset(graph_dir)
+    cached = GraphDataset(graph_dir, cache_bytes=1 << 20)
+    assert cached.cache is not None
+
+    loader = DataLoader(cached, batch_size=3, num_workers=num_workers)
+    expected = list(DataLoader(dataset, batch_size=3))
+    for _ in range(2):
+        for batch, exp in zip(loader, expected):
+            for k in exp.keys():
+                if isinstance(exp[k], torch.Tensor):
+                    assert torch.equal(batch[k], exp[k])
+    # the cache filled by the workers is shared with the main process
+    assert cached.cache.misses == len(dataset)
+    assert cached.cache.hits == len(dataset)
+    assert len(cached.cache) == len(dataset)
+
+    # a small cache keeps only the recently used graphs
+    small = GraphDataset(graph_dir, cache_bytes=cached.cache.n_bytes // 2)
+    for i in range(len(small)):
+        small[i]
+    assert small.cache is not None and 0 < len(small.cache) < len(small)
+    assert small.cache.n_bytes <= small.cache.max_bytes
+    assert len(small) - 1 in small.cache
+
+
+@pytest.mark.parametrize("backend", ["db", "traj"])
+def test_LazyAseDataset(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, backend: str):
+    atoms_list = []
+    for i in range(6):
+        at = bulk("Si", "diamond", a=5.43).repeat((1, 1, i % 2 + 1)) if i % 2 == 0 else molecule("CH4")
+        at.rattle(0.05, seed=i)
+        at.calc = SinglePointCalculator(at, energy=-float(i))
+        atoms_list.append(at)
+    if backend == "db":
+        source = tmp_path / "structures.db"
+        with ase.db.connect(source) as db:
+            for at in atoms_list:
+                db.write(at, tag=1)
+    else:
+        source = tmp_path / "structures.traj"
+        with ase.io.Trajectory(source, "w") as traj:
+            for at in atoms_list:
+                traj.write(at)
+
+    structures = db_atoms(source) if backend == "db" else iread_atoms(source)
+    ListDataConverter(4.0, tmp_path / "converted", max_neighbors=12).convert(structures)
+    expected = GraphDataset(tmp_path / "converted")
+
+    dataset = LazyAseDataset(source, tmp_path / "cache", 4.0, max_neighbors=12, compact=True)
+    assert len(dataset) == len(expected)
+    # the structures are not hashed before they are requested
+    assert not np.load(dataset._index_path).any()
+    # the first epoch converts the structures in the workers
+    for _ in range(2):
+        loader = DataLoader(dataset, batch_size=2, num_workers=2)
+        for batch, exp in zip(loader, DataLoader(expected, batch_size=2)):
+            for k in exp.keys():
+                assert batch[k].dtype == exp[k].dtype
+                assert torch.allclose(batch[k], exp[k])
+        assert len(list(dataset.cache_dir.glob("*.pt"))) == len(dataset)
+
+    # the cache is used by another dataset with the same parameters, without reading the structures
+    assert len(list(dataset.cache_dir.glob("index_*.npy"))) == 1
+    cached = LazyAseDataset(source, tmp_path / "cache", 4.0, max_neighbors=12, compact=True)
+    monkeypatch.setattr(cached.converter, "atoms2graph", None)
+    monkeypatch.setattr(cached, "read_atoms", None)
+    assert torch.equal(cached[3][GraphKeys.Pos], expected[3][GraphKeys.Pos])
+    assert cached.structure_hash(3) == atoms_hash(dataset.read_atoms(3))
+    other = LazyAseDataset(source, tmp_path / "cache", 5.0, max_neighbors=12)
+    assert other.cache_dir != dataset.cache_dir
+    assert other.get_atoms(1).info["energy"] == -1.0
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_GraphDataset_restrict(tmp_path: pathlib.Path, edge_set, compact: bool):
+    atoms_list = []
+    for i in range(6):
+        at = bulk("Si", "diamond", a=5.43).repeat((1, 1, i % 3 + 1)) if i % 2 == 0 else molecule("CH4")
+        at.rattle(0.05, seed=i)
+        atoms_list.append(at)
+    atoms_list.append(Atoms("H2", positions=[[0.0, 0.0, 0.0], [0.0, 0.0, 3.0]]))
+    kwargs = dict(compact=compact, half_edges=compact)
+    ListDataConverter(5.0, tmp_path / "large", max_neighbors=32, **kwargs).convert(atoms_list)
+    ListDataConverter(2.5, tmp_path / "small", max_neighbors=8, **kwargs).convert(atoms_list)
+
+    restricted = GraphDataset(tmp_path / "large", cutoff=2.5, max_neighbors=8)
+    expected = GraphDataset(tmp_path / "small")
+    for i in range(len(expected)):
+        data, exp = restricted[i], expected[i]
+        assert data[GraphKeys.Neighbors].tolist() == exp[GraphKeys.Neighbors].tolist()
+        assert torch.equal(data[GraphKeys.Edge_idx][0], exp[GraphKeys.Edge_idx][0])
+        # the nearest neighbors at the same distance may be ordered differently
+        assert edge_set(data) == edge_set(exp)
+
+    # only the given one is restricted
+    assert GraphDataset(tmp_path / "large", max_neighbors=8).cutoff == 5.0
+    with pytest.raises(ValueError):
+        GraphDataset(tmp_path / "large", cutoff=6.0)
+    with pytest.raises(ValueError):
+        GraphDataset(tmp_path / "large", max_neighbors=64)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import pathlib
+
+import pytest
+import torch
+from ase.build import bulk, molecule
+from torch.utils.data import DataLoader as TorchDataLoader
+from torch_geometric.loader import DataLoader
+
+from lcaonet.data.convert import ListDataConverter
+from lcaonet.data.dataset import GraphDataset
+from lcaonet.data.keys import GraphKeys
+from lcaonet.data.loader import BatchCache, GraphDataLoader, write_batch_cache
+from lcaonet.data.sampler import BudgetBatchSampler
+from lcaonet.model.lcaonet import LCAONet
+
+
+@pytest.fixture(scope="module")
+def graph_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    atoms_list = []
+    for i in range(12):
+        at = bulk("Si", "diamond", a=5.43).repeat((1, 1, i % 3 + 1)) if i % 2 == 0 else molecule("CH4")
+        at.rattle(0.05, seed=i)
+        at.info["energy"] = -float(i)
+        atoms_list.append(at)
+    save_dir = tmp_path_factory.mktemp("graph")
+    ListDataConverter(4.0, save_dir, max_neighbors=12).convert(atoms_list)
+    return save_dir
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_GraphDataLoader(graph_dir: pathlib.Path, num_workers: int):
+    dataset = GraphDataset(graph_dir)
+    loader = GraphDataLoader(dataset, batch_size=4, num_workers=num_workers, prefetch_factor=3)
+    expected_loader = DataLoader(dataset, batch_size=4)
+
+    torch.manual_seed(0)
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, max_z=14, n_interaction=1, regress_forces=True)
+    n_batches = 0
+    for batch, expected in zip(loader, expected_loader):
+        n_batches += 1
+        for k in [GraphKeys.Idx_k_3b, GraphKeys.Edge_idx_ks_3b, GraphKeys.Edge_idx_st_3b, GraphKeys.Edge_shift_vec]:
+            assert batch.get(k) is not None
+        assert batch[GraphKeys.Idx_k_3b].size(0) == model.get_triplets(expected.clone())[GraphKeys.Idx_k_3b].size(0)
+
+        energy, forces = model(batch)
+        expected_energy, expected_forces = model(expected)
+        assert torch.allclose(energy, expected_energy, atol=1e-5)
+        assert torch.allclose(forces, expected_forces, atol=1e-5)
+    assert n_batches == len(expected_loader) == 3
+
+
+def test_GraphDataLoader_batch_sampler(graph_dir: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    sampler = BudgetBatchSampler(dataset, max_edges=500, seed=0)
+    loader = GraphDataLoader(dataset, batch_sampler=sampler, num_workers=2, precompute_triplets=False)
+    n_graphs = 0
+    for batch in loader:
+        n_graphs += batch.num_graphs
+        assert batch.get(GraphKeys.Idx_k_3b) is None
+        assert batch[GraphKeys.Edge_shift_vec].size(0) == batch[GraphKeys.Edge_idx].size(1)
+    assert n_graphs == len(dataset)
+
+
+def test_GraphDataLoader_collate_fn(graph_dir: pathlib.Path):
+    with pytest.raises(ValueError):
+        GraphDataLoader(GraphDataset(graph_dir), batch_size=4, collate_fn=lambda x: x)
+
+
+@pytest.mark.parametrize("shared_memory", [False, True])
+def test_BatchCache(graph_dir: pathlib.Path, tmp_path: pathlib.Path, shared_memory: bool):
+    dataset = GraphDataset(graph_dir)
+    # the last batch has fewer graphs
+    assert write_batch_cache(GraphDataLoader(dataset, batch_size=5), tmp_path) == 3
+    cache = BatchCache(tmp_path, shared_memory=shared_memory)
+    assert len(cache) == 3
+
+    torch.manual_seed(0)
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, max_z=14, n_interaction=1, regress_forces=True)
+    expected = [model(b) for b in DataLoader(dataset, batch_size=5)]
+    for loader in [cache, TorchDataLoader(cache, batch_size=None, num_workers=2)]:
+        n_batches = 0
+        for batch, (expected_energy, expected_forces) in zip(loader, expected):
+            n_batches += 1
+            assert batch.get(GraphKeys.Edge_shift_vec) is not None
+            energy, forces = model(batch)
+            assert torch.allclose(energy, expected_energy, atol=1e-5)
+            assert torch.allclose(forces, expected_forces, atol=1e-5)
+        assert n_batches == 3
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import csv
+import json
+import pathlib
+
+import numpy as np
+import pytest
+from ase.build import bulk, molecule
+
+from lcaonet.data.convert import ListDataConverter
+from lcaonet.data.dataset import GraphDataset
+from lcaonet.data.keys import GraphKeys
+from lcaonet.data.report import dataset_report
+from lcaonet.data.utils import count_triplets
+
+
+@pytest.fixture(scope="module")
+def graph_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    atoms_list = []
+    for i in range(9):
+        at = bulk("Cu", "fcc", a=3.6).repeat((1, 1, i % 3 + 1)) if i % 2 == 0 else molecule("CH3OH")
+        at.rattle(0.05, seed=i)
+        atoms_list.append(at)
+    save_dir = tmp_path_factory.mktemp("graph")
+    # 12 nearest neighbors in fcc Cu, and more within the cutoff radius
+    ListDataConverter(4.0, save_dir, max_neighbors=12).convert(atoms_list)
+    return save_dir
+
+
+def test_dataset_report(graph_dir: pathlib.Path, tmp_path: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    report = dataset_report(dataset, bins=5)
+    assert len(report) == len(dataset)
+    for i, data in enumerate(dataset):
+        n_atoms = data[GraphKeys.Z].size(0)
+        assert report.sizes["n_atoms"][i] == n_atoms
+        assert report.sizes["n_edges"][i] == data[GraphKeys.Edge_idx].size(1)
+        assert report.sizes["n_triplets"][i] == count_triplets(data[GraphKeys.Edge_idx].numpy(), n_atoms)
+        # all Cu atoms have more than 12 neighbors within the cutoff radius
+        assert report.n_truncated[i] == (n_atoms if i % 2 == 0 else 0)
+
+    summary = report.summary()
+    assert summary["n_graphs"] == 9
+    assert summary["species"] == {"max_z": 29, "n_graphs": {"1": 4, "6": 4, "8": 4, "29": 5}}
+    assert summary["n_atoms"]["max"] == 6 and summary["n_atoms"]["total"] == int(report.sizes["n_atoms"].sum())
+    assert sum(summary["n_edges"]["hist"]["counts"]) == 9
+    assert len(summary["n_edges"]["hist"]["bin_edges"]) == 6
+    assert summary["truncation"]["n_graphs"] == 5
+    assert summary["truncation"]["n_atoms"] == int(report.sizes["n_atoms"][::2].sum())
+
+    report.to_json(tmp_path / "report.json")
+    with open(tmp_path / "report.json") as f:
+        assert json.load(f) == summary
+    report.to_csv(tmp_path / "report.csv")
+    with open(tmp_path / "report.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [int(r["n_triplets"]) for r in rows] == report.sizes["n_triplets"].tolist()
+    assert rows[1]["species"] == "1 6 8"
+
+    # a subset of the dataset
+    subset = dataset_report(dataset[[1, 4]])
+    assert subset.index.tolist() == [1, 4]
+    assert subset.sizes["n_atoms"].tolist() == report.sizes["n_atoms"][[1, 4]].tolist()
+
+
+@pytest.mark.parametrize("n_workers, chunksize", [(1, 2), (2, 4)])
+def test_dataset_report_without_manifest(graph_dir: pathlib.Path, n_workers: int, chunksize: int):
+    expected = dataset_report(GraphDataset(graph_dir))
+    # the restricted graphs are counted from the graphs
+    restricted = GraphDataset(graph_dir, cutoff=3.0)
+    report = dataset_report(restricted, n_workers=n_workers, chunksize=chunksize)
+    assert report.sizes["n_atoms"].tolist() == expected.sizes["n_atoms"].tolist()
+    for k in ["n_edges", "n_triplets"]:
+        assert np.all(report.sizes[k] <= expected.sizes[k])
+    assert report.species == expected.species
+    assert report.summary()["truncation"] is None
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import pathlib
+
+import numpy as np
+import pytest
+from ase.build import bulk, molecule
+from torch_geometric.loader import DataLoader
+
+from lcaonet.data.convert import ListDataConverter, PackedDataWriter
+from lcaonet.data.dataset import GraphDataset, PackedGraphDataset
+from lcaonet.data.keys import GraphKeys
+from lcaonet.data.sampler import BudgetBatchSampler, graph_sizes
+
+
+@pytest.fixture(scope="module")
+def graph_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    atoms_list = []
+    for i in range(30):
+        if i % 3 == 0:
+            at = bulk("Si", "diamond", a=5.43).repeat((1, 1, i % 4 + 1))
+        else:
+            at = molecule("CH4" if i % 3 == 1 else "C6H6")
+        at.rattle(0.05, seed=i)
+        at.info["energy"] = -float(i)
+        atoms_list.append(at)
+    save_dir = tmp_path_factory.mktemp("graph")
+    ListDataConverter(4.0, save_dir, max_neighbors=12).convert(atoms_list)
+    return save_dir
+
+
+def test_graph_sizes(graph_dir: pathlib.Path, tmp_path: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    sizes = graph_sizes(dataset)
+    # without the manifest, the sizes are counted from the graphs
+    with PackedDataWriter(tmp_path / "packed") as writer:
+        for data in dataset:
+            writer.write(data)
+    counted = graph_sizes(PackedGraphDataset(tmp_path / "packed"))
+    for k in ["n_atoms", "n_edges", "n_triplets"]:
+        assert np.array_equal(sizes[k], counted[k])
+
+    subset = dataset[[3, 1, 4]]
+    assert graph_sizes(subset)["n_edges"].tolist() == sizes["n_edges"][[3, 1, 4]].tolist()
+
+
+@pytest.mark.parametrize(
+    "budget",
+    [{"max_atoms": 20}, {"max_edges": 300}, {"max_edges": 300, "max_triplets": 3000}],
+)
+def test_BudgetBatchSampler(graph_dir: pathlib.Path, budget: dict[str, int]):
+    dataset = GraphDataset(graph_dir)
+    sizes = graph_sizes(dataset)
+    sampler = BudgetBatchSampler(dataset, seed=0, bucket_size=8, **budget)
+    batches = list(sampler)
+    assert len(batches) == len(sampler)
+    assert sorted(i for b in batches for i in b) == list(range(len(dataset)))
+    for b in batches:
+        for k, v in budget.items():
+            key = k.replace("max_", "n_")
+            # only a graph larger than the budget may exceed it
+            assert sizes[key][b].sum() <= v or len(b) == 1
+
+    # reproducible by seed, and changed by epoch
+    assert list(BudgetBatchSampler(dataset, seed=0, bucket_size=8, **budget)) == batches
+    sampler.set_epoch(1)
+    assert list(sampler) != batches
+    assert list(BudgetBatchSampler(dataset, shuffle=False, **budget)) == list(
+        BudgetBatchSampler(dataset, shuffle=False, seed=1, **budget)
+    )
+
+    loader = DataLoader(dataset, batch_sampler=sampler)
+    n_graphs = 0
+    for batch in loader:
+        n_graphs += batch.num_graphs
+        assert batch[GraphKeys.Edge_idx].max() < batch[GraphKeys.Z].size(0)
+    assert n_graphs == len(dataset)
+
+
+def test_BudgetBatchSampler_invalid(graph_dir: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    with pytest.raises(ValueError):
+        BudgetBatchSampler(dataset)
+    with pytest.raises(ValueError):
+        BudgetBatchSampler(dataset, max_atoms=10, bucket_size=0)
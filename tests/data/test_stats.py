@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import pathlib
+
+import numpy as np
+import pytest
+import torch
+from ase.build import molecule
+
+from lcaonet.data.convert import ListDataConverter
+from lcaonet.data.dataset import GraphDataset
+from lcaonet.data.keys import GraphKeys
+from lcaonet.data.stats import dataset_statistics
+from lcaonet.nn.post import PostProcess
+
+REFS = {1: -0.5, 6: -38.0, 7: -54.5, 8: -75.0}
+
+
+@pytest.fixture(scope="module")
+def graph_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    rng = np.random.default_rng(0)
+    atoms_list = []
+    for i, name in enumerate(["CH4", "H2O", "NH3", "C2H6", "CH3OH", "C6H6", "HCOOH", "CH3CH2OH", "N2", "CO2"] * 3):
+        at = molecule(name)
+        at.rattle(0.01, seed=i)
+        e = sum(REFS[int(z)] for z in at.numbers) + 0.1 * rng.standard_normal()
+        at.info["energy"] = float(e)
+        at.info["gap"] = np.array([len(at) / 10, 1.0]) + 0.1 * rng.standard_normal(2)
+        atoms_list.append(at)
+    save_dir = tmp_path_factory.mktemp("graph")
+    ListDataConverter(3.0, save_dir).convert(atoms_list)
+    return save_dir
+
+
+def _targets(dataset: GraphDataset, key: str) -> tuple[np.ndarray, np.ndarray]:
+    counts = np.stack([np.bincount(d[GraphKeys.Z].numpy(), minlength=9) for d in dataset])
+    y = np.stack([d[key].reshape(-1).numpy() for d in dataset]).astype(np.float64)
+    return counts, y
+
+
+@pytest.mark.parametrize("n_workers, chunksize", [(1, 1024), (1, 7), (2, 4)])
+def test_dataset_statistics_extensive(graph_dir: pathlib.Path, n_workers: int, chunksize: int):
+    dataset = GraphDataset(graph_dir)
+    stats = dataset_statistics(dataset, "energy", max_z=8, n_workers=n_workers, chunksize=chunksize)
+    atomref, mean, std = stats["atomref"], stats["mean"], stats["std"]
+    assert atomref is not None and atomref.shape == (9, 1)
+    assert mean.shape == std.shape == (1,)
+
+    counts, y = _targets(dataset, "energy")
+    expected = np.linalg.lstsq(counts[:, [1, 6, 7, 8]], y, rcond=None)[0]
+    assert np.allclose(atomref[[1, 6, 7, 8]].numpy(), expected, atol=1e-3)
+    assert torch.count_nonzero(atomref[[0, 2, 3, 4, 5]]) == 0
+    for z, ref in REFS.items():
+        assert abs(atomref[z, 0].item() - ref) < 0.2
+
+    per_atom = (y - counts @ atomref.double().numpy()) / counts.sum(axis=1, keepdims=True)
+    assert np.allclose(mean.numpy(), per_atom.mean(axis=0), atol=1e-6)
+    assert np.allclose(std.numpy(), per_atom.std(axis=0), atol=1e-6)
+
+    # the post process with these values predicts the mean of the residual per atom
+    pp = PostProcess(1, True, atomref, mean)
+    z = torch.cat([d[GraphKeys.Z] for d in dataset])
+    batch_idx = torch.cat([torch.full((d[GraphKeys.Z].size(0),), i) for i, d in enumerate(dataset)])
+    pred = pp(torch.zeros(len(dataset), 1), z, batch_idx)
+    assert np.allclose(((y - pred.double().numpy()) / counts.sum(axis=1, keepdims=True)).mean(), 0.0, atol=1e-6)
+
+
+def test_dataset_statistics_intensive(graph_dir: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    counts, y = _targets(dataset, "gap")
+
+    stats = dataset_statistics(dataset, "gap", max_z=8, is_extensive=False, fit_atomref=False)
+    assert stats["atomref"] is None
+    assert np.allclose(stats["mean"].numpy(), y.mean(axis=0), atol=1e-6)
+    assert np.allclose(stats["std"].numpy(), y.std(axis=0), atol=1e-6)
+
+    stats = dataset_statistics(dataset, "gap", max_z=8, is_extensive=False, n_workers=2, chunksize=5)
+    atomref = stats["atomref"]
+    assert atomref is not None and atomref.shape == (9, 2)
+    fractions = counts / counts.sum(axis=1, keepdims=True)
+    residual = y - fractions @ atomref.double().numpy()
+    assert np.allclose(stats["mean"].numpy(), residual.mean(axis=0), atol=1e-5)
+    assert np.allclose(stats["std"].numpy(), residual.std(axis=0), atol=1e-5)
+
+
+def test_dataset_statistics_invalid(graph_dir: pathlib.Path):
+    dataset = GraphDataset(graph_dir)
+    with pytest.raises(ValueError):
+        dataset_statistics(dataset, "energy", max_z=6)
@@ -8,7 +8,7 @@ from torch_geometric.data import Data
 from torch_geometric.nn.inits import glorot_orthogonal
 
 from lcaonet.data.keys import GraphKeys
-from lcaonet.model.lcaonet import LCAONet, LCAOOut
+from lcaonet.model.lcaonet import LCAOInteraction, LCAONet, LCAOOut
 from lcaonet.nn.cutoff import BaseCutoff
 
 
@@ -116,6 +116,8 @@ param_LCAONet = [
     (16, 16, 10, 1, 2, 2.0, "envelope", None, True, False, False, True, "sphericalbessel", None, False, False, True),
     (16, 16, 10, 1, 2, 2.0, "envelope", None, True, True, True, True, "sphericalbessel", None, False, False, True),
     (16, 16, 10, 1, 2, 2.0, "envelope", "4p", True, True, True, True, "sphericalbessel", None, False, False, True),
+    (16, 16, 10, 1, 1, 2.0, "envelope", None, True, False, False, True, "slater", None, False, False, True),
+    (16, 16, 10, 1, 2, 2.0, "envelope", "4p", True, True, True, True, "slater", None, False, False, True),
     # mean and atomref test
     (16, 16, 10, 1, 1, 2.0, "envelope", None, True, False, False, True, "hydrogen", torch.tensor([1.0]), False, False, True),
     (16, 16, 10, 1, 1, 2.0, "envelope", None, True, False, False, False, "hydrogen", torch.tensor([1.0]), False, False, True),
@@ -241,3 +243,45 @@ def test_LCAONet(
             optimizer.step()
             min_loss = min(float(loss), min_loss)
         assert min_loss < 2
+
+
+@pytest.mark.parametrize("rbf_type", ["hydrogen", "sphericalbessel"])
+def test_LCAONet_rbf_max_error(one_graph_data: Data, rbf_type: str):
+    max_z = one_graph_data[GraphKeys.Z].max().item()
+    kwargs = dict(emb_size=16, emb_size_coeff=16, emb_size_conv=10, n_interaction=2, cutoff=6.0, max_z=max_z)
+    kwargs.update(rbf_type=rbf_type, regress_forces=True, direct_forces=False)
+    model = LCAONet(**kwargs).eval()
+    model_tab = LCAONet(**kwargs, rbf_max_error=1e-6).eval()
+    # the table is not in the state_dict, so that the trained weights can be loaded
+    model_tab.load_state_dict(model.state_dict())
+
+    e, f = model(one_graph_data.clone())
+    e_tab, f_tab = model_tab(one_graph_data.clone())
+    assert torch.allclose(e_tab, e, rtol=1e-4, atol=1e-4)
+    assert torch.allclose(f_tab, f, rtol=1e-3, atol=1e-3)
+
+
+@pytest.mark.parametrize("n_per_orb", [1, 3])
+@pytest.mark.parametrize("add_valence", [False, True])
+def test_LCAOInteraction_expand_idx(n_per_orb: int, add_valence: bool):
+    n_node, n_edge, n_triplet, n_basis = 5, 12, 30, 4
+    n_orb = n_basis * n_per_orb
+    expand_idx = torch.arange(n_basis).repeat_interleave(n_per_orb)
+    inte = LCAOInteraction(8, 6, 4, add_valence, weight_init=glorot_orthogonal)
+
+    x = torch.randn(n_node, 8)
+    cst = torch.randn(n_edge, n_orb, 6)
+    valence_mask = torch.randint(2, (n_edge, n_orb, 4)).float() if add_valence else None
+    rb = torch.randn(n_edge, n_basis)
+    three_body_orbs = torch.randn(n_triplet, n_basis)
+    idx_s, idx_t = torch.randint(n_node, (2, n_edge))
+    tri_idx_k = torch.randint(n_node, (n_triplet,))
+    edge_idx_ks, edge_idx_st = torch.randint(n_edge, (2, n_triplet))
+    idx = (idx_s, idx_t, tri_idx_k, edge_idx_ks, edge_idx_st)
+
+    out = inte(x, cst, valence_mask, rb, three_body_orbs, expand_idx, *idx)
+    # the same as the basis of all orbitals including the copies
+    out_expanded = inte(
+        x, cst, valence_mask, rb[:, expand_idx], three_body_orbs[:, expand_idx], torch.arange(n_orb), *idx
+    )
+    assert torch.allclose(out, out_expanded, rtol=1e-5, atol=1e-5)
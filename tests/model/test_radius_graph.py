@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+import torch
+from ase import Atoms
+from ase.build import bulk, fcc111, molecule
+from torch_geometric.data import Batch
+
+from lcaonet.data.convert import atoms2graphdata
+from lcaonet.data.keys import GraphKeys
+from lcaonet.model.base import BaseMPNN
+from lcaonet.model.lcaonet import LCAONet
+
+
+def _neighbor_dists(data) -> list[np.ndarray]:
+    # distances of the neighbors of each atom, which do not depend on how ties are broken
+    graph = BaseMPNN.calc_atomic_distances(data.clone())
+    src = graph[GraphKeys.Edge_idx][0].numpy()
+    dist = graph[GraphKeys.Edge_dist].numpy()
+    return [np.sort(dist[src == i]) for i in range(graph[GraphKeys.Z].size(0))]
+
+
+def _atoms_list() -> list[Atoms]:
+    small_cell = bulk("Cu", "fcc", a=3.6)
+    supercell = bulk("Si", "diamond", a=5.43, cubic=True).repeat((2, 2, 1))
+    supercell.positions += 7.0  # atoms outside of the cell
+    triclinic = bulk("NaCl", "rocksalt", a=5.64).repeat((2, 1, 1))
+    slab = fcc111("Al", size=(2, 2, 3), vacuum=5.0)
+    mol = molecule("C6H6")
+    isolated = Atoms("H2", positions=[[0.0, 0.0, 0.0], [0.0, 0.0, 10.0]])
+    # the cell vectors along the non-periodic directions are zero
+    chain = Atoms("C4", positions=[[1.4 * i, 0.0, 0.0] for i in range(4)], cell=[5.6, 0.0, 0.0])
+    chain.pbc = [True, False, False]
+    sheet = Atoms(
+        "C2", positions=[[0.0, 0.0, 0.0], [1.2, 0.7, 0.0]], cell=[[2.46, 0.0, 0.0], [1.23, 2.13, 0.0], [0.0, 0.0, 0.0]]
+    )
+    sheet.pbc = [True, True, False]
+    atoms_list = [small_cell, supercell, triclinic, slab, mol, isolated, chain, sheet]
+    for i, at in enumerate(atoms_list):
+        at.rattle(0.02, seed=i)
+    return atoms_list
+
+
+param_calc_radius_graph = [
+    (5.0, 100),
+    (5.0, 12),
+    (3.0, 6),
+]
+
+
+@pytest.mark.parametrize("cutoff, max_neighbors", param_calc_radius_graph)
+def test_calc_radius_graph(edge_set, cutoff: float, max_neighbors: int):
+    atoms_list = _atoms_list()
+    data_list = [atoms2graphdata(at, False, cutoff, max_neighbors) for at in atoms_list]
+
+    for data in data_list:
+        graph = BaseMPNN.calc_radius_graph(data.clone(), cutoff, max_neighbors)
+        assert torch.equal(graph[GraphKeys.Edge_idx][0], data[GraphKeys.Edge_idx][0])
+        if max_neighbors >= 100:
+            assert edge_set(graph) == edge_set(data)
+        # with truncation, symmetrically equivalent images at the same distance may be chosen differently
+        for d_otf, d_ase in zip(_neighbor_dists(graph), _neighbor_dists(data)):
+            assert np.allclose(d_otf, d_ase, atol=1e-5)
+
+    batch = Batch.from_data_list(data_list)
+    graph = BaseMPNN.calc_radius_graph(batch.clone(), cutoff, max_neighbors)
+    assert graph[GraphKeys.Neighbors].tolist() == batch[GraphKeys.Neighbors].tolist()
+    for d_otf, d_ase in zip(_neighbor_dists(graph), _neighbor_dists(batch)):
+        assert np.allclose(d_otf, d_ase, atol=1e-5)
+
+
+def test_LCAONet_otf_graph():
+    atoms_list = _atoms_list()
+    batch = Batch.from_data_list([atoms2graphdata(at, False, 4.0, 16) for at in atoms_list])
+    raw = Batch.from_data_list([atoms2graphdata(at, False, 4.0, 16) for at in atoms_list])
+    del raw[GraphKeys.Edge_idx], raw[GraphKeys.Edge_shift]
+
+    torch.manual_seed(0)
+    model = LCAONet(emb_size=8, emb_size_coeff=8, emb_size_conv=8, cutoff=4.0, max_z=29, n_interaction=1)
+    torch.manual_seed(0)
+    model_otf = LCAONet(
+        emb_size=8,
+        emb_size_coeff=8,
+        emb_size_conv=8,
+        cutoff=4.0,
+        max_z=29,
+        n_interaction=1,
+        otf_graph=True,
+        max_neighbors=16,
+    )
+    with torch.no_grad():
+        assert torch.allclose(model(batch), model_otf(raw), atol=1e-4)
+
+
+@pytest.mark.parametrize("precompute_triplets", [False, True])
+@pytest.mark.parametrize("direct_forces", [False, True])
+def test_LCAONet_filter_edges(precompute_triplets: bool, direct_forces: bool):
+    atoms_list = _atoms_list()
+    # the graphs of the larger cutoff radius than that of the model
+    large = Batch.from_data_list([atoms2graphdata(at, False, 5.0, 100, precompute_triplets) for at in atoms_list])
+    small = Batch.from_data_list([atoms2graphdata(at, False, 3.5, 100) for at in atoms_list])
+
+    torch.manual_seed(0)
+    kwargs = dict(emb_size=8, emb_size_coeff=8, emb_size_conv=8, cutoff=3.5, max_z=29, n_interaction=2)
+    model = LCAONet(**kwargs, regress_forces=True, direct_forces=direct_forces)
+    torch.manual_seed(0)
+    model_nofilter = LCAONet(**kwargs, regress_forces=True, direct_forces=direct_forces, drop_far_edges=False)
+    # the batch normalization of the coefficient vectors in the training mode depends on all edges
+    model.eval()
+    model_nofilter.eval()
+
+    graph = BaseMPNN.calc_atomic_distances(large.clone())
+    filtered = model.filter_edges(graph, 3.5)
+    assert filtered[GraphKeys.Edge_idx].size(1) < large[GraphKeys.Edge_idx].size(1)
+    assert graph[GraphKeys.Edge_idx].size(1) == large[GraphKeys.Edge_idx].size(1)
+    # nothing is copied when no edge is dropped
+    assert model.filter_edges(graph, 5.0) is graph
+    if precompute_triplets:
+        # the reindexed triplets are those made from the remaining edges
+        expected = model.get_triplets(filtered.clone())
+        assert _triplet_set(filtered) == _triplet_set(expected)
+
+    energy, forces = model(large.clone())
+    expected_energy, expected_forces = model_nofilter(large.clone())
+    assert torch.allclose(energy, expected_energy, atol=1e-5)
+    assert torch.allclose(forces, expected_forces, atol=1e-5)
+    if not direct_forces:
+        # the same as the graphs converted with the cutoff radius of the model
+        small_energy, small_forces = model(small)
+        assert torch.allclose(energy, small_energy, atol=1e-5)
+        assert torch.allclose(forces, small_forces, atol=1e-5)
+
+
+def _triplet_set(graph) -> set[tuple[int, int, int]]:
+    idx_k = graph[GraphKeys.Idx_k_3b].tolist()
+    edge_idx_ks = graph[GraphKeys.Edge_idx_ks_3b].tolist()
+    edge_idx_st = graph[GraphKeys.Edge_idx_st_3b].tolist()
+    return set(zip(idx_k, edge_idx_ks, edge_idx_st))
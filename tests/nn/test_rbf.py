@@ -3,10 +3,19 @@ from __future__ import annotations
 import numpy as np
 import pytest
 import torch
+from scipy.integrate import quad
+from scipy.special import factorial, genlaguerre
 
+from lcaonet.atomistic.exponent import EXPONENT_TABLE
 from lcaonet.atomistic.info import ElecInfo
 from lcaonet.nn.cutoff import EnvelopeCutoff
-from lcaonet.nn.rbf import HydrogenRadialBasis
+from lcaonet.nn.rbf import (
+    HydrogenRadialBasis,
+    SlaterRadialBasis,
+    SphericalBesselRadialBasis,
+    TabulatedRadialBasis,
+)
+from lcaonet.utils.resolve import rbf_resolver
 
 param_HydrogenRadialBasis = [
     (1.0, 12, None, 1),
@@ -64,7 +73,9 @@ def test_HydrogenRadialBasis(
     rbf = HydrogenRadialBasis(cutoff, ei, cn)
     rb = rbf(r)
 
-    assert rb.size() == (n_edge, ei.n_orb)
+    assert rb.size() == (n_edge, ei.n_orb_unique)
+    # the copies of n_per_orb share the same basis
+    rb = rb[:, rbf.expand_idx]
 
     # check function
     r_numpy = r.numpy()
@@ -76,3 +87,116 @@ def test_HydrogenRadialBasis(
             continue
         rbf_numpy = func(r_numpy, rbf.bohr_radius) * cw
         assert torch.allclose(rb[:, i], torch.tensor(rbf_numpy), rtol=1e-5, atol=1e-7)
+
+
+@pytest.mark.parametrize("max_z, max_orb, n_per_orb", [(36, None, 1), (84, "6d", 2)])
+def test_HydrogenRadialBasis_laguerre(max_z: int, max_orb: str | None, n_per_orb: int):
+    # all orbitals including those not in `rbfs`
+    r = torch.linspace(0, 10, 200, dtype=torch.float64)
+    ei = ElecInfo(max_z, max_orb, None, n_per_orb)
+    cn = EnvelopeCutoff(10.0)
+    with torch.no_grad():
+        rbf = HydrogenRadialBasis(10.0, ei, cn).to(torch.float64)
+        rb = rbf(r)[:, rbf.expand_idx]
+
+    r_numpy = r.numpy()
+    cw = cn(r).numpy()
+    a0 = rbf.bohr_radius
+    for i, nl in enumerate(ei.nl_list):
+        nq, lq = nl[0].item(), nl[1].item()
+        zeta = 2 * r_numpy / nq / a0
+        norm = np.sqrt((2 / nq / a0) ** 3 * factorial(nq - lq - 1) / 2 / nq / factorial(nq + lq))
+        expected = norm * zeta**lq * np.exp(-zeta / 2) * genlaguerre(nq - lq - 1, 2 * lq + 1)(zeta) * cw
+        assert np.allclose(rb[:, i].numpy(), expected, rtol=1e-5, atol=1e-7)
+
+
+@pytest.mark.parametrize("cutoff", [2.0, 5.0])
+def test_HydrogenRadialBasis_integral_norm(cutoff: float):
+    ei = ElecInfo(36, None, None, 1)
+    rbf = HydrogenRadialBasis(cutoff, ei, EnvelopeCutoff(cutoff), integral_norm=True)
+
+    for i in range(ei.n_orb_unique):
+        inte = quad(lambda r: float((r * rbf(torch.tensor([r]))[0, i]) ** 2), 0.0, cutoff)[0]
+        assert inte == pytest.approx(1.0, rel=1e-4)
+
+
+@pytest.mark.parametrize("cutoff, n_per_orb", [(3.0, 1), (5.0, 2)])
+def test_SphericalBesselRadialBasis(cutoff: float, n_per_orb: int):
+    r = torch.linspace(0.1, cutoff, 100)
+    ei = ElecInfo(36, None, None, n_per_orb)
+    cn = EnvelopeCutoff(cutoff)
+    sbf = SphericalBesselRadialBasis(cutoff, ei, cn)
+    sbb = sbf(r)
+
+    assert sbb.size() == (100, ei.n_orb_unique)
+    sbb = sbb[:, sbf.expand_idx]
+    r_numpy = r.numpy()
+    cw = cn(r).numpy()
+    for i, nl in enumerate(ei.nl_list):
+        expected = cw * np.sin(np.pi * nl[0].item() * r_numpy / cutoff) / r_numpy
+        assert np.allclose(sbb[:, i].numpy(), expected, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("rbf_cls", [HydrogenRadialBasis, SphericalBesselRadialBasis, SlaterRadialBasis])
+@pytest.mark.parametrize("cutoff, n_per_orb, max_error", [(3.0, 1, 1e-6), (6.0, 2, 1e-4)])
+def test_TabulatedRadialBasis(rbf_cls: type, cutoff: float, n_per_orb: int, max_error: float):
+    ei = ElecInfo(36, None, None, n_per_orb)
+    rbf = rbf_cls(cutoff, ei, EnvelopeCutoff(cutoff)).to(torch.float64)
+    tab = rbf.tabulate(max_error)
+
+    assert isinstance(tab, TabulatedRadialBasis)
+    assert tab.error <= max_error
+    assert tab.state_dict().keys() == rbf.state_dict().keys()
+
+    tab = tab.to(torch.float64)
+    r = torch.linspace(0.05, cutoff * 1.2, 500, dtype=torch.float64, requires_grad=True)
+    rb, rb_tab = rbf(r), tab(r)
+    assert rb_tab.size() == (500, ei.n_orb_unique)
+    assert torch.allclose(rb_tab, rb, rtol=0.0, atol=max_error)
+    assert torch.all(rb_tab[r > cutoff] == 0.0)
+
+    # the derivatives for the forces, whose error is larger by the inverse of the grid spacing
+    grad = torch.autograd.grad(rb.sum(), r)[0]
+    grad_tab = torch.autograd.grad(rb_tab.sum(), r)[0]
+    assert torch.allclose(grad_tab, grad, rtol=0.0, atol=10 * max_error * rb.size(1) * tab.n_intervals / cutoff)
+
+
+def test_TabulatedRadialBasis_max_intervals():
+    rbf = HydrogenRadialBasis(6.0, ElecInfo(36, None, None, 1), EnvelopeCutoff(6.0))
+    with pytest.raises(ValueError):
+        rbf.tabulate(1e-8, max_intervals=16)
+    # the tabulated basis is made by `tabulate`, not by the name
+    with pytest.raises(ValueError):
+        rbf_resolver("tabulated", cutoff=6.0, elec_info=ElecInfo(36, None, None, 1), cutoff_net=EnvelopeCutoff(6.0))
+
+
+@pytest.mark.parametrize("max_z, max_orb, n_per_orb", [(12, None, 1), (36, None, 2), (36, "5p", 1), (86, None, 1)])
+def test_SlaterRadialBasis(max_z: int, max_orb: str | None, n_per_orb: int):
+    r = torch.linspace(0, 6, 200, dtype=torch.float64)
+    ei = ElecInfo(max_z, max_orb, None, n_per_orb)
+    cn = EnvelopeCutoff(6.0)
+    rbf = rbf_resolver("slater", cutoff=6.0, elec_info=ei, cutoff_net=cn)
+
+    assert isinstance(rbf, SlaterRadialBasis)
+    rb = rbf.to(torch.float64)(r)
+    assert rb.size() == (200, ei.n_orb_unique)
+
+    # the exponent of the lightest element which occupies the orbital
+    r_numpy = r.numpy()
+    cw = cn(r).numpy()
+    for i, nl in enumerate(ei.nl_list_unique):
+        n = nl[0].item()
+        z = np.nonzero(EXPONENT_TABLE[:, i].numpy())[0][0]
+        zeta = EXPONENT_TABLE[z, i].item() / rbf.bohr_radius
+        norm = (2 * zeta) ** n * np.sqrt(2 * zeta / factorial(2 * n))
+        expected = norm * r_numpy ** (n - 1) * np.exp(-zeta * r_numpy) * cw
+        assert np.allclose(rb[:, i].numpy(), expected, rtol=1e-5, atol=1e-7)
+
+        # normalized in all space
+        inte = quad(lambda x: (x * norm * x ** (n - 1) * np.exp(-zeta * x)) ** 2, 0.0, np.inf)[0]
+        assert inte == pytest.approx(1.0, rel=1e-6)
+
+
+def test_SlaterRadialBasis_max_orb():
+    with pytest.raises(ValueError):
+        SlaterRadialBasis(6.0, ElecInfo(36, "6d", None, 1), EnvelopeCutoff(6.0))
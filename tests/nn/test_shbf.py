@@ -37,7 +37,9 @@ def test_SphericalHarmonicsBasis(
     shbf = SphericalHarmonicsBasis(ei)
     shb = shbf(costheta)
 
-    assert shb.size() == (n_triplet, ei.n_orb)
+    assert shb.size() == (n_triplet, ei.n_orb_unique)
+    # the copies of n_per_orb share the same basis
+    shb = shb[:, shbf.expand_idx]
 
     # check with scipy function
     costheta_numpy = costheta.numpy()
@@ -45,3 +47,18 @@ def test_SphericalHarmonicsBasis(
         lq = ei.nl_list[i][1].item()
         shb_scipy = scipy.special.sph_harm(0, lq, 0, np.arccos(costheta_numpy)).astype(np.float64)
         assert torch.allclose(shb[:, i], torch.tensor(shb_scipy, dtype=torch.float32), rtol=1e-5, atol=1e-7)
+
+
+@pytest.mark.parametrize("max_z, max_orb, n_per_orb", [(1, None, 1), (36, None, 1), (84, "6d", 2)])
+def test_SphericalHarmonicsBasis_mul_radial(max_z: int, max_orb: str | None, n_per_orb: int):
+    n_edge, n_triplet = 20, 200
+    ei = ElecInfo(max_z, max_orb, None, n_per_orb)
+    costheta = torch.rand(n_triplet) * 2 - 1
+    rb = torch.rand(n_edge, ei.n_orb_unique)
+    edge_idx = torch.randint(n_edge, (n_triplet,))
+
+    shbf = SphericalHarmonicsBasis(ei)
+    orbs = shbf.mul_radial(rb, shbf.legendre(costheta), edge_idx)
+
+    assert orbs.size() == (n_triplet, ei.n_orb_unique)
+    assert torch.allclose(orbs, rb[edge_idx] * shbf(costheta))